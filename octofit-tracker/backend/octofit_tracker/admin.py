@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Team, Activity, Leaderboard, Workout
+from .models import User, Team, Activity, ActivityRollup, Leaderboard, Workout
 
 
 @admin.register(User)
@@ -25,6 +25,14 @@ class ActivityAdmin(admin.ModelAdmin):
     ordering = ('-date',)
 
 
+@admin.register(ActivityRollup)
+class ActivityRollupAdmin(admin.ModelAdmin):
+    list_display = ('user_email', 'day', 'activity_type', 'count', 'duration', 'calories')
+    list_filter = ('activity_type', 'day')
+    search_fields = ('user_email',)
+    ordering = ('-day',)
+
+
 @admin.register(Leaderboard)
 class LeaderboardAdmin(admin.ModelAdmin):
     list_display = ('rank', 'user_name', 'team', 'total_calories', 'total_activities', 'updated_at')
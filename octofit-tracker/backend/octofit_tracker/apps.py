@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class OctofitTrackerConfig(AppConfig):
+    name = 'octofit_tracker'
+    verbose_name = 'OctoFit Tracker'
+
+    def ready(self):
+        from . import instrumentation
+        instrumentation.install()
+        
+        # Connect the signal receivers that maintain derived collections
+        from . import signals  # noqa: F401
@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'octofit_tracker.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from octofit_tracker import live  # noqa: E402  (needs the apps loaded)
+
+
+async def application(scope, receive, send):
+    # The live leaderboard streams from async code. Django 4.1 cannot stream an
+    # async iterator from a StreamingHttpResponse (that arrives in 4.2), so the
+    # SSE path is served by a raw ASGI handler and never reaches Django.
+    if scope['type'] == 'http' and scope['path'] == live.PATH:
+        return await live.leaderboard_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
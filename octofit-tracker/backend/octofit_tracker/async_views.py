@@ -0,0 +1,215 @@
+"""
+Native async versions of the hottest read endpoints, served under /api/async/.
+
+Under ASGI Django runs synchronous views one at a time in a single shared
+thread (``sync_to_async(thread_sensitive=True)``), so every djongo query of
+a sync view holds up all the others. These views await their queries
+instead, so one worker serves many requests at once, and they accept the
+same query parameters as their sync counterparts and return the same JSON;
+cursors work on either path.
+
+Queries go through one shared pymongo client on a dedicated thread pool,
+which is how motor works too: motor 2.x (the last release for pymongo 3,
+which djongo needs) does not import on Python 3.11, and motor 3 requires
+pymongo 4. ``ASYNC_MONGO_WORKERS`` sizes the pool and the client's
+connection pool, i.e. how many queries can be in flight per process.
+
+DRF request handling is synchronous, so these are plain Django async
+views; they skip the sync API's response cache and ETags. Writes stay on
+the sync API, whose signals keep the derived collections read here current.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.utils import timezone
+from pymongo import MongoClient
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+
+from . import instrumentation, profiles, windows
+from .models import Activity, ActivityProfile, Leaderboard, LeaderboardWindow, WindowedLeaderboard, Workout
+from .pagination import ActivityPagination, KeysetPagination, LeaderboardPagination
+from .serializers import (
+    ActivitySerializer,
+    LeaderboardSerializer,
+    WindowedLeaderboardSerializer,
+    WorkoutSerializer,
+    FastReadSerializer
+)
+
+_client = None
+_executor = None
+_lock = threading.Lock()
+
+
+def _workers():
+    return getattr(settings, 'ASYNC_MONGO_WORKERS', 32)
+
+
+def get_client():
+    """The process-wide client of the async views, created on first use from the database settings"""
+    global _client
+    with _lock:
+        if _client is None:
+            options = connections['default'].settings_dict.get('CLIENT', {})
+            _client = MongoClient(**{
+                'maxPoolSize': _workers(),
+                **{key: value for key, value in options.items() if key != 'name'},
+            })
+    return _client
+
+
+def collection(model):
+    """Collection of a model, in the database djongo is using (a test database in tests)"""
+    return get_client()[connections['default'].settings_dict['NAME']][model._meta.db_table]
+
+
+async def run(function, *args, **kwargs):
+    """Await a blocking pymongo call on the query thread pool"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_workers(), thread_name_prefix='octofit-mongo')
+    # In the caller's context, so the request's instrumentation sees the query
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        _executor, partial(context.run, function, *args, **kwargs)
+    )
+
+
+async def find(model, mongo_filter, projection=None, **options):
+    """All documents of a find, fetched on the query thread pool"""
+    documents = collection(model)
+    return await run(lambda: list(documents.find(mongo_filter, projection, **options)))
+
+
+async def find_one(model, mongo_filter, projection=None, **options):
+    return await run(collection(model).find_one, mongo_filter, projection, **options)
+
+
+def get_only(view):
+    """require_GET for async views (Django's decorator only wraps sync ones)"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _json(data, status=200):
+    # DRF's renderer, so the bytes match the sync endpoints
+    with instrumentation.span('serialize'):
+        content = JSONRenderer().render(data)
+    return HttpResponse(content, content_type='application/json', status=status)
+
+
+def _error(message, status=400):
+    return _json({"error": message}, status=status)
+
+
+def _projection(serializer_class, fields, extra=()):
+    names = FastReadSerializer.source_fields(serializer_class, fields)
+    return {name: 1 for name in [*names, *extra]}
+
+
+async def _board(request):
+    """Async counterpart of LeaderboardViewSet.board"""
+    window = request.GET.get('window', 'all')
+    if window == 'all':
+        return Leaderboard, {}, LeaderboardSerializer
+    if window not in windows.WINDOWS:
+        raise ValueError(f"window must be one of: all, {', '.join(windows.WINDOWS)}")
+    start = windows.period_start(window, timezone.now())
+    scope = {'window': window, 'period_start': start}
+    if await find_one(LeaderboardWindow, scope, {'_id': 1}) is None:
+        # First request of a period; later ones only read
+        await sync_to_async(windows.ensure_built)(window, start)
+    return WindowedLeaderboard, scope, WindowedLeaderboardSerializer
+
+
+async def _keyset_page(request, model, pagination_class, mongo_filter, serializer_class):
+    """One keyset page of a MongoDB filter, shaped like PaginatedModelViewSet.paginated_response"""
+    try:
+        fields = FastReadSerializer.parse_fields(serializer_class, request.GET.get('fields'))
+    except ValueError as error:
+        return _error(str(error))
+    paginator = pagination_class()
+    try:
+        position, ordering = paginator.begin_page(request, model)
+    except NotFound as error:
+        return _json({'detail': error.detail}, status=404)
+    if position is not None:
+        mongo_filter = {'$and': [mongo_filter, paginator.mongo_after(position, ordering)]}
+    names = [field.lstrip('-') for field in paginator.ordering]
+    rows = await find(
+        model,
+        mongo_filter,
+        _projection(serializer_class, fields, names),
+        sort=paginator.mongo_sort(ordering),
+        limit=paginator.page_size + 1,
+    )
+    page = paginator.end_page(rows, position)
+    return _json(paginator.get_paginated_data(
+        FastReadSerializer(serializer_class, page, many=True, fields=fields).data
+    ))
+
+
+@get_only
+async def leaderboard_top(request):
+    """Get top N users from leaderboard"""
+    try:
+        model, scope, serializer_class = await _board(request)
+    except ValueError as error:
+        return _error(str(error))
+    try:
+        limit = int(request.GET.get('limit', 10))
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return _error("limit must be a positive integer")
+    try:
+        fields = FastReadSerializer.parse_fields(serializer_class, request.GET.get('fields'))
+    except ValueError as error:
+        return _error(str(error))
+    rows = await find(
+        model,
+        scope,
+        _projection(serializer_class, fields),
+        sort=[('rank', 1), ('user_email', 1)],
+        limit=min(limit, LeaderboardPagination.max_page_size),
+    )
+    return _json(FastReadSerializer(serializer_class, rows, many=True, fields=fields).data)
+
+
+@get_only
+async def activities_by_user(request):
+    """Get activities for a specific user by email"""
+    email = request.GET.get('email', None)
+    if not email:
+        return _error("Email parameter is required")
+    return await _keyset_page(
+        request, Activity, ActivityPagination, {'user_email': email}, ActivitySerializer
+    )
+
+
+@get_only
+async def workouts_recommended(request):
+    """Get workout recommendations based on user's activity history"""
+    email = request.GET.get('email', None)
+    if not email:
+        return _error("Email parameter is required")
+    profile = await find_one(ActivityProfile, {'user_email': email}, {'type_counts': 1})
+    favorite_type = profiles.favorite_type(profile)
+    if favorite_type is not None:
+        mongo_filter = {'activity_type': favorite_type}
+    else:
+        mongo_filter = {'difficulty': 'Easy'}
+    return await _keyset_page(request, Workout, KeysetPagination, mongo_filter, WorkoutSerializer)
@@ -0,0 +1,113 @@
+"""
+Helpers shared by the benchmark management commands.
+"""
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import quote
+
+from django.db import connection
+from django.urls import reverse
+
+from . import indexes
+from .instrumentation import count_mongo_commands
+
+# Checked-in query budgets and reference timings of bench_endpoints
+BASELINE_PATH = Path(__file__).with_name('bench_baseline.json')
+
+# populate_db options of the bench_endpoints datasets
+DATASETS = {
+    'small': {'users': 200, 'teams': 12, 'activities_per_user': 20},
+    'medium': {'users': 2000, 'teams': 24, 'activities_per_user': 50},
+    'large': {'users': 20000, 'teams': 48, 'activities_per_user': 100},
+}
+
+
+@contextmanager
+def scratch_database(keep=False):
+    """
+    Run the block against a freshly created test database.
+
+    Benchmarks seed and wipe collections freely, so they never touch the
+    configured database. The scratch database is dropped afterwards unless
+    ``keep`` is set.
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    # A recreated database has lost the indexes ensured in an earlier run
+    indexes.forget()
+    try:
+        yield connection.settings_dict['NAME']
+    finally:
+        if not keep:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def timer(results, name):
+    """Store the wall time of the block, in seconds, under ``results[name]``"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        results[name] = time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def endpoint_requests(email, team_id, team_name):
+    """
+    ``(name, method, path)`` of every benchmarked endpoint.
+
+    ``email``, ``team_id`` and ``team_name`` pick the user and team the
+    per-user and per-team endpoints are asked about.
+    """
+    return [
+        ('users.list', 'get', reverse('user-list')),
+        ('teams.list', 'get', reverse('team-list')),
+        ('teams.stats', 'get', reverse('team-stats', args=[team_id])),
+        ('activities.list', 'get', reverse('activity-list')),
+        ('activities.by_user', 'get', f"{reverse('activity-by-user')}?email={quote(email)}"),
+        ('activities.by_type', 'get', f"{reverse('activity-by-type')}?type=Running"),
+        ('leaderboard.top', 'get', f"{reverse('leaderboard-top')}?limit=10"),
+        ('leaderboard.refresh', 'post', reverse('leaderboard-refresh')),
+        ('workouts.recommended', 'get', f"{reverse('workout-recommended')}?email={quote(email)}"),
+        ('workouts.recommended_for_team', 'get',
+         f"{reverse('workout-recommended-for-team')}?team={quote(team_name)}"),
+    ]
+
+
+def measure(client, method, path, repeat=1):
+    """
+    Send the same request ``repeat`` times with a test client.
+
+    Returns the latencies in seconds and the largest number of MongoDB
+    commands one request issued; raises AssertionError on an error response.
+    """
+    latencies = []
+    queries = 0
+    for _ in range(repeat):
+        with count_mongo_commands() as commands:
+            start = time.perf_counter()
+            response = getattr(client, method)(path)
+            latencies.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            raise AssertionError(f'{method.upper()} {path} returned {response.status_code}')
+        queries = max(queries, len(commands))
+    return latencies, queries
+
+
+def load_baseline():
+    with open(BASELINE_PATH) as baseline:
+        return json.load(baseline)
+
+
+def save_baseline(baseline):
+    with open(BASELINE_PATH, 'w') as output:
+        json.dump(baseline, output, indent=2, sort_keys=True)
+        output.write('\n')
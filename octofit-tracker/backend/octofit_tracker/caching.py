@@ -0,0 +1,140 @@
+"""
+Versioned response cache for read-heavy endpoints.
+
+Every collection has a version counter in the cache that is bumped on each
+write to it (model signals for ORM writes, explicit bumps for raw MongoDB
+writes). Cached responses are keyed by endpoint, query parameters and the
+versions of the collections they read, so a write invalidates exactly the
+responses that depend on it and nothing has to be deleted.
+
+Any Django cache backend works; with the local-memory backend the versions
+are per process, so multi-process deployments should point
+``RESPONSE_CACHE_ALIAS`` at a shared backend (Redis, Memcached, ...).
+"""
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+_lock = threading.Lock()
+_counters = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+
+def _cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def _collection(model_or_name):
+    return getattr(getattr(model_or_name, '_meta', None), 'db_table', model_or_name)
+
+
+def _version_key(collection):
+    return f'octofit:version:{collection}'
+
+
+def _fresh_version():
+    # Seed from the clock so a counter evicted from the cache never
+    # restarts at a value that older cached responses were keyed with
+    return time.time_ns()
+
+
+def get_versions(collections):
+    """Current version of each collection, initialising missing counters"""
+    cache = _cache()
+    keys = {_version_key(_collection(collection)): collection for collection in collections}
+    versions = cache.get_many(list(keys))
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _fresh_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in sorted(keys)]
+
+
+def bump_version(model_or_name):
+    """Invalidate every cached response that read this collection"""
+    cache = _cache()
+    key = _version_key(_collection(model_or_name))
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _fresh_version(), timeout=None)
+
+
+def response_key(request, label, collections, variant=''):
+    """
+    Cache key for a GET request against the given collections.
+
+    ``variant`` separates responses that differ for reasons other than the
+    request and the data, e.g. the current period of a time window.
+    """
+    params = sorted(request.query_params.lists())
+    raw = f'{label}|{variant}|{request.get_host()}|{request.path}|{params}|{get_versions(collections)}'
+    return 'octofit:response:' + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def etag_for(request, label, collections, variant=''):
+    """
+    Strong ETag for a GET request against the given collections.
+
+    Built from the collection versions instead of the response body, so it
+    can be checked before any query runs.
+    """
+    params = sorted(request.query_params.lists())
+    accept = request.META.get('HTTP_ACCEPT', '')
+    raw = f'{label}|{variant}|{request.get_host()}|{request.path}|{params}|{accept}|{get_versions(collections)}'
+    return '"%s"' % hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _record(label, outcome):
+    with _lock:
+        _counters[label][outcome] += 1
+
+
+def stats():
+    """Hit/miss counters of this process, per endpoint and in total"""
+    with _lock:
+        endpoints = {label: dict(counts) for label, counts in _counters.items()}
+    return {
+        'hits': sum(counts['hits'] for counts in endpoints.values()),
+        'misses': sum(counts['misses'] for counts in endpoints.values()),
+        'endpoints': endpoints,
+    }
+
+
+def reset_stats():
+    with _lock:
+        _counters.clear()
+
+
+def cached_response(*collections):
+    """
+    Cache a viewset method's successful response data.
+
+    ``collections`` are the models (or collection names) the response is
+    built from; a write to any of them makes the cached data unreachable.
+    The viewset's ``cache_variant(request)``, if it has one, is part of the key.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            label = f'{self.basename}-{self.action}'
+            variant = self.cache_variant(request) if hasattr(self, 'cache_variant') else ''
+            key = response_key(request, label, collections, variant)
+            cache = _cache()
+            data = cache.get(key)
+            if data is not None:
+                _record(label, 'hits')
+                return Response(data)
+            _record(label, 'misses')
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+                cache.set(key, response.data, timeout)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,138 @@
+"""
+Deterministic synthetic datasets for load tests and benchmarks.
+
+Users are split into chunks of ``USERS_PER_CHUNK`` and each chunk is
+generated from its own random stream, seeded from the dataset seed and the
+chunk number. Chunks can therefore be generated and inserted by separate
+processes in any order, and the same options always produce the same
+documents, ``_id`` values included. Activity dates are counted back from a
+fixed ``end`` day rather than the clock, so a dataset can be reproduced on
+another day too.
+
+Only pymongo is used here, so spawned worker processes can import this
+module without setting Django up. Inserts bypass the signals; rebuild the
+derived collections afterwards (see ``manage.py populate_db``).
+"""
+import random
+import struct
+from datetime import timedelta, timezone
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+ACTIVITY_TYPES = ['Running', 'Cycling', 'Swimming', 'Weightlifting', 'Yoga', 'Boxing', 'HIIT']
+FIRST_NAMES = [
+    'Ada', 'Ben', 'Chloe', 'Dev', 'Elena', 'Femi', 'Grace', 'Hiro', 'Isla', 'Jonas',
+    'Kai', 'Lena', 'Mateo', 'Nia', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sam', 'Tariq',
+]
+LAST_NAMES = [
+    'Adams', 'Brooks', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Haddad', 'Ito', 'Jensen',
+    'Kowalski', 'Lopez', 'Müller', 'Nakamura', 'Okafor', 'Patel', 'Rossi', 'Silva', 'Tanaka', 'Novak',
+]
+USERS_PER_CHUNK = 1000
+
+# Document kinds in the generated ObjectIds
+TEAM, USER, ACTIVITY = range(3)
+
+_client = None
+
+
+def object_id(end, kind, index):
+    """ObjectId built from the end day, a document kind and the document's number"""
+    seconds = int(end.replace(tzinfo=timezone.utc).timestamp())
+    return ObjectId(struct.pack('>IB', seconds, kind) + index.to_bytes(7, 'big'))
+
+
+def team_name(index):
+    return f'Team {index + 1}'
+
+
+def email(index):
+    return f'user{index}@octofit.test'
+
+
+def chunk_count(spec):
+    return -(-spec['users'] // USERS_PER_CHUNK)
+
+
+def teams(spec):
+    """Team documents of a dataset"""
+    return [
+        {
+            '_id': object_id(spec['end'], TEAM, index),
+            'name': team_name(index),
+            'description': f'Synthetic team {index + 1} of {spec["teams"]}',
+            'created_at': spec['end'],
+        }
+        for index in range(spec['teams'])
+    ]
+
+
+def generate_chunk(spec, chunk):
+    """
+    User and activity documents of one chunk.
+
+    ``spec`` holds users, teams, activities_per_user, days, seed and end
+    (a naive UTC midnight); activities fall in the ``days`` days before it.
+    Every user has a favorite activity type (about half of their
+    activities) and a personal intensity, so profiles and recommendations
+    are not uniform.
+    """
+    rng = random.Random(spec['seed'] * 1_000_003 + chunk)
+    end, per_user = spec['end'], spec['activities_per_user']
+    first = chunk * USERS_PER_CHUNK
+    users, activities = [], []
+    for index in range(first, min(first + USERS_PER_CHUNK, spec['users'])):
+        user_email = email(index)
+        user_id = object_id(end, USER, index)
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        team = rng.randrange(spec['teams'])
+        users.append({
+            '_id': user_id,
+            'name': name,
+            'email': user_email,
+            'team': team_name(team),
+            'created_at': end,
+        })
+        favorite = rng.choice(ACTIVITY_TYPES)
+        intensity = rng.randint(5, 12)
+        for number in range(per_user):
+            duration = rng.randint(20, 120)
+            activities.append({
+                '_id': object_id(end, ACTIVITY, index * per_user + number),
+                'user_email': user_email,
+                # Owner ids, as owners.stamp would set them
+                'user_id': user_id,
+                'team_id': object_id(end, TEAM, team),
+                'activity_type': favorite if rng.random() < 0.5 else rng.choice(ACTIVITY_TYPES),
+                'duration': duration,
+                'calories': duration * max(1, intensity + rng.randint(-2, 2)),
+                'date': end - timedelta(seconds=rng.randrange(spec['days'] * 86400)),
+                'created_at': end,
+            })
+    return users, activities
+
+
+def _database(spec):
+    # One client per process, reused by every chunk it inserts
+    global _client
+    if _client is None:
+        _client = MongoClient(**spec['client'])
+    return _client[spec['database']]
+
+
+def insert_chunk(spec, chunk):
+    """
+    Generate one chunk and bulk insert it in batches of ``spec['batch_size']``.
+
+    ``spec`` also names the database, its client options and the users
+    and activities collections. Returns the numbers of users and activities inserted.
+    """
+    users, activities = generate_chunk(spec, chunk)
+    database = _database(spec)
+    database[spec['collections']['users']].insert_many(users, ordered=False)
+    for start in range(0, len(activities), spec['batch_size']):
+        database[spec['collections']['activities']].insert_many(
+            activities[start:start + spec['batch_size']], ordered=False
+        )
+    return len(users), len(activities)
@@ -0,0 +1,269 @@
+"""
+Write-behind pipeline from activity writes to the derived collections.
+
+Every activity write appends an ``ActivityEvent`` (an outbox) holding the
+activity's values before and after the write. Consumers claim pending
+events in batches under a lease, fold a batch into one set of deltas,
+apply them to the leaderboards, the daily rollups (team stats) and the
+profiles (recommendations), and only then mark the events processed.
+
+Delivery is at-least-once, but each batch is applied once. A claim stamps
+the batch's id on its events. A batch that fails partway, or whose consumer
+dies and lets the lease expire, is claimed again whole under the same id
+before any new batch. Every derived row records the batch that last
+updated it (``rollups.unapplied``), so the retry skips the rows the failed
+attempt already reached. A failure between a board row's update and its
+rank shifts still leaves ranks for ``leaderboard.rebuild``. Events are also
+appended after the activity write rather than atomically with it. A
+backfill (``manage.py process_activity_events --backfill``) repairs either
+case: it settles the pending events and rebuilds everything from the
+activities collection.
+
+Consumers take turns: each batch is claimed, applied and marked holding
+the ``CONSUMER_LOCK`` lock (see ``locks``), so batches are applied one at a
+time across processes, and the leaderboards see a single writer. A batch
+is applied rollups first, all under ``leaderboard.LOCK``, which the board
+rebuilds (all-time and windowed, built from the rollups) hold too, so a
+rebuild never runs between a batch's rollups and its board deltas. A
+rebuild that follows a batch which failed partway first completes the
+batch's rollups (``rollups.catch_up``) and marks its rows as updated by
+the batch, so the retry does not add it again.
+
+With ``ACTIVITY_EVENTS_EAGER``, or inside ``inline``, each write's events
+are applied before it returns. Otherwise, with ``ACTIVITY_EVENTS_FOLLOW``,
+a background thread per process drains them right after each write, and
+also polls every ``ACTIVITY_EVENTS_POLL_SECONDS`` for events that other or
+dead processes left behind. ``manage.py process_activity_events --follow``
+runs the same consumer as its own process. Processed events expire after a
+week.
+"""
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import caching, indexes, leaderboard, locks, profiles, rollups, windows
+from .models import ActivityEvent, LeaderboardWindow, WindowedLeaderboard
+
+logger = logging.getLogger(__name__)
+
+# Held while a batch is claimed, applied and marked
+CONSUMER_LOCK = 'activity-events'
+
+_wakeup = threading.Event()
+_consumer = None
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def _setting(name, default):
+    return getattr(settings, f'ACTIVITY_EVENTS_{name}', default)
+
+
+def apply(events, batch=None):
+    """
+    Apply a batch of events to the leaderboards, rollups and profiles, folded into one set of deltas.
+
+    Rows already updated by ``batch`` (an earlier attempt at it) are skipped.
+    """
+    totals = {}
+    deltas = {}
+    for event in events:
+        for values, sign in ((event['old'], -1), (event['new'], 1)):
+            if not values:
+                continue
+            calories, activities = totals.get(values['user_email'], (0, 0))
+            totals[values['user_email']] = (calories + sign * values['calories'], activities + sign)
+            rollups.fold([values], sign=sign, deltas=deltas)
+    # Rebuilds read the rollups holding leaderboard.LOCK, so they see the
+    # batch in the rollups only once it is on the boards too
+    with locks.hold(leaderboard.LOCK):
+        rollups.apply_deltas(deltas, batch)
+        leaderboard.apply_deltas(totals, batch)
+        windows.apply_deltas(deltas, batch)
+        profiles.apply_deltas(deltas, batch)
+
+
+def _lease():
+    return timedelta(seconds=_setting('LEASE_SECONDS', 60))
+
+
+@contextmanager
+def inline():
+    """Apply the events of activity writes in the block before each write returns, in this thread"""
+    previous = getattr(_local, 'inline', False)
+    _local.inline = True
+    try:
+        yield
+    finally:
+        _local.inline = previous
+
+
+def publish(changes):
+    """
+    Append events for activity writes and get them applied.
+
+    ``changes`` are ``(activity_id, old, new)`` triples with the activity's
+    values (see ``signals.ACTIVITY_FIELDS``) before and after the write;
+    ``old`` is None for a create and ``new`` for a delete.
+    """
+    now = timezone.now()
+    events = [
+        {
+            'activity_id': str(activity_id) if activity_id else None,
+            'old': old,
+            'new': new,
+            'created_at': now,
+            'processed_at': None,
+            'batch': None,
+            'lease_until': None,
+            'attempts': 0,
+        }
+        for activity_id, old, new in changes
+    ]
+    if not events:
+        return
+    # Processed events are dropped by TTL
+    indexes.ensure(ActivityEvent, 'octofit_events_expiry')
+    ActivityEvent.objects.mongo_insert_many(events)
+    if getattr(_local, 'inline', False) or _setting('EAGER', False):
+        drain()
+    else:
+        _notify()
+
+
+def _lease_free(now):
+    return {'$or': [{'lease_until': None}, {'lease_until': {'$lt': now}}]}
+
+
+def claim(batch_size):
+    """
+    Lease the next batch of events; returns its id and events, or ``(None, [])``.
+
+    An unfinished batch is handed out again whole once its lease is free,
+    and nothing else is handed out before it: a row's ``applied_batch`` only
+    tells a retry apart while no later batch has touched the row. Only when
+    there is none do up to ``batch_size`` of the oldest new events form a
+    new batch.
+    """
+    now = timezone.now()
+    unfinished = ActivityEvent.objects.mongo_find_one(
+        {'processed_at': None, 'batch': {'$ne': None}}, {'batch': 1, 'lease_until': 1}, sort=[('_id', 1)]
+    )
+    if unfinished is not None:
+        lease_until = unfinished.get('lease_until')
+        if lease_until is not None and lease_until.replace(tzinfo=dt_timezone.utc) >= now:
+            return None, []
+        batch = unfinished['batch']
+        selected = {'batch': batch}
+    else:
+        ids = [
+            event['_id'] for event in ActivityEvent.objects.mongo_find(
+                {'processed_at': None, 'batch': None}, {'_id': 1}, sort=[('_id', 1)], limit=batch_size
+            )
+        ]
+        if not ids:
+            return None, []
+        batch = uuid.uuid4().hex
+        selected = {'_id': {'$in': ids}, 'batch': None}
+    # Claims run holding CONSUMER_LOCK (see drain), so no other consumer races for these events
+    ActivityEvent.objects.mongo_update_many(
+        {**selected, 'processed_at': None, **_lease_free(now)},
+        {'$set': {'batch': batch, 'lease_until': now + _lease()}, '$inc': {'attempts': 1}},
+    )
+    return batch, list(ActivityEvent.objects.mongo_find({'batch': batch, 'processed_at': None}, sort=[('_id', 1)]))
+
+
+def _mark_processed(ids):
+    ActivityEvent.objects.mongo_update_many(
+        {'_id': {'$in': ids}},
+        {'$set': {'processed_at': timezone.now(), 'lease_until': None}},
+    )
+
+
+def drain(batch_size=None, wait=None):
+    """
+    Apply pending events batch by batch until none are left; returns how many were applied.
+
+    Waits up to ``wait`` seconds for another consumer's batch (see
+    ``locks.hold``).
+    """
+    batch_size = batch_size or _setting('BATCH_SIZE', 500)
+    applied = 0
+    while True:
+        with locks.hold(CONSUMER_LOCK, wait=wait):
+            batch, events = claim(batch_size)
+            if not events:
+                return applied
+            try:
+                apply(events, batch)
+            except Exception:
+                # Free the lease so the next drain retries the batch rather than wait it out
+                ActivityEvent.objects.mongo_update_many({'batch': batch}, {'$set': {'lease_until': None}})
+                raise
+            _mark_processed([event['_id'] for event in events])
+        applied += len(events)
+
+
+def follow(stop=None, batch_size=None):
+    """Drain events whenever notified or every ACTIVITY_EVENTS_POLL_SECONDS, until ``stop`` is set"""
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            drain(batch_size, wait=0)
+        except locks.LockTimeout:
+            # Another consumer is applying a batch; it drains the rest too
+            pass
+        except Exception:
+            logger.exception('Applying activity events failed; retrying')
+        _wakeup.wait(_setting('POLL_SECONDS', 5))
+        _wakeup.clear()
+
+
+def _notify():
+    global _consumer
+    if not _setting('FOLLOW', True):
+        return
+    with _lock:
+        if _consumer is None:
+            _consumer = threading.Thread(target=follow, name='octofit-activity-events', daemon=True)
+            _consumer.start()
+    _wakeup.set()
+
+
+def status():
+    """Pending event count and the age in seconds of the oldest one (0 when none are pending)"""
+    pending = ActivityEvent.objects.mongo_count_documents({'processed_at': None})
+    oldest = ActivityEvent.objects.mongo_find_one({'processed_at': None}, sort=[('_id', 1)])
+    if oldest is None:
+        return {'pending': pending, 'lag_seconds': 0.0}
+    lag = timezone.now() - oldest['created_at'].replace(tzinfo=dt_timezone.utc)
+    return {'pending': pending, 'lag_seconds': round(lag.total_seconds(), 3)}
+
+
+def backfill():
+    """
+    Settle every pending event and rebuild the derived collections from the activities.
+
+    Run it with activity writes paused: a write landing during the rebuild
+    is counted by the rebuild and by its event. Windowed boards are dropped
+    and rebuild on their next read. Returns the rows rebuilt per collection.
+    """
+    settled = ActivityEvent.objects.mongo_update_many(
+        {'processed_at': None},
+        {'$set': {'processed_at': timezone.now(), 'lease_until': None}},
+    ).modified_count
+    counts = {
+        'settled_events': settled,
+        'rollups': rollups.rebuild(),
+        'profiles': profiles.rebuild(),
+        'leaderboard': leaderboard.rebuild(),
+    }
+    LeaderboardWindow.objects.mongo_delete_many({})
+    WindowedLeaderboard.objects.mongo_delete_many({})
+    caching.bump_version(WindowedLeaderboard)
+    return counts
@@ -0,0 +1,87 @@
+"""
+Streaming activity exports.
+
+Rows come from a server-side MongoDB cursor and are written out in small
+chunks, so memory use stays flat however many activities are exported.
+"""
+import csv
+from functools import partial
+from itertools import chain
+
+from django.utils import timezone
+
+from .models import Activity
+from .renderers import ndjson_line
+from .serializers import format_datetime
+
+EXPORT_FIELDS = ['_id', 'user_email', 'activity_type', 'duration', 'calories', 'date', 'created_at']
+CURSOR_BATCH_SIZE = 1000
+CHUNK_ROWS = 500
+
+
+def export_sort(mongo_filter):
+    """
+    Order of an export.
+
+    Filtered exports follow ``date`` (then ``_id``), the second key of the
+    user, team and type indexes and the first of the date index, which are
+    walked backwards instead of sorting the matches in memory.
+    """
+    if mongo_filter:
+        return [('date', 1), ('_id', 1)]
+    return [('_id', 1)]
+
+
+def export_rows(mongo_filter, fields=EXPORT_FIELDS):
+    """Yield activities matching the filter, shaped like ActivitySerializer output"""
+    cursor = Activity.objects.mongo_find(
+        mongo_filter,
+        {field: 1 for field in fields},
+        sort=export_sort(mongo_filter),
+        batch_size=CURSOR_BATCH_SIZE,
+    )
+    current_timezone = timezone.get_current_timezone()
+    converters = {
+        '_id': str,
+        'date': partial(format_datetime, current_timezone=current_timezone),
+        'created_at': partial(format_datetime, current_timezone=current_timezone),
+    }
+    plan = [(field, converters.get(field)) for field in fields]
+    try:
+        for doc in cursor:
+            row = {}
+            for field, converter in plan:
+                value = doc.get(field)
+                row[field] = converter(value) if converter is not None else value
+            yield row
+    finally:
+        cursor.close()
+
+
+def _chunked(lines):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= CHUNK_ROWS:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller"""
+
+    def write(self, value):
+        return value
+
+
+def stream_ndjson(rows):
+    return _chunked(ndjson_line(row) for row in rows)
+
+
+def stream_csv(rows, fields=EXPORT_FIELDS):
+    writer = csv.writer(_Echo())
+    header = writer.writerow(fields)
+    lines = (writer.writerow([row[field] for field in fields]) for row in rows)
+    return _chunked(chain([header], lines))
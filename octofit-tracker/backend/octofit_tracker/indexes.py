@@ -0,0 +1,284 @@
+"""
+MongoDB indexes for the hot query shapes.
+
+djongo ignores ``Meta.indexes`` (and drops sort directions), so the indexes
+are declared here and applied by ``manage.py ensure_indexes``. Managed index
+names start with ``octofit_``; indexes without that prefix (``_id_`` and the
+ones djongo creates for unique fields) are left alone. A spec's
+``expire_after_seconds`` makes it a TTL index and its ``partial_filter``
+limits it to the matching documents.
+
+Indexes that code depends on for correctness, such as the unique keys
+that upserts rely on and the TTLs that clean up after writers, are also
+created on first use through ``ensure``. A database without them still
+works before ``ensure_indexes`` has been run.
+"""
+from datetime import datetime
+
+from bson import ObjectId
+from django.db import connection
+from pymongo import ASCENDING, DESCENDING
+
+from .models import (
+    User, Team, Activity, ActivityRollup, ActivityProfile, Leaderboard, LeaderboardWindow, WindowedLeaderboard,
+    ActivityEvent, RefreshJob, Workout
+)
+
+MANAGED_PREFIX = 'octofit_'
+
+INDEXES = {
+    User: [
+        {'name': 'octofit_users_team', 'keys': [('team', ASCENDING), ('_id', ASCENDING)]},
+    ],
+    Activity: [
+        {'name': 'octofit_activities_date',
+         'keys': [('date', DESCENDING), ('_id', DESCENDING)]},
+        {'name': 'octofit_activities_user_date',
+         'keys': [('user_email', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)]},
+        {'name': 'octofit_activities_type_date',
+         'keys': [('activity_type', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)]},
+        {'name': 'octofit_activities_team_date',
+         'keys': [('team_id', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)]},
+    ],
+    ActivityRollup: [
+        {'name': 'octofit_rollups_user_day_type',
+         'keys': [('user_email', ASCENDING), ('day', ASCENDING), ('activity_type', ASCENDING)],
+         'unique': True},
+        {'name': 'octofit_rollups_day', 'keys': [('day', ASCENDING)]},
+        {'name': 'octofit_rollups_team_day', 'keys': [('team_id', ASCENDING), ('day', ASCENDING)]},
+    ],
+    ActivityProfile: [
+        {'name': 'octofit_profiles_email', 'keys': [('user_email', ASCENDING)], 'unique': True},
+    ],
+    Leaderboard: [
+        {'name': 'octofit_leaderboard_email', 'keys': [('user_email', ASCENDING)], 'unique': True},
+        {'name': 'octofit_leaderboard_rank', 'keys': [('rank', ASCENDING), ('user_email', ASCENDING)]},
+        {'name': 'octofit_leaderboard_team_rank',
+         'keys': [('team', ASCENDING), ('rank', ASCENDING), ('user_email', ASCENDING)]},
+        {'name': 'octofit_leaderboard_calories',
+         'keys': [('total_calories', DESCENDING), ('user_email', ASCENDING)]},
+        # Change marker of the live leaderboard (live.Hub.read_marker)
+        {'name': 'octofit_leaderboard_updated', 'keys': [('updated_at', DESCENDING)]},
+    ],
+    LeaderboardWindow: [
+        {'name': 'octofit_windows_period',
+         'keys': [('window', ASCENDING), ('period_start', ASCENDING)], 'unique': True},
+        {'name': 'octofit_windows_expiry', 'keys': [('expires_at', ASCENDING)], 'expire_after_seconds': 0},
+    ],
+    WindowedLeaderboard: [
+        # Also the $merge key of windows.rebuild_period, which requires it to be unique
+        {'name': 'octofit_windowed_email',
+         'keys': [('window', ASCENDING), ('period_start', ASCENDING), ('user_email', ASCENDING)],
+         'unique': True},
+        {'name': 'octofit_windowed_rank',
+         'keys': [('window', ASCENDING), ('period_start', ASCENDING), ('rank', ASCENDING),
+                  ('user_email', ASCENDING)]},
+        {'name': 'octofit_windowed_team_rank',
+         'keys': [('window', ASCENDING), ('period_start', ASCENDING), ('team', ASCENDING),
+                  ('rank', ASCENDING), ('user_email', ASCENDING)]},
+        {'name': 'octofit_windowed_calories',
+         'keys': [('window', ASCENDING), ('period_start', ASCENDING), ('total_calories', DESCENDING),
+                  ('user_email', ASCENDING)]},
+        {'name': 'octofit_windowed_user', 'keys': [('user_email', ASCENDING)]},
+        {'name': 'octofit_windowed_expiry', 'keys': [('expires_at', ASCENDING)], 'expire_after_seconds': 0},
+    ],
+    ActivityEvent: [
+        # Pending events oldest first (events.claim)
+        {'name': 'octofit_events_pending', 'keys': [('processed_at', ASCENDING), ('_id', ASCENDING)]},
+        {'name': 'octofit_events_expiry', 'keys': [('processed_at', ASCENDING)],
+         'expire_after_seconds': 7 * 24 * 3600},
+    ],
+    RefreshJob: [
+        # At most one queued or running job per kind; jobs.submit relies on it to coalesce
+        {'name': 'octofit_refresh_jobs_active', 'keys': [('kind', ASCENDING)], 'unique': True,
+         'partial_filter': {'active': True}},
+        {'name': 'octofit_refresh_jobs_expiry', 'keys': [('finished_at', ASCENDING)],
+         'expire_after_seconds': 7 * 24 * 3600},
+    ],
+    Workout: [
+        {'name': 'octofit_workouts_type', 'keys': [('activity_type', ASCENDING), ('_id', ASCENDING)]},
+        {'name': 'octofit_workouts_difficulty', 'keys': [('difficulty', ASCENDING), ('_id', ASCENDING)]},
+    ],
+    Team: [
+        # Team name -> id lookups of owners.team_ids
+        {'name': 'octofit_teams_name', 'keys': [('name', ASCENDING), ('_id', ASCENDING)]},
+    ],
+}
+
+_SAMPLE_EMAIL = 'explain@example.com'
+_SAMPLE_ID = ObjectId('000000000000000000000000')
+_WINDOW = {'window': 'week', 'period_start': datetime(2026, 1, 5)}
+
+# (label, model, filter, sort) for each query the viewsets issue
+QUERY_SHAPES = [
+    ('users.by_team', User, {'team': 'Team'}, [('_id', ASCENDING)]),
+    ('teams.members', User, {'team': 'Team'}, [('_id', ASCENDING)]),
+    ('teams.stats', Activity, {
+        'team_id': _SAMPLE_ID, 'date': {'$gte': datetime(2026, 1, 1, 12), '$lt': datetime(2026, 2, 1)},
+    }, None),
+    ('teams.stats.rollups', ActivityRollup, {
+        'team_id': _SAMPLE_ID, 'day': {'$gte': datetime(2026, 1, 1), '$lt': datetime(2026, 2, 1)},
+    }, None),
+    ('teams.by_name', Team, {'name': {'$in': ['Team']}}, [('_id', DESCENDING)]),
+    ('rollups.upsert', ActivityRollup,
+     {'user_email': _SAMPLE_EMAIL, 'day': datetime(2026, 1, 1), 'activity_type': 'Running'}, None),
+    ('activities.list', Activity, {}, [('date', DESCENDING), ('_id', DESCENDING)]),
+    ('activities.by_user', Activity, {'user_email': _SAMPLE_EMAIL},
+     [('date', DESCENDING), ('_id', DESCENDING)]),
+    ('activities.by_type', Activity, {'activity_type': 'Running'},
+     [('date', DESCENDING), ('_id', DESCENDING)]),
+    ('activities.export_by_user', Activity, {'user_email': _SAMPLE_EMAIL},
+     [('date', ASCENDING), ('_id', ASCENDING)]),
+    ('activities.export_by_team', Activity, {'team_id': _SAMPLE_ID, 'date': {'$gte': datetime(2026, 1, 1)}},
+     [('date', ASCENDING), ('_id', ASCENDING)]),
+    ('activities.export_by_user_team', Activity, {'user_email': _SAMPLE_EMAIL, 'team_id': _SAMPLE_ID},
+     [('date', ASCENDING), ('_id', ASCENDING)]),
+    ('activities.export_by_type', Activity, {'activity_type': 'Running'},
+     [('date', ASCENDING), ('_id', ASCENDING)]),
+    ('owners.restamp', Activity, {'user_email': _SAMPLE_EMAIL, '$or': [
+        {'user_id': {'$ne': _SAMPLE_ID}}, {'team_id': {'$ne': _SAMPLE_ID}},
+    ]}, None),
+    ('owners.team_members', Activity, {'team_id': _SAMPLE_ID}, None),
+    ('leaderboard.list', Leaderboard, {}, [('rank', ASCENDING), ('user_email', ASCENDING)]),
+    ('leaderboard.by_team', Leaderboard, {'team': 'Team'},
+     [('rank', ASCENDING), ('user_email', ASCENDING)]),
+    ('leaderboard.delta', Leaderboard, {'user_email': _SAMPLE_EMAIL}, None),
+    ('leaderboard.competition_rank', Leaderboard, {'total_calories': 100},
+     [('total_calories', DESCENDING), ('user_email', ASCENDING)]),
+    ('leaderboard.around', Leaderboard, {'rank': {'$gte': 10, '$lte': 20}},
+     [('rank', ASCENDING), ('user_email', ASCENDING)]),
+    ('leaderboard.dense_shift', Leaderboard, {
+        'user_email': {'$ne': _SAMPLE_EMAIL}, 'total_calories': {'$gte': 100, '$lt': 200},
+    }, None),
+    ('leaderboard.rank_shift', Leaderboard, {'$or': [
+        {'total_calories': {'$gt': 100}},
+        {'total_calories': 100, 'user_email': {'$lt': _SAMPLE_EMAIL}},
+    ]}, None),
+    ('leaderboard.window_top', WindowedLeaderboard, _WINDOW,
+     [('rank', ASCENDING), ('user_email', ASCENDING)]),
+    ('leaderboard.window_by_team', WindowedLeaderboard, {**_WINDOW, 'team': 'Team'},
+     [('rank', ASCENDING), ('user_email', ASCENDING)]),
+    ('leaderboard.window_delta', WindowedLeaderboard, {**_WINDOW, 'user_email': _SAMPLE_EMAIL}, None),
+    ('leaderboard.window_rank_shift', WindowedLeaderboard, {**_WINDOW, '$or': [
+        {'total_calories': {'$gt': 100}},
+        {'total_calories': 100, 'user_email': {'$lt': _SAMPLE_EMAIL}},
+    ]}, None),
+    ('leaderboard.window_user', WindowedLeaderboard, {'user_email': _SAMPLE_EMAIL}, None),
+    ('leaderboard.window_build', ActivityRollup,
+     {'day': {'$gte': datetime(2026, 1, 1), '$lt': datetime(2026, 2, 1)}}, None),
+    ('leaderboard.window_built', LeaderboardWindow,
+     {'window': 'week', 'period_start': datetime(2026, 1, 5)}, None),
+    ('workouts.by_type', Workout, {'activity_type': 'Running'}, [('_id', ASCENDING)]),
+    ('workouts.by_difficulty', Workout, {'difficulty': 'Easy'}, [('_id', ASCENDING)]),
+    ('workouts.recommended', ActivityProfile, {'user_email': _SAMPLE_EMAIL}, None),
+    ('workouts.recommended_for_team', ActivityProfile, {'user_email': {'$in': [_SAMPLE_EMAIL]}}, None),
+    ('workouts.recommended_for_team.candidates', Workout, {'$or': [
+        {'activity_type': {'$in': ['Running']}}, {'difficulty': 'Easy'},
+    ]}, None),
+]
+
+
+def _same_index(existing, spec):
+    return (
+        list(existing['key']) == [tuple(key) for key in spec['keys']]
+        and bool(existing.get('unique')) == bool(spec.get('unique'))
+        and existing.get('expireAfterSeconds') == spec.get('expire_after_seconds')
+        and existing.get('partialFilterExpression') == spec.get('partial_filter')
+    )
+
+
+def _options(spec):
+    options = {'name': spec['name'], 'unique': spec.get('unique', False)}
+    if 'expire_after_seconds' in spec:
+        options['expireAfterSeconds'] = spec['expire_after_seconds']
+    if 'partial_filter' in spec:
+        options['partialFilterExpression'] = spec['partial_filter']
+    return options
+
+
+# (database, collection, index names) already checked by ``ensure``
+_ensured = set()
+
+
+def ensure(model, *names):
+    """
+    Create the named managed indexes of a model unless they exist.
+
+    The collection is only checked the first time in each process, so
+    callers can run this before every write. Keys already indexed under
+    another name (e.g. by djongo) count as present, as in ``reconcile``.
+    """
+    key = (connection.settings_dict['NAME'], model._meta.db_table, names)
+    if key in _ensured:
+        return
+    existing = model.objects.mongo_index_information()
+    for spec in INDEXES[model]:
+        if spec['name'] not in names or spec['name'] in existing:
+            continue
+        if any(_same_index(index, spec) for index in existing.values()):
+            continue
+        model.objects.mongo_create_index(spec['keys'], **_options(spec))
+    _ensured.add(key)
+
+
+def forget():
+    """Make ``ensure`` check every collection again, e.g. after a database was recreated"""
+    _ensured.clear()
+
+
+def reconcile(model, dry_run=False):
+    """
+    Bring a collection's managed indexes in line with ``INDEXES``.
+
+    Returns a list of ``(action, index_name)`` pairs describing what was (or,
+    with ``dry_run``, would be) created, rebuilt or dropped.
+    """
+    specs = INDEXES.get(model, [])
+    existing = model.objects.mongo_index_information()
+    actions = []
+
+    for spec in specs:
+        current = existing.get(spec['name'])
+        if current is not None and _same_index(current, spec):
+            continue
+        if current is None and any(_same_index(index, spec) for index in existing.values()):
+            # Same keys already indexed under another name (e.g. by djongo)
+            continue
+        if current is not None:
+            actions.append(('rebuild', spec['name']))
+            if not dry_run:
+                model.objects.mongo_drop_index(spec['name'])
+        else:
+            actions.append(('create', spec['name']))
+        if not dry_run:
+            model.objects.mongo_create_index(spec['keys'], **_options(spec))
+
+    wanted = {spec['name'] for spec in specs}
+    for name in existing:
+        if name.startswith(MANAGED_PREFIX) and name not in wanted:
+            actions.append(('drop', name))
+            if not dry_run:
+                model.objects.mongo_drop_index(name)
+    return actions
+
+
+def plan_stages(plan):
+    """Every ``stage`` name appearing anywhere in an explain document"""
+    stages = []
+    if isinstance(plan, dict):
+        if isinstance(plan.get('stage'), str):
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+def explain(model, mongo_filter, sort=None):
+    """Stages of the winning plan for a find on the model's collection"""
+    cursor = model.objects.mongo_find(mongo_filter)
+    if sort:
+        cursor = cursor.sort(sort)
+    return plan_stages(cursor.explain().get('queryPlanner', {}).get('winningPlan', {}))
@@ -0,0 +1,99 @@
+"""
+Visibility into the MongoDB commands issued by this process.
+
+A pymongo command listener is registered when the app is ready (before
+djongo opens its client) and reports every command to the recorders that
+are active on the calling thread, and the count and duration of every
+command to the request being recorded in the calling context (see
+``record_request``; the middleware records each request).
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+_local = threading.local()
+# Context, not thread, so that sync views under ASGI (sync_to_async copies
+# the context) and the async views' query threads report to their request
+_request = ContextVar('octofit_request_stats', default=None)
+
+
+def _recorders():
+    if not hasattr(_local, 'recorders'):
+        _local.recorders = []
+    return _local.recorders
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Forward command names to the recorders active on this thread"""
+
+    def started(self, event):
+        for recorder in _recorders():
+            recorder.append(event.command_name)
+
+    def succeeded(self, event):
+        _record_duration(event)
+
+    def failed(self, event):
+        _record_duration(event)
+
+
+def _record_duration(event):
+    stats = _request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += event.duration_micros / 1e6
+
+
+class RequestStats:
+    """MongoDB commands and named spans (wall time, in seconds) of one request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.spans = defaultdict(float)
+
+
+def install():
+    """Register the listener; only clients created afterwards report to it"""
+    monitoring.register(MongoCommandListener())
+
+
+@contextmanager
+def count_mongo_commands():
+    """Collect the names of the MongoDB commands issued inside the block"""
+    commands = []
+    recorders = _recorders()
+    recorders.append(commands)
+    try:
+        yield commands
+    finally:
+        recorders.remove(commands)
+
+
+@contextmanager
+def record_request():
+    """Collect the commands and spans of the block (and of code it hands its context to)"""
+    stats = RequestStats()
+    token = _request.set(stats)
+    try:
+        yield stats
+    finally:
+        _request.reset(token)
+
+
+@contextmanager
+def span(name):
+    """Add the wall time of the block to the ``name`` span of the request being recorded"""
+    stats = _request.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.spans[name] += time.perf_counter() - start
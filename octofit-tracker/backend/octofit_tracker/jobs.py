@@ -0,0 +1,161 @@
+"""
+Background rebuild jobs with progress, for work too slow to do in a request.
+
+A job is a ``RefreshJob`` document that runs a kind's stages one after the
+other on a small per-process thread pool, recording the current stage and
+the stages done so clients can poll it. Jobs of one kind coalesce: while
+one is queued or running, further submissions join it rather than start
+another. The unique partial index ``octofit_refresh_jobs_active`` makes
+that hold across processes too.
+
+A job whose process died stops updating ``updated_at``. It is given up
+after ``JOB_STALE_AFTER`` seconds, so it no longer blocks new jobs.
+Finished jobs are dropped by a TTL index after a week. Like other raw
+writes, job writes bump the ``RefreshJob`` cache version, which the status
+endpoint's ETags are derived from.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from . import caching, indexes, leaderboard, windows
+from .models import RefreshJob
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_futures = set()
+_lock = threading.Lock()
+
+
+def _rebuild_window(window, when):
+    windows.rebuild_period(window, windows.period_start(window, when))
+
+
+def leaderboard_stages():
+    """The all-time board, then the current period of every time window"""
+    now = timezone.now()
+    return [('leaderboard', leaderboard.rebuild)] + [
+        (f'{window} window', partial(_rebuild_window, window, now)) for window in windows.WINDOWS
+    ]
+
+
+# kind -> function returning the job's (stage name, callable) pairs
+KINDS = {
+    'leaderboard': leaderboard_stages,
+}
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'JOB_WORKERS', 2), thread_name_prefix='octofit-job'
+            )
+    return _executor
+
+
+def _abandon_stale(kind, now):
+    stale_after = timedelta(seconds=getattr(settings, 'JOB_STALE_AFTER', 600))
+    abandoned = RefreshJob.objects.mongo_update_many(
+        {'kind': kind, 'active': True, 'updated_at': {'$lt': now - stale_after}},
+        {'$set': {
+            'status': 'failed', 'active': False, 'error': 'Abandoned: no progress reported',
+            'finished_at': now, 'updated_at': now,
+        }},
+    )
+    if abandoned.modified_count:
+        caching.bump_version(RefreshJob)
+
+
+def submit(kind):
+    """
+    Queue a job of ``kind``, or join the one already queued or running.
+
+    Returns the job document and whether this call created it.
+    """
+    if kind not in KINDS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    # Coalescing relies on the unique active index; finished jobs expire by TTL
+    indexes.ensure(RefreshJob, 'octofit_refresh_jobs_active', 'octofit_refresh_jobs_expiry')
+    while True:
+        now = timezone.now()
+        _abandon_stale(kind, now)
+        job = {
+            'kind': kind, 'status': 'queued', 'active': True, 'requests': 1, 'stage': None,
+            'stages_done': 0, 'stages_total': None, 'result': {}, 'error': None,
+            'requested_at': now, 'started_at': None, 'finished_at': None, 'updated_at': now,
+        }
+        try:
+            RefreshJob.objects.mongo_insert_one(job)
+        except DuplicateKeyError:
+            joined = RefreshJob.objects.mongo_find_one_and_update(
+                {'kind': kind, 'active': True}, {'$inc': {'requests': 1}}, return_document=ReturnDocument.AFTER
+            )
+            if joined is not None:
+                caching.bump_version(RefreshJob)
+                return joined, False
+            # The active job finished in between; queue a new one
+            continue
+        caching.bump_version(RefreshJob)
+        future = _get_executor().submit(run, job['_id'])
+        with _lock:
+            _futures.add(future)
+        future.add_done_callback(_futures.discard)
+        return job, True
+
+
+def get(job_id):
+    return RefreshJob.objects.mongo_find_one({'_id': job_id})
+
+
+def _update(job_id, **fields):
+    RefreshJob.objects.mongo_update_one({'_id': job_id}, {'$set': {**fields, 'updated_at': timezone.now()}})
+    caching.bump_version(RefreshJob)
+
+
+def run(job_id):
+    """Run a queued job's stages, recording progress; runs on the job pool"""
+    try:
+        now = timezone.now()
+        job = RefreshJob.objects.mongo_find_one_and_update(
+            {'_id': job_id, 'status': 'queued'},
+            {'$set': {'status': 'running', 'started_at': now, 'updated_at': now}},
+        )
+        if job is None:
+            # Given up as stale before it got a thread
+            return
+        stages = KINDS[job['kind']]()
+        _update(job_id, stages_total=len(stages))
+        result = {}
+        for done, (name, function) in enumerate(stages):
+            _update(job_id, stage=name)
+            start = time.perf_counter()
+            rows = function()
+            result[name] = {'seconds': round(time.perf_counter() - start, 3)}
+            if rows is not None:
+                result[name]['rows'] = rows
+            _update(job_id, stages_done=done + 1, result=result)
+        _update(job_id, status='succeeded', active=False, stage=None, finished_at=timezone.now())
+    except Exception as error:
+        logger.exception('Job %s failed', job_id)
+        _update(job_id, status='failed', active=False, error=str(error), finished_at=timezone.now())
+    finally:
+        connections.close_all()
+
+
+def drain(timeout=None):
+    """Wait for the jobs submitted by this process to finish (tests, shutdown)"""
+    with _lock:
+        futures = list(_futures)
+    wait(futures, timeout=timeout)
@@ -0,0 +1,344 @@
+"""
+Leaderboard maintenance.
+
+Rows are ordered by ``total_calories`` (descending) with ``user_email`` as the
+tie-breaker, and ``rank`` is the 1-based position in that order. Ties are
+ranked by ``dense_rank`` (1 + the number of distinct totals above the row)
+and by the competition rank (1 + the number of rows with a higher total),
+which is the ``rank`` of the first row with the same total. Activity
+writes call ``apply_delta`` which adjusts one user's totals and shifts only the
+ranks between the old and new position. ``rebuild`` recomputes the whole board
+from the daily activity rollups and is kept as a repair tool for drift (e.g.
+``QuerySet.update`` bypasses the signals that feed the deltas; rebuild the
+rollups first in that case, see ``manage.py rebuild_rollups``).
+
+A rank change is several writes: the row's totals, then ``$inc`` shifts of
+the rows it passed. Two writers interleaving those would leave ranks wrong
+until the next rebuild, so every change to a board, this one or a windowed
+one (see ``windows``), holds the ``LOCK`` lock across processes.
+"""
+from django.utils import timezone
+
+from . import caching, locks, rollups
+from .models import User, ActivityRollup, Leaderboard
+
+# Held by every writer of the all-time and windowed boards (see ``locks``)
+LOCK = 'leaderboards'
+
+
+def _ahead_of(total_calories, user_email, scope=None):
+    """Mongo filter for rows ranked ahead of the given position"""
+    return {**(scope or {}), '$or': [
+        {'total_calories': {'$gt': total_calories}},
+        {'total_calories': total_calories, 'user_email': {'$lt': user_email}},
+    ]}
+
+
+def _behind(total_calories, user_email, scope=None):
+    """Mongo filter for rows ranked behind the given position"""
+    return {**(scope or {}), '$or': [
+        {'total_calories': {'$lt': total_calories}},
+        {'total_calories': total_calories, 'user_email': {'$gt': user_email}},
+    ]}
+
+
+def _shift_dense(model, scope, user_email, old_calories, new_calories):
+    """
+    Adjust other rows' dense ranks for one row's total moving from
+    ``old_calories`` to ``new_calories`` (None for an insert or a delete).
+
+    Only totals that become vacant or newly taken change dense ranks, so
+    rows below both totals are touched only when exactly one of those
+    happens. Returns the moved row's new dense rank.
+    """
+    others = {**(scope or {}), 'user_email': {'$ne': user_email}}
+    vacated = old_calories is not None and not model.objects.mongo_count_documents(
+        {**others, 'total_calories': old_calories}, limit=1
+    )
+    taken = new_calories is not None and not model.objects.mongo_count_documents(
+        {**others, 'total_calories': new_calories}, limit=1
+    )
+    if old_calories is not None and new_calories is not None:
+        low, high = sorted((old_calories, new_calories))
+        between = int(taken) if new_calories > old_calories else -int(vacated)
+        if between:
+            model.objects.mongo_update_many(
+                {**others, 'total_calories': {'$gte': low, '$lt': high}}, {'$inc': {'dense_rank': between}}
+            )
+    else:
+        low = new_calories if old_calories is None else old_calories
+    below = int(taken) - int(vacated)
+    if below:
+        model.objects.mongo_update_many(
+            {**others, 'total_calories': {'$lt': low}}, {'$inc': {'dense_rank': below}}
+        )
+
+    if new_calories is None:
+        return None
+    if not taken:
+        return model.objects.mongo_find_one({**others, 'total_calories': new_calories})['dense_rank']
+    higher = model.objects.mongo_find_one(
+        {**others, 'total_calories': {'$gt': new_calories}}, sort=[('total_calories', 1)]
+    )
+    return higher['dense_rank'] + 1 if higher else 1
+
+
+def insert_ranked(model, row, scope=None):
+    """
+    Insert a board row at its position and push the rows behind it down.
+
+    ``scope`` is a filter selecting the board the row belongs to when a
+    collection holds several (see ``windows``); its fields are stored on the row.
+    """
+    calories, user_email = row['total_calories'], row['user_email']
+    rank = model.objects.mongo_count_documents(_ahead_of(calories, user_email, scope)) + 1
+    model.objects.mongo_update_many(_behind(calories, user_email, scope), {'$inc': {'rank': 1}})
+    dense_rank = _shift_dense(model, scope, user_email, None, calories)
+    model.objects.mongo_insert_one({**(scope or {}), **row, 'rank': rank, 'dense_rank': dense_rank})
+
+
+def close_gap(model, entry, scope=None):
+    """Pull the rows behind a deleted board row up by one"""
+    model.objects.mongo_update_many(
+        _behind(entry['total_calories'], entry['user_email'], scope), {'$inc': {'rank': -1}}
+    )
+    _shift_dense(model, scope, entry['user_email'], entry['total_calories'], None)
+
+
+def rerank(model, entry, new_calories, scope=None):
+    """
+    Move a row whose total changed from ``entry['total_calories']`` to its new rank.
+
+    Only rows between the old and new position are touched.
+    """
+    old_calories, user_email = entry['total_calories'], entry['user_email']
+    if new_calories > old_calories:
+        shifted = model.objects.mongo_update_many(
+            {'$and': [_ahead_of(old_calories, user_email, scope), _behind(new_calories, user_email)]},
+            {'$inc': {'rank': 1}},
+        ).matched_count
+        new_rank = entry['rank'] - shifted
+    elif new_calories < old_calories:
+        shifted = model.objects.mongo_update_many(
+            {'$and': [_behind(old_calories, user_email, scope), _ahead_of(new_calories, user_email)]},
+            {'$inc': {'rank': -1}},
+        ).matched_count
+        new_rank = entry['rank'] + shifted
+    else:
+        return
+    dense_rank = _shift_dense(model, scope, user_email, old_calories, new_calories)
+    model.objects.mongo_update_one(
+        {'_id': entry['_id']}, {'$set': {'rank': new_rank, 'dense_rank': dense_rank}}
+    )
+
+
+def add_user(user, total_calories=0, total_activities=0, batch=None):
+    """Insert a leaderboard row for a user and push the rows behind it down"""
+    with locks.hold(LOCK):
+        if Leaderboard.objects.mongo_count_documents({'user_email': user.email}):
+            return
+        insert_ranked(Leaderboard, {
+            'user_email': user.email,
+            'user_name': user.name,
+            'team': user.team,
+            'total_calories': total_calories,
+            'total_activities': total_activities,
+            'updated_at': timezone.now(),
+            **rollups.applied(batch),
+        })
+    caching.bump_version(Leaderboard)
+
+
+def update_user(user):
+    """Copy a user's display fields onto their leaderboard row"""
+    Leaderboard.objects.mongo_update_one(
+        {'user_email': user.email},
+        {'$set': {'user_name': user.name, 'team': user.team, 'updated_at': timezone.now()}},
+    )
+    caching.bump_version(Leaderboard)
+
+
+def remove_user(user_email):
+    """Delete a user's leaderboard row and pull the rows behind it up"""
+    with locks.hold(LOCK):
+        entry = Leaderboard.objects.mongo_find_one_and_delete({'user_email': user_email})
+        if entry is None:
+            return
+        close_gap(Leaderboard, entry)
+    caching.bump_version(Leaderboard)
+
+
+def apply_delta(user_email, calories=0, activities=0, batch=None):
+    """
+    Add calories/activities to a user's totals and fix up ranks locally.
+
+    Only rows between the user's old and new position are touched. Users
+    without a row are inserted if they exist; activities logged for unknown
+    emails are ignored, the same as in ``rebuild``. A row already updated by
+    event ``batch`` is left alone (see ``rollups.unapplied``). Call it
+    holding ``LOCK``, as ``apply_deltas`` does.
+    """
+    if not calories and not activities:
+        return
+    entry = Leaderboard.objects.mongo_find_one_and_update(
+        {'user_email': user_email, **rollups.unapplied(batch)},
+        {
+            '$inc': {'total_calories': calories, 'total_activities': activities},
+            '$set': {'updated_at': timezone.now(), **rollups.applied(batch)},
+        },
+    )
+    if entry is None:
+        if batch is not None and Leaderboard.objects.mongo_count_documents({'user_email': user_email}, limit=1):
+            # Updated by an earlier attempt at this batch
+            return
+        user = User.objects.filter(email=user_email).first()
+        if user is not None:
+            add_user(user, total_calories=calories, total_activities=activities, batch=batch)
+        return
+    rerank(Leaderboard, entry, entry['total_calories'] + calories)
+    caching.bump_version(Leaderboard)
+
+
+def apply_deltas(deltas, batch=None):
+    """
+    Apply several users' deltas at once.
+
+    ``deltas`` maps user_email to ``(calories, activities)``; each user is
+    touched once however many activities contributed to their delta.
+    """
+    with locks.hold(LOCK):
+        for user_email, (calories, activities) in deltas.items():
+            apply_delta(user_email, calories=calories, activities=activities, batch=batch)
+
+
+def rebuild_pipeline(batch=None):
+    """
+    Aggregation pipeline (run on ``users``) that produces the whole board.
+
+    Rows are marked as updated by event ``batch``, when given (see
+    ``rollups.catch_up``).
+
+    Users contribute zero rows, per-user totals of the daily rollups are unioned in and
+    folded per email, activities for unknown emails are dropped, and
+    ``$setWindowFields`` numbers the rows in leaderboard order. ``$out``
+    writes to a temporary collection and renames it over ``leaderboard``,
+    so readers see the old board until the new one is complete.
+    """
+    return [
+        {'$project': {
+            '_id': 0,
+            'user_email': '$email',
+            'user_name': '$name',
+            'team': '$team',
+            'total_calories': {'$literal': 0},
+            'total_activities': {'$literal': 0},
+            'is_user': {'$literal': True},
+        }},
+        {'$unionWith': {
+            'coll': ActivityRollup._meta.db_table,
+            'pipeline': [
+                {'$group': {
+                    '_id': '$user_email',
+                    'total_calories': {'$sum': '$calories'},
+                    'total_activities': {'$sum': '$count'},
+                }},
+                {'$project': {
+                    '_id': 0,
+                    'user_email': '$_id',
+                    'total_calories': 1,
+                    'total_activities': 1,
+                }},
+            ],
+        }},
+        {'$group': {
+            '_id': '$user_email',
+            'user_name': {'$max': '$user_name'},
+            'team': {'$max': '$team'},
+            'is_user': {'$max': '$is_user'},
+            'total_calories': {'$sum': '$total_calories'},
+            'total_activities': {'$sum': '$total_activities'},
+        }},
+        {'$match': {'is_user': True}},
+        {'$setWindowFields': {
+            'sortBy': {'total_calories': -1, '_id': 1},
+            'output': {'rank': {'$documentNumber': {}}},
+        }},
+        {'$setWindowFields': {
+            'sortBy': {'total_calories': -1},
+            'output': {'dense_rank': {'$denseRank': {}}},
+        }},
+        {'$project': {
+            '_id': 0,
+            'user_email': '$_id',
+            'user_name': 1,
+            'team': 1,
+            'total_calories': 1,
+            'total_activities': 1,
+            'rank': 1,
+            'dense_rank': 1,
+            'updated_at': '$$NOW',
+            **{field: {'$literal': value} for field, value in rollups.applied(batch).items()},
+        }},
+        {'$out': Leaderboard._meta.db_table},
+    ]
+
+
+def rebuild():
+    """Recompute every leaderboard row in one server-side pass"""
+    with locks.hold(LOCK):
+        batch = rollups.catch_up()
+        User.objects.mongo_aggregate(rebuild_pipeline(batch), allowDiskUse=True)
+    caching.bump_version(Leaderboard)
+    return Leaderboard.objects.mongo_count_documents({})
+
+
+def competition_rank(model, entry, scope=None):
+    """Competition rank of a row: the rank of the first row with the same total"""
+    first = model.objects.mongo_find_one(
+        {**(scope or {}), 'total_calories': entry['total_calories']},
+        {'rank': 1},
+        sort=[('total_calories', -1), ('user_email', 1)],
+    )
+    return first['rank']
+
+
+def with_competition_ranks(model, rows, scope=None):
+    """
+    Add ``competition_rank`` to consecutive board rows in rank order.
+
+    Only the first row can tie with a row outside the slice, so at most one
+    lookup is needed.
+    """
+    previous = None
+    for row in rows:
+        if previous is not None and previous['total_calories'] == row['total_calories']:
+            row['competition_rank'] = previous['competition_rank']
+        elif previous is not None:
+            row['competition_rank'] = row['rank']
+        else:
+            row['competition_rank'] = competition_rank(model, row, scope)
+        previous = row
+    return rows
+
+
+def neighbourhood(model, user_email, k, scope=None):
+    """
+    A user's board row and the ``k`` rows on either side of it, in rank order.
+
+    Both lookups are index seeks (on the email and on the rank), so the cost
+    does not depend on the size of the board. Returns None for users not on it.
+    """
+    entry = model.objects.mongo_find_one({**(scope or {}), 'user_email': user_email}, {'rank': 1})
+    if entry is None:
+        return None
+    rows = list(model.objects.mongo_find(
+        {**(scope or {}), 'rank': {'$gte': entry['rank'] - k, '$lte': entry['rank'] + k}},
+        sort=[('rank', 1), ('user_email', 1)],
+    ))
+    return with_competition_ranks(model, rows, scope)
+
+
+def board_size(model, scope=None):
+    """Number of rows on a board, read off the last rank"""
+    last = model.objects.mongo_find_one(scope or {}, {'rank': 1}, sort=[('rank', -1), ('user_email', -1)])
+    return last['rank'] if last else 0
@@ -0,0 +1,261 @@
+"""
+Live all-time leaderboard over Server-Sent Events, at /api/live/leaderboard/.
+
+A client gets the top ``?limit=`` rows (default 100) as a ``snapshot``
+event, then ``diff`` events with only what changed in its top rows:
+``changed`` holds full rows that entered it and ``user_email`` plus the
+changed fields (rank, dense_rank, totals, ...) of rows that moved,
+``removed`` the emails that left it. Event ids are versions of the hub's
+board, and comments are sent every ``LIVE_LEADERBOARD_HEARTBEAT``
+seconds to keep idle connections open. Django 4.1 cannot stream from
+async code, so this is a plain ASGI app that ``asgi.py`` routes the path
+to; it is not served under WSGI (``runserver``).
+
+One hub per process watches the board for every client. Every
+``LIVE_LEADERBOARD_TICK`` seconds it reads a change marker: the row count
+and newest ``updated_at``, which every row write sets. Only when the
+marker moved does it read the top ``LIVE_LEADERBOARD_SIZE`` rows, once, and
+diff them against the previous tick, so a burst of writes becomes one diff.
+A write's rank shifts land just after its ``updated_at``, so the hub reads
+the board once more on the tick after a change. The database cost is per
+process however many clients are connected. A client slower than the ticks
+gets its pending diffs merged rather than queued.
+"""
+import asyncio
+import json
+import logging
+import weakref
+from urllib.parse import parse_qs
+
+from django.conf import settings
+
+from . import async_views
+from .models import Leaderboard
+
+logger = logging.getLogger(__name__)
+
+PATH = '/api/live/leaderboard/'
+
+# Row fields sent to clients
+FIELDS = ('user_email', 'user_name', 'team', 'total_calories', 'total_activities', 'rank', 'dense_rank')
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def _setting(name, default):
+    return getattr(settings, f'LIVE_LEADERBOARD_{name}', default)
+
+
+def diff(previous, current, limit):
+    """
+    Changes between two boards (``{user_email: row}``) within their top ``limit`` ranks.
+
+    Returns ``(changed, removed)``: full rows for new entries and the
+    changed fields (with ``user_email``) for moved ones, in rank order, and
+    the emails that dropped out.
+    """
+    before = {email: row for email, row in previous.items() if row['rank'] <= limit}
+    changed = []
+    for email, row in sorted(current.items(), key=lambda item: item[1]['rank']):
+        if row['rank'] > limit:
+            continue
+        old = before.get(email)
+        if old is None:
+            changed.append(row)
+            continue
+        fields = {name: value for name, value in row.items() if old.get(name) != value}
+        if fields:
+            changed.append({'user_email': email, **fields})
+    removed = [email for email in before if email not in current or current[email]['rank'] > limit]
+    return changed, removed
+
+
+class Subscriber:
+    """One client's top ``limit`` and the changes not sent to it yet, merged across ticks"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.version = 0
+        self.changes = {}
+        self.removed = set()
+        self.ready = asyncio.Event()
+
+    def push(self, version, changed, removed):
+        for row in changed:
+            self.removed.discard(row['user_email'])
+            self.changes.setdefault(row['user_email'], {}).update(row)
+        for email in removed:
+            self.changes.pop(email, None)
+            self.removed.add(email)
+        self.version = version
+        self.ready.set()
+
+    def take(self):
+        """The merged diff since the last call"""
+        payload = {
+            'version': self.version,
+            'changed': list(self.changes.values()),
+            'removed': sorted(self.removed),
+        }
+        self.changes, self.removed = {}, set()
+        self.ready.clear()
+        return payload
+
+
+class Hub:
+    """Watches the board for the subscribers of one event loop"""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.board = {}
+        self.marker = None
+        self.settling = False
+        self.version = 0
+        self.task = None
+        self.lock = asyncio.Lock()
+
+    async def subscribe(self, limit):
+        """Register a subscriber; returns it with its snapshot rows"""
+        async with self.lock:
+            if self.task is None:
+                # Nobody was watching, so the board may be stale
+                await self.poll()
+                self.task = asyncio.create_task(self.watch())
+            subscriber = Subscriber(limit)
+            subscriber.version = self.version
+            self.subscribers.add(subscriber)
+        rows = sorted((row for row in self.board.values() if row['rank'] <= limit), key=lambda row: row['rank'])
+        return subscriber, rows
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def watch(self):
+        try:
+            while self.subscribers:
+                await asyncio.sleep(_setting('TICK', 0.25))
+                try:
+                    await self.poll()
+                except Exception:
+                    logger.exception('Reading the leaderboard failed; retrying next tick')
+        finally:
+            self.task = None
+
+    def read_marker(self):
+        collection = async_views.collection(Leaderboard)
+        newest = collection.find_one({}, {'_id': 0, 'updated_at': 1}, sort=[('updated_at', -1)])
+        return collection.estimated_document_count(), newest and newest.get('updated_at')
+
+    async def poll(self):
+        """Re-read the board if it changed and push the diffs"""
+        marker = await async_views.run(self.read_marker)
+        if marker == self.marker and not self.settling:
+            return
+        self.settling = marker != self.marker
+        self.marker = marker
+        rows = await async_views.find(
+            Leaderboard, {}, {'_id': 0, **{name: 1 for name in FIELDS}},
+            sort=[('rank', 1), ('user_email', 1)], limit=_setting('SIZE', 1000),
+        )
+        previous, self.board = self.board, {row['user_email']: row for row in rows}
+        if self.board == previous:
+            return
+        self.version += 1
+        diffs = {}
+        for subscriber in list(self.subscribers):
+            if subscriber.limit not in diffs:
+                diffs[subscriber.limit] = diff(previous, self.board, subscriber.limit)
+            changed, removed = diffs[subscriber.limit]
+            if changed or removed:
+                subscriber.push(self.version, changed, removed)
+
+
+def hub():
+    """The hub of the running event loop"""
+    loop = asyncio.get_running_loop()
+    if loop not in _hubs:
+        _hubs[loop] = Hub()
+    return _hubs[loop]
+
+
+def _dumps(data):
+    # Compact, like DRF's JSONRenderer
+    return json.dumps(data, separators=(',', ':'))
+
+
+def _event(name, data, event_id=None):
+    lines = [f'event: {name}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {_dumps(data)}')
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+def _cors_headers():
+    if getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False):
+        return [(b'access-control-allow-origin', b'*')]
+    return []
+
+
+async def _respond(send, status, data):
+    body = _dumps(data).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode('ascii')),
+        *_cors_headers(),
+    ]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def leaderboard_stream(scope, receive, send):
+    """ASGI app serving the event stream"""
+    if scope['method'] != 'GET':
+        await _respond(send, 405, {"error": "Only GET is allowed"})
+        return
+    size = _setting('SIZE', 1000)
+    params = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    try:
+        limit = int(params.get('limit', ['100'])[0])
+        if not 1 <= limit <= size:
+            raise ValueError
+    except ValueError:
+        await _respond(send, 400, {"error": f"limit must be an integer from 1 to {size}"})
+        return
+
+    board = hub()
+    subscriber, rows = await board.subscribe(limit)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            # Tell buffering proxies (nginx) to pass events straight through
+            (b'x-accel-buffering', b'no'),
+            *_cors_headers(),
+        ]})
+        snapshot = {'version': subscriber.version, 'limit': limit, 'results': rows}
+        await send({
+            'type': 'http.response.body', 'body': _event('snapshot', snapshot, subscriber.version), 'more_body': True,
+        })
+        while not disconnected.done():
+            ready = asyncio.ensure_future(subscriber.ready.wait())
+            await asyncio.wait(
+                {ready, disconnected}, timeout=_setting('HEARTBEAT', 15), return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnected.done():
+                ready.cancel()
+                break
+            if ready.done():
+                payload = subscriber.take()
+                chunk = _event('diff', payload, payload['version'])
+            else:
+                ready.cancel()
+                chunk = b': keep-alive\n\n'
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        board.unsubscribe(subscriber)
+        disconnected.cancel()
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
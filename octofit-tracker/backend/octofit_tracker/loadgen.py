@@ -0,0 +1,150 @@
+"""
+Building blocks of the HTTP load generators (``manage.py loadtest`` and
+``bench_async``): a minimal keep-alive HTTP/1.1 client on asyncio streams
+and an HdrHistogram-style latency histogram. Both are dependency free, so
+load runs need nothing beyond the standard library and a local server.
+"""
+import asyncio
+import json
+import math
+from collections import defaultdict
+
+
+class HTTPConnection:
+    """
+    One keep-alive HTTP/1.1 connection, reopened after errors and ``Connection: close``.
+
+    Only what the load generators need: identity or chunked bodies, no TLS,
+    no redirects.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        """Send a request (``body`` is JSON-encoded) and return ``(status, body bytes)``"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = f'{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nAccept: application/json\r\n'
+        payload = b''
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            head += f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n'
+        try:
+            self.writer.write(head.encode('ascii') + b'\r\n' + payload)
+            await self.writer.drain()
+            status, headers, content = await self._read_response()
+        except BaseException:
+            # A half-read response leaves the stream unusable
+            self.close()
+            raise
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, content
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by the server')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0].strip(), 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            content = b''.join(chunks)
+        else:
+            content = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        return status, headers, content
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of latencies in microseconds, in the style of HdrHistogram.
+
+    Each power-of-two range of values is split into ``2 ** precision_bits``
+    equal sub-buckets, so every value is reported to within a fixed
+    relative error (under 1% with the default 7 bits) at any magnitude,
+    while only occupied buckets take memory. Percentiles are reported as
+    the highest value of their bucket, like HdrHistogram does.
+    """
+
+    def __init__(self, precision_bits=7):
+        self.precision_bits = precision_bits
+        self.sub_buckets = 1 << precision_bits
+        self.counts = defaultdict(int)
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        if value < 2 * self.sub_buckets:
+            return value
+        shift = value.bit_length() - self.precision_bits - 1
+        return shift * self.sub_buckets + (value >> shift)
+
+    def _highest_value(self, index):
+        if index < 2 * self.sub_buckets:
+            return index
+        shift = index // self.sub_buckets - 1
+        top = index - shift * self.sub_buckets
+        return ((top + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = max(0, round(seconds * 1_000_000))
+        self.counts[self._index(value)] += 1
+        self.total += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction):
+        """Value (microseconds) at or below which ``fraction`` of the recorded values fall"""
+        if not self.total:
+            return 0
+        target = max(1, math.ceil(fraction * self.total))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._highest_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        """Latency summary in milliseconds"""
+        return {
+            'min': (self.min or 0) / 1000,
+            'mean': round(self.sum / self.total / 1000, 3) if self.total else 0,
+            'p50': self.percentile(0.5) / 1000,
+            'p90': self.percentile(0.9) / 1000,
+            'p99': self.percentile(0.99) / 1000,
+            'p999': self.percentile(0.999) / 1000,
+            'max': self.max / 1000,
+        }
@@ -0,0 +1,81 @@
+"""
+Locks shared by every process, as lease documents in ``locks``.
+
+A lock is held by one owner until it is released or its lease
+(``LOCK_LEASE_SECONDS``) runs out, so a process that dies holding one
+blocks the others for at most the lease. Taking a free or expired lock is a
+single upsert; the ``_id`` unique index turns a race into a duplicate key
+error for the loser. Locks are reentrant within a thread.
+"""
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo.errors import DuplicateKeyError
+
+from .models import Lock
+
+_held = threading.local()
+
+RETRY_SECONDS = 0.05
+
+
+class LockTimeout(Exception):
+    """The lock stayed held elsewhere for longer than the caller would wait"""
+
+
+def _setting(name, default):
+    return getattr(settings, f'LOCK_{name}', default)
+
+
+def acquire(name, owner):
+    """Take the lock for ``owner`` if it is free or its lease ran out; returns whether it was taken"""
+    now = timezone.now()
+    try:
+        Lock.objects.mongo_update_one(
+            {'_id': name, 'expires_at': {'$lt': now}},
+            {'$set': {'owner': owner, 'expires_at': now + timedelta(seconds=_setting('LEASE_SECONDS', 300))}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def release(name, owner):
+    Lock.objects.mongo_delete_one({'_id': name, 'owner': owner})
+
+
+@contextmanager
+def hold(name, wait=None):
+    """
+    Hold the lock ``name`` for the block.
+
+    Waits up to ``wait`` seconds (``LOCK_WAIT_SECONDS`` by default; 0 tries
+    once) and raises LockTimeout if it is still held elsewhere.
+    """
+    depths = _held.__dict__.setdefault('depths', {})
+    if name in depths:
+        depths[name] += 1
+        try:
+            yield
+        finally:
+            depths[name] -= 1
+        return
+
+    owner = uuid.uuid4().hex
+    deadline = time.monotonic() + (_setting('WAIT_SECONDS', 120) if wait is None else wait)
+    while not acquire(name, owner):
+        if time.monotonic() >= deadline:
+            raise LockTimeout(f'The {name} lock is held elsewhere')
+        time.sleep(RETRY_SECONDS)
+    depths[name] = 1
+    try:
+        yield
+    finally:
+        del depths[name]
+        release(name, owner)
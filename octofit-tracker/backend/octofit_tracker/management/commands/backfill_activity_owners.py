@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from octofit_tracker import owners
+
+
+class Command(BaseCommand):
+    help = (
+        'Stamp every activity with the ids of its user and their team, and every rollup row with the team id '
+        '(for activities written before the ids existed or by raw inserts)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users re-stamped per batch')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        counts = owners.backfill(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-stamped {counts['activities']} activities and {counts['rollups']} rollup rows"
+        ))
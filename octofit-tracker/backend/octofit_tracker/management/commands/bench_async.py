@@ -0,0 +1,164 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils import timezone
+from datetime import timedelta
+import asyncio
+import random
+import threading
+import time
+from octofit_tracker import indexes, leaderboard, profiles, rollups
+from octofit_tracker.benchmarking import percentile, scratch_database
+from octofit_tracker.loadgen import HTTPConnection
+from octofit_tracker.models import User, Activity, Workout
+
+# (label, sync path, async path, query parameters; {email} is a random user)
+ENDPOINTS = [
+    ('leaderboard/top', '/api/leaderboard/top/', '/api/async/leaderboard/top/', 'limit=50'),
+    ('activities/by_user', '/api/activities/by_user/', '/api/async/activities/by_user/', 'email={email}'),
+    ('workouts/recommended', '/api/workouts/recommended/', '/api/async/workouts/recommended/', 'email={email}'),
+]
+ACTIVITY_TYPES = ['Running', 'Cycling', 'Swimming', 'Weightlifting', 'Yoga', 'Boxing', 'HIIT']
+
+
+async def run_load(host, port, paths, concurrency, duration):
+    """
+    Keep ``concurrency`` connections busy for ``duration`` seconds.
+
+    Returns the request latencies in seconds and the number of non-200 responses.
+    """
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(rng):
+        nonlocal errors
+        connection = HTTPConnection(host, port)
+        try:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                status, _ = await connection.request('GET', rng.choice(paths))
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    errors += 1
+        finally:
+            connection.close()
+
+    await asyncio.gather(*(worker(random.Random(i)) for i in range(concurrency)))
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve the API with uvicorn on a scratch database and compare the sync and async '
+        'read endpoints at increasing concurrency'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--activities', type=int, default=100000)
+        parser.add_argument('--concurrency', default='1,8,32,128', help='Comma-separated connection counts')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per endpoint and level')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--with-cache', action='store_true',
+            help='Keep the response cache of the sync endpoints (off by default so both paths query MongoDB)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            import uvicorn
+        except ImportError:
+            raise CommandError('bench_async needs uvicorn (pip install -r requirements.txt)')
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency must be comma-separated integers')
+
+        caches = {} if options['with_cache'] else {
+            'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        }
+        with scratch_database() as name, override_settings(**caches):
+            self.stdout.write(f'Seeding {name}...')
+            emails = self.seed(options['users'], options['activities'], options['seed'])
+
+            from octofit_tracker.asgi import application
+            # In-process so the server uses the scratch database; the load
+            # generator shares the GIL with it, which affects both paths alike
+            server = uvicorn.Server(uvicorn.Config(
+                application, host='127.0.0.1', port=options['port'], log_level='warning', lifespan='off'
+            ))
+            thread = threading.Thread(target=server.run, daemon=True)
+            thread.start()
+            while not server.started:
+                if not thread.is_alive():
+                    raise CommandError(f"uvicorn could not start on port {options['port']}")
+                time.sleep(0.05)
+            try:
+                self.compare(emails, levels, options)
+            finally:
+                server.should_exit = True
+                thread.join()
+
+    def compare(self, emails, levels, options):
+        rng = random.Random(options['seed'])
+        sample = [rng.choice(emails) for _ in range(100)]
+        self.stdout.write(
+            f"{'endpoint':<22}{'conn':>5}   {'sync req/s':>11} {'p50 ms':>7} {'p99 ms':>7}"
+            f"   {'async req/s':>11} {'p50 ms':>7} {'p99 ms':>7}"
+        )
+        for label, sync_path, async_path, query in ENDPOINTS:
+            for concurrency in levels:
+                line = f'{label:<22}{concurrency:>5}'
+                for path in (sync_path, async_path):
+                    paths = [f"{path}?{query.format(email=email)}" for email in sample]
+                    latencies, errors = asyncio.run(
+                        run_load('127.0.0.1', options['port'], paths, concurrency, options['duration'])
+                    )
+                    line += (
+                        f"   {len(latencies) / options['duration']:>11.0f}"
+                        f" {percentile(latencies, 0.5) * 1000:>7.1f} {percentile(latencies, 0.99) * 1000:>7.1f}"
+                    )
+                    if errors:
+                        line += self.style.ERROR(f' ({errors} errors)')
+                self.stdout.write(line)
+
+    def seed(self, users, activities, seed):
+        """Bulk insert users, activities and workouts, then build the derived collections and indexes"""
+        rng = random.Random(seed)
+        now = timezone.now()
+        emails = [f'user{i}@example.com' for i in range(users)]
+        User.objects.mongo_insert_many([
+            {'name': f'User {i}', 'email': email, 'team': f'Team {i % 10}', 'created_at': now}
+            for i, email in enumerate(emails)
+        ], ordered=False)
+        for start in range(0, activities, 10000):
+            batch = []
+            for _ in range(start, min(start + 10000, activities)):
+                duration = rng.randint(20, 120)
+                batch.append({
+                    'user_email': rng.choice(emails),
+                    'activity_type': rng.choice(ACTIVITY_TYPES),
+                    'duration': duration,
+                    'calories': duration * rng.randint(5, 12),
+                    'date': now - timedelta(days=rng.randint(0, 365)),
+                    'created_at': now,
+                })
+            Activity.objects.mongo_insert_many(batch, ordered=False)
+        Workout.objects.mongo_insert_many([
+            {
+                'name': f'{activity_type} {difficulty}',
+                'description': 'Synthetic workout',
+                'activity_type': activity_type,
+                'duration': 45,
+                'difficulty': difficulty,
+                'calories_estimate': 400,
+            }
+            for activity_type in ACTIVITY_TYPES for difficulty in ('Easy', 'Medium', 'Hard')
+        ])
+        rollups.rebuild()
+        profiles.rebuild()
+        leaderboard.rebuild()
+        for model in indexes.INDEXES:
+            indexes.reconcile(model)
+        return emails
@@ -0,0 +1,137 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+import io
+from octofit_tracker import indexes, jobs
+from octofit_tracker.benchmarking import (
+    DATASETS, endpoint_requests, load_baseline, measure, percentile, save_baseline, scratch_database
+)
+from octofit_tracker.models import Team, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Time every endpoint on fixed datasets and check MongoDB command counts against the '
+        'query budgets in bench_baseline.json'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='small,medium', help=f"Comma-separated of: {', '.join(DATASETS)}")
+        parser.add_argument('--repeat', type=int, default=30, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per endpoint first')
+        parser.add_argument('--workers', type=int, default=None, help='populate_db generator processes')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help='Flag p50/p95 more than this fraction above the baseline'
+        )
+        parser.add_argument('--fail-on-latency', action='store_true', help='Fail on latency regressions too')
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Record these timings and query counts as the new baseline (budgets are kept)'
+        )
+        parser.add_argument(
+            '--require-baseline', action='store_true',
+            help='Fail, instead of warning, when bench_baseline.json has no timings to compare against'
+        )
+
+    def handle(self, *args, **options):
+        sizes = [size.strip() for size in options['sizes'].split(',') if size.strip()]
+        unknown = [size for size in sizes if size not in DATASETS]
+        if unknown:
+            raise CommandError(f"Unknown sizes: {', '.join(unknown)}")
+        baseline = load_baseline()
+
+        results = {}
+        # The response cache would turn repeats into cache hits
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            for size in sizes:
+                results[size] = self.run_size(size, options)
+
+        failures = self.compare(baseline, results, options)
+        if options['update_baseline']:
+            baseline['results'].update(results)
+            save_baseline(baseline)
+            self.stdout.write(self.style.SUCCESS('Baseline updated'))
+        if failures:
+            raise CommandError('\n'.join(failures))
+
+    def run_size(self, size, options):
+        """Seed one dataset on a scratch database and measure every endpoint against it"""
+        dataset = DATASETS[size]
+        with scratch_database() as name:
+            self.stdout.write(f"Seeding {size} ({dataset['users']} users) into {name}...")
+            populate = ['populate_db', '--end-date', '2026-01-01', '--seed', '42']
+            for option, value in dataset.items():
+                populate += [f"--{option.replace('_', '-')}", str(value)]
+            if options['workers']:
+                populate += ['--workers', str(options['workers'])]
+            call_command(*populate, stdout=io.StringIO())
+            for model in indexes.INDEXES:
+                indexes.reconcile(model)
+
+            user = User.objects.mongo_find_one({}, sort=[('_id', 1)])
+            team = Team.objects.mongo_find_one({'name': user['team']})
+            client = APIClient()
+            measured = {}
+            for endpoint, method, path in endpoint_requests(user['email'], str(team['_id']), team['name']):
+                measure(client, method, path, options['warmup'])
+                latencies, queries = measure(client, method, path, options['repeat'])
+                # Let background jobs (leaderboard.refresh) finish before timing the next endpoint
+                jobs.drain()
+                measured[endpoint] = {
+                    'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+                    'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+                    'queries': queries,
+                }
+        return measured
+
+    def compare(self, baseline, results, options):
+        """Print the results next to the baseline; returns the failures"""
+        budgets = baseline['budgets']
+        failures = []
+        for size, measured in results.items():
+            reference = baseline['results'].get(size, {})
+            missing = []
+            self.stdout.write(f'\n{size}')
+            self.stdout.write(
+                f"  {'endpoint':<32}{'p50 ms':>9}{'p95 ms':>9}{'base p50':>10}{'base p95':>10}"
+                f"{'queries':>9}{'budget':>8}"
+            )
+            for endpoint, numbers in measured.items():
+                base = reference.get(endpoint)
+                if base is None:
+                    missing.append(endpoint)
+                    base = {}
+                budget = budgets.get(endpoint)
+                line = (
+                    f"  {endpoint:<32}{numbers['p50_ms']:>9.1f}{numbers['p95_ms']:>9.1f}"
+                    f"{base.get('p50_ms', float('nan')):>10.1f}{base.get('p95_ms', float('nan')):>10.1f}"
+                    f"{numbers['queries']:>9}{budget if budget is not None else '-':>8}"
+                )
+                problems = []
+                if budget is None:
+                    problems.append('no query budget')
+                elif numbers['queries'] > budget:
+                    problems.append(f"{numbers['queries']} queries, budget {budget}")
+                slower = [
+                    key for key in ('p50_ms', 'p95_ms')
+                    if base.get(key) and numbers[key] > base[key] * (1 + options['tolerance'])
+                ]
+                if slower:
+                    problems.append(f"slower than baseline ({', '.join(slower)})")
+                if problems:
+                    line += '  ' + self.style.ERROR('; '.join(problems))
+                    if budget is None or numbers['queries'] > budget or options['fail_on_latency']:
+                        failures.append(f"{size} {endpoint}: {'; '.join(problems)}")
+                self.stdout.write(line)
+            if missing and not options['update_baseline']:
+                # Without reference timings the latency check cannot flag anything
+                problem = (
+                    f"{size}: no baseline timings for {', '.join(missing)}; run with --update-baseline "
+                    f"on the reference machine and commit bench_baseline.json"
+                )
+                self.stdout.write(self.style.WARNING(f'  WARNING: {problem}'))
+                if options['require_baseline']:
+                    failures.append(problem)
+        return failures
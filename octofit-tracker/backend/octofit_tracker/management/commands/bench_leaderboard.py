@@ -0,0 +1,125 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+import random
+from octofit_tracker import leaderboard, rollups
+from octofit_tracker.benchmarking import load_baseline, save_baseline, scratch_database, timer
+from octofit_tracker.models import User, Activity, Leaderboard
+
+
+def legacy_rebuild():
+    """The per-user rebuild loop the aggregation pipeline replaced"""
+    Leaderboard.objects.all().delete()
+
+    leaderboard_entries = []
+    for user in User.objects.all():
+        user_activities = Activity.objects.filter(user_email=user.email)
+        total_activities = user_activities.count()
+        total_calories = sum(activity.calories for activity in user_activities)
+
+        leaderboard_entries.append({
+            'user_email': user.email,
+            'user_name': user.name,
+            'team': user.team,
+            'total_calories': total_calories,
+            'total_activities': total_activities,
+        })
+
+    leaderboard_entries.sort(key=lambda x: (-x['total_calories'], x['user_email']))
+    for rank, entry in enumerate(leaderboard_entries, start=1):
+        entry['rank'] = rank
+        Leaderboard.objects.create(**entry)
+
+
+class Command(BaseCommand):
+    help = 'Time the leaderboard rebuild against the legacy per-user loop on a scratch database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--activities', type=int, default=1000000)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--skip-legacy', action='store_true', help='Only time the pipeline rebuild')
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Record these timings under leaderboard_rebuild in bench_baseline.json'
+        )
+
+    def handle(self, *args, **options):
+        with scratch_database() as name:
+            self.stdout.write(f'Seeding {name}...')
+            self.seed(options['users'], options['activities'], options['batch_size'], options['seed'])
+
+            results = {}
+            with timer(results, 'rollups'):
+                rollups.rebuild()
+            with timer(results, 'pipeline'):
+                leaderboard.rebuild()
+            pipeline_board = list(Leaderboard.objects.mongo_find(
+                {}, {'_id': 0, 'updated_at': 0, 'dense_rank': 0}, sort=[('rank', 1)]
+            ))
+
+            if not options['skip_legacy']:
+                with timer(results, 'legacy'):
+                    legacy_rebuild()
+                legacy_board = list(Leaderboard.objects.mongo_find(
+                    {}, {'_id': 0, 'updated_at': 0, 'dense_rank': 0}, sort=[('rank', 1)]
+                ))
+                if legacy_board != pipeline_board:
+                    self.stdout.write(self.style.ERROR('Pipeline and legacy boards differ'))
+
+        self.stdout.write(f"Users: {options['users']}, activities: {options['activities']}")
+        self.stdout.write(f"  rollup rebuild:   {results['rollups']:.2f}s")
+        self.stdout.write(f"  pipeline rebuild: {results['pipeline']:.2f}s")
+        if 'legacy' in results:
+            self.stdout.write(f"  legacy rebuild:   {results['legacy']:.2f}s")
+            self.stdout.write(self.style.SUCCESS(
+                f"  speedup:          {results['legacy'] / results['pipeline']:.1f}x"
+            ))
+
+        baseline = load_baseline()
+        recorded = baseline.get('leaderboard_rebuild')
+        if recorded:
+            self.stdout.write(
+                f"Baseline ({recorded['users']} users, {recorded['activities']} activities): "
+                + ', '.join(f"{name} {seconds:.2f}s" for name, seconds in recorded['seconds'].items())
+            )
+        else:
+            self.stdout.write(self.style.WARNING(
+                'No leaderboard_rebuild baseline recorded; record one with --save-baseline'
+            ))
+        if options['save_baseline']:
+            baseline['leaderboard_rebuild'] = {
+                'users': options['users'],
+                'activities': options['activities'],
+                'seconds': {name: round(seconds, 3) for name, seconds in results.items()},
+            }
+            save_baseline(baseline)
+            self.stdout.write(self.style.SUCCESS('Baseline updated'))
+
+    def seed(self, users, activities, batch_size, seed):
+        """Bulk insert synthetic users and activities, bypassing the signals"""
+        rng = random.Random(seed)
+        now = timezone.now()
+        activity_types = ['Running', 'Cycling', 'Swimming', 'Weightlifting', 'Yoga', 'Boxing', 'HIIT']
+
+        emails = [f'user{i}@example.com' for i in range(users)]
+        for start in range(0, users, batch_size):
+            User.objects.mongo_insert_many([
+                {'name': f'User {i}', 'email': emails[i], 'team': f'Team {i % 10}', 'created_at': now}
+                for i in range(start, min(start + batch_size, users))
+            ], ordered=False)
+
+        for start in range(0, activities, batch_size):
+            batch = []
+            for _ in range(start, min(start + batch_size, activities)):
+                duration = rng.randint(20, 120)
+                batch.append({
+                    'user_email': rng.choice(emails),
+                    'activity_type': rng.choice(activity_types),
+                    'duration': duration,
+                    'calories': duration * rng.randint(5, 12),
+                    'date': now - timedelta(days=rng.randint(0, 365)),
+                    'created_at': now,
+                })
+            Activity.objects.mongo_insert_many(batch, ordered=False)
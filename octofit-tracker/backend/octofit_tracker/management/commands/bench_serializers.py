@@ -0,0 +1,99 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from datetime import timedelta
+import random
+from bson import ObjectId
+from rest_framework.renderers import JSONRenderer
+from octofit_tracker.benchmarking import timer
+from octofit_tracker.models import User, Activity, Leaderboard, Workout
+from octofit_tracker.serializers import (
+    UserSerializer,
+    ActivitySerializer,
+    LeaderboardSerializer,
+    WorkoutSerializer,
+    FastReadSerializer
+)
+
+
+def make_rows(model, count, rng):
+    """Unsaved model instances with realistic values; no database needed"""
+    now = timezone.now()
+    rows = []
+    for i in range(count):
+        if model is User:
+            values = {'name': f'User {i}', 'email': f'user{i}@example.com', 'team': f'Team {i % 10}'}
+        elif model is Activity:
+            duration = rng.randint(20, 120)
+            values = {
+                'user_email': f'user{i % 500}@example.com',
+                'activity_type': rng.choice(['Running', 'Cycling', 'Yoga']),
+                'duration': duration,
+                'calories': duration * rng.randint(5, 12),
+                'date': now - timedelta(minutes=rng.randint(0, 500000)),
+            }
+        elif model is Leaderboard:
+            values = {
+                'user_email': f'user{i}@example.com',
+                'user_name': f'User {i}',
+                'team': f'Team {i % 10}',
+                'total_calories': rng.randint(0, 100000),
+                'total_activities': rng.randint(0, 500),
+                'rank': i + 1,
+                'dense_rank': i + 1,
+                'updated_at': now,
+            }
+        else:
+            values = {
+                'name': f'Workout {i}',
+                'description': 'Synthetic workout',
+                'activity_type': 'Running',
+                'duration': 30,
+                'difficulty': 'Medium',
+                'calories_estimate': 300,
+            }
+        row = model(_id=ObjectId(), **values)
+        if hasattr(row, 'created_at'):
+            row.created_at = now
+        rows.append(row)
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Compare ModelSerializer and FastReadSerializer on large in-memory list responses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        renderer = JSONRenderer()
+        cases = [
+            (User, UserSerializer),
+            (Activity, ActivitySerializer),
+            (Leaderboard, LeaderboardSerializer),
+            (Workout, WorkoutSerializer),
+        ]
+        self.stdout.write(f"{options['rows']} rows, best of {options['repeat']}")
+        for model, serializer_class in cases:
+            instances = make_rows(model, options['rows'], rng)
+            names = FastReadSerializer.source_fields(serializer_class)
+            values = [{name: getattr(row, name) for name in names} for row in instances]
+
+            best = {}
+            for _ in range(options['repeat']):
+                results = {}
+                with timer(results, 'drf'):
+                    drf_body = renderer.render(serializer_class(instances, many=True).data)
+                with timer(results, 'fast'):
+                    fast_body = renderer.render(FastReadSerializer(serializer_class, values, many=True).data)
+                for name, seconds in results.items():
+                    best[name] = min(best.get(name, seconds), seconds)
+
+            if drf_body != fast_body:
+                raise CommandError(f'{serializer_class.__name__}: fast path output differs')
+            self.stdout.write(
+                f"  {serializer_class.__name__:<22} drf {best['drf'] * 1000:8.1f}ms"
+                f"   fast {best['fast'] * 1000:8.1f}ms   {best['drf'] / best['fast']:5.1f}x"
+            )
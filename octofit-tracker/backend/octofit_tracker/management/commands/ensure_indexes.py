@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from octofit_tracker import indexes
+
+
+class Command(BaseCommand):
+    help = 'Create and reconcile MongoDB indexes, then check that no API query shape needs a collection scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report index changes without applying them')
+        parser.add_argument('--skip-explain', action='store_true', help='Do not verify the query plans')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        for model in indexes.INDEXES:
+            actions = indexes.reconcile(model, dry_run=dry_run)
+            table = model._meta.db_table
+            if not actions:
+                self.stdout.write(f'{table}: up to date')
+            for action, name in actions:
+                prefix = 'would ' if dry_run else ''
+                self.stdout.write(self.style.SUCCESS(f'{table}: {prefix}{action} {name}'))
+
+        if options['skip_explain'] or dry_run:
+            return
+
+        collection_scans = []
+        for label, model, mongo_filter, sort in indexes.QUERY_SHAPES:
+            stages = indexes.explain(model, mongo_filter, sort)
+            plan = ' > '.join(stages) or 'EOF'
+            if 'COLLSCAN' in stages:
+                collection_scans.append(label)
+                self.stdout.write(self.style.ERROR(f'{label}: {plan}'))
+            else:
+                self.stdout.write(f'{label}: {plan}')
+
+        if collection_scans:
+            raise CommandError(f"Collection scans in: {', '.join(collection_scans)}")
+        self.stdout.write(self.style.SUCCESS('All query shapes are served by indexes'))
@@ -0,0 +1,235 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from collections import Counter
+from urllib.parse import quote, urlsplit
+import asyncio
+import json
+import random
+import time
+from octofit_tracker.datagen import ACTIVITY_TYPES
+from octofit_tracker.loadgen import HTTPConnection, LatencyHistogram
+
+OPERATIONS = ('post_activity', 'leaderboard_top', 'by_user', 'team_stats', 'recommended')
+DEFAULT_MIX = 'post_activity=10,leaderboard_top=30,by_user=25,team_stats=15,recommended=20'
+
+# Reads with an async twin under /api/async/ (see --async-reads)
+ASYNC_OPERATIONS = {'leaderboard_top', 'by_user', 'recommended'}
+
+
+def parse_mix(value):
+    """``name=weight,...`` into a dict of operation weights"""
+    weights = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}' (expected one of {', '.join(OPERATIONS)})")
+        weights[name] = float(weight) if weight else 1.0
+        if weights[name] < 0:
+            raise ValueError(f"Negative weight for '{name}'")
+    if not any(weights.values()):
+        raise ValueError('The mix needs at least one positive weight')
+    return weights
+
+
+def build_request(operation, rng, emails, team_ids, async_reads=False):
+    """``(method, path, body)`` of one randomly parameterized operation"""
+    prefix = '/api/async' if async_reads and operation in ASYNC_OPERATIONS else '/api'
+    email = rng.choice(emails)
+    if operation == 'post_activity':
+        duration = rng.randint(20, 120)
+        return 'POST', '/api/activities/', {
+            'user_email': email,
+            'activity_type': rng.choice(ACTIVITY_TYPES),
+            'duration': duration,
+            'calories': duration * rng.randint(5, 12),
+            'date': timezone.now().isoformat(),
+        }
+    if operation == 'leaderboard_top':
+        return 'GET', f'{prefix}/leaderboard/top/?limit=10', None
+    if operation == 'by_user':
+        return 'GET', f'{prefix}/activities/by_user/?email={quote(email)}', None
+    if operation == 'team_stats':
+        return 'GET', f'/api/teams/{rng.choice(team_ids)}/stats/', None
+    return 'GET', f'{prefix}/workouts/recommended/?email={quote(email)}', None
+
+
+class OperationResult:
+    """Latencies and outcomes of one operation"""
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.outcomes = Counter()
+        self.errors = 0
+
+    def record(self, outcome, seconds):
+        # Outcomes are status codes, or exception names for failed requests
+        self.histogram.record(seconds)
+        self.outcomes[str(outcome)] += 1
+        if not isinstance(outcome, int) or outcome >= 400:
+            self.errors += 1
+
+    def merge(self, other):
+        self.histogram.merge(other.histogram)
+        self.outcomes.update(other.outcomes)
+        self.errors += other.errors
+
+    def report(self, elapsed):
+        requests = self.histogram.total
+        return {
+            'requests': requests,
+            'errors': self.errors,
+            'error_rate': round(self.errors / requests, 6) if requests else 0.0,
+            'throughput_rps': round(requests / elapsed, 2) if elapsed else 0.0,
+            'outcomes': dict(sorted(self.outcomes.items())),
+            'latency_ms': self.histogram.summary(),
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive a running OctoFit server with a weighted mix of reads and writes from many '
+        'concurrent clients and report per-endpoint throughput, latency percentiles and error rates as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server under test')
+        parser.add_argument('--clients', type=int, default=64, help='Concurrent keep-alive clients')
+        parser.add_argument('--duration', type=float, default=30.0, help='Measured seconds')
+        parser.add_argument('--warmup', type=float, default=5.0, help='Seconds of load before measuring')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Operation weights (default {DEFAULT_MIX})')
+        parser.add_argument(
+            '--async-reads', action='store_true',
+            help='Send leaderboard_top, by_user and recommended to their /api/async/ endpoints'
+        )
+        parser.add_argument('--timeout', type=float, default=10.0, help='Seconds before a request counts as failed')
+        parser.add_argument('--sample', type=int, default=1000, help='Users and teams to draw parameters from')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument(
+            '--max-error-rate', type=float,
+            help='Exit with an error when the overall error rate exceeds this fraction'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            weights = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(f'--mix: {e}')
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('--url must be an http:// URL (TLS is not supported)')
+        if options['clients'] < 1 or options['duration'] <= 0:
+            raise CommandError('--clients and --duration must be positive')
+        host, port = url.hostname, url.port or 80
+
+        try:
+            emails, team_ids = asyncio.run(self.discover(host, port, options['sample']))
+        except OSError as e:
+            raise CommandError(f"Cannot reach {options['url']}: {e}")
+        if not emails:
+            raise CommandError('The server has no users; run manage.py populate_db first')
+        if weights.get('team_stats') and not team_ids:
+            raise CommandError('The server has no teams for team_stats')
+
+        results, elapsed = asyncio.run(self.run_load(host, port, weights, emails, team_ids, options))
+        report = self.report(results, elapsed, weights, options)
+        body = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(body + '\n')
+            total = report['total']
+            self.stdout.write(self.style.SUCCESS(
+                f"{total['requests']} requests, {total['throughput_rps']} req/s, "
+                f"p99 {total['latency_ms']['p99']} ms, error rate {total['error_rate']}; "
+                f"report written to {options['output']}"
+            ))
+        else:
+            self.stdout.write(body)
+
+        if options['max_error_rate'] is not None and report['total']['error_rate'] > options['max_error_rate']:
+            raise CommandError(
+                f"Error rate {report['total']['error_rate']} exceeds --max-error-rate {options['max_error_rate']}"
+            )
+
+    async def discover(self, host, port, sample):
+        """Emails and team ids to parameterize requests with, read through the API"""
+        connection = HTTPConnection(host, port)
+        try:
+            emails = await self.collect(connection, '/api/users/?fields=email&page_size=1000', 'email', sample)
+            team_ids = await self.collect(connection, '/api/teams/?fields=_id&page_size=1000', '_id', sample)
+        finally:
+            connection.close()
+        return emails, team_ids
+
+    async def collect(self, connection, path, field, limit):
+        values = []
+        while path and len(values) < limit:
+            status, content = await connection.request('GET', path)
+            if status != 200:
+                raise CommandError(f'GET {path} returned {status}')
+            page = json.loads(content)
+            values += [row[field] for row in page['results']]
+            # Follow the cursor links, which carry the server's own host name
+            next_link = urlsplit(page['next']) if page['next'] else None
+            path = f'{next_link.path}?{next_link.query}' if next_link else None
+        return values[:limit]
+
+    async def run_load(self, host, port, weights, emails, team_ids, options):
+        """
+        Keep every client busy until the warmup and the measured period are over.
+
+        Each client sends its next request as soon as the previous one
+        completes (a closed loop). Requests started during the warmup are
+        not recorded. Returns the results per operation and the measured
+        seconds.
+        """
+        names = list(weights)
+        cumulative = []
+        for name in names:
+            cumulative.append((cumulative[-1] if cumulative else 0) + weights[name])
+        results = {name: OperationResult() for name in names}
+        measure_from = time.perf_counter() + options['warmup']
+        deadline = measure_from + options['duration']
+
+        async def client(number):
+            rng = random.Random(options['seed'] * 1_000_003 + number)
+            own = {name: OperationResult() for name in names}
+            connection = HTTPConnection(host, port)
+            try:
+                while time.perf_counter() < deadline:
+                    operation = rng.choices(names, cum_weights=cumulative)[0]
+                    method, path, body = build_request(operation, rng, emails, team_ids, options['async_reads'])
+                    start = time.perf_counter()
+                    try:
+                        outcome, _ = await asyncio.wait_for(
+                            connection.request(method, path, body), options['timeout']
+                        )
+                    except (OSError, EOFError, ValueError, asyncio.TimeoutError) as e:
+                        outcome = type(e).__name__
+                    if start >= measure_from:
+                        own[operation].record(outcome, time.perf_counter() - start)
+            finally:
+                connection.close()
+            return own
+
+        for own in await asyncio.gather(*(client(number) for number in range(options['clients']))):
+            for name, result in own.items():
+                results[name].merge(result)
+        return results, max(time.perf_counter() - measure_from, 0.0)
+
+    def report(self, results, elapsed, weights, options):
+        total = OperationResult()
+        for result in results.values():
+            total.merge(result)
+        return {
+            'url': options['url'],
+            'clients': options['clients'],
+            'duration_seconds': round(elapsed, 3),
+            'warmup_seconds': options['warmup'],
+            'mix': weights,
+            'async_reads': options['async_reads'],
+            'seed': options['seed'],
+            'endpoints': {name: result.report(elapsed) for name, result in results.items()},
+            'total': total.report(elapsed),
+        }
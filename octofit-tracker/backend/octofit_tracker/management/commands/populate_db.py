@@ -1,24 +1,139 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import multiprocessing
+import os
 import random
-from octofit_tracker.models import User, Team, Activity, Leaderboard, Workout
+from octofit_tracker import caching, datagen, events, leaderboard, profiles, rollups
+from octofit_tracker.models import (
+    User, Team, Activity, ActivityEvent, ActivityRollup, ActivityProfile, Leaderboard, LeaderboardWindow,
+    WindowedLeaderboard, Workout
+)
 
 
 class Command(BaseCommand):
-    help = 'Populate the octofit_db database with test data'
+    help = (
+        'Populate the octofit_db database with test data: the superhero dataset, or with --users '
+        'a deterministic synthetic dataset generated in parallel'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, help='Generate this many synthetic users instead of the superheroes')
+        parser.add_argument('--teams', type=int, default=10)
+        parser.add_argument('--activities-per-user', type=int, default=20)
+        parser.add_argument('--days', type=int, default=30, help='Spread activities over this many days')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--end-date',
+            help='Day after the last generated activity, YYYY-MM-DD (default today, UTC); '
+                 'pass it to reproduce a dataset on another day'
+        )
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Generator processes')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Documents per insert_many')
+
+    def handle(self, *args, **options):
+        synthetic = options['users'] is not None
+        if synthetic:
+            spec = self.synthetic_spec(options)
 
-    def handle(self, *args, **kwargs):
         self.stdout.write('Deleting existing data...')
         
-        # Delete all existing data
-        User.objects.all().delete()
-        Team.objects.all().delete()
-        Activity.objects.all().delete()
-        Leaderboard.objects.all().delete()
-        Workout.objects.all().delete()
+        # Delete all existing data; raw deletes, since the derived collections go too
+        for model in (User, Team, Activity, ActivityEvent, ActivityRollup, ActivityProfile, Leaderboard,
+                      LeaderboardWindow, WindowedLeaderboard, Workout):
+            model.objects.mongo_delete_many({})
+            caching.bump_version(model)
         
         self.stdout.write(self.style.SUCCESS('Existing data deleted.'))
         
+        if synthetic:
+            self.create_synthetic(spec, options['workers'])
+        else:
+            # Apply the activity events inline, so none are left over to be
+            # applied again on top of the rebuild below
+            with events.inline():
+                self.create_superheroes()
+        
+        # Create Leaderboard entries
+        # Activity writes already maintain the rollups, profiles and the board; rebuild once so they are exact.
+        self.stdout.write('Creating leaderboard...')
+        rollups.rebuild()
+        profiles.rebuild()
+        leaderboard_count = leaderboard.rebuild()
+        
+        self.stdout.write(self.style.SUCCESS(f'Created {leaderboard_count} leaderboard entries'))
+        self.create_workouts()
+        
+        self.stdout.write(self.style.SUCCESS('\nDatabase population complete!'))
+        self.stdout.write(self.style.SUCCESS(f'Summary:'))
+        self.stdout.write(self.style.SUCCESS(f'  - Teams: {Team.objects.mongo_count_documents({})}'))
+        self.stdout.write(self.style.SUCCESS(f'  - Users: {User.objects.mongo_count_documents({})}'))
+        self.stdout.write(self.style.SUCCESS(f'  - Activities: {Activity.objects.mongo_count_documents({})}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'  - Activity rollups: {ActivityRollup.objects.mongo_count_documents({})}'
+        ))
+        self.stdout.write(self.style.SUCCESS(f'  - Leaderboard entries: {Leaderboard.objects.mongo_count_documents({})}'))
+        self.stdout.write(self.style.SUCCESS(f'  - Workouts: {Workout.objects.mongo_count_documents({})}'))
+
+    def synthetic_spec(self, options):
+        """datagen spec from the options; see datagen.generate_chunk"""
+        for name in ('users', 'teams', 'activities_per_user', 'days', 'workers', 'batch_size'):
+            minimum = 0 if name in ('users', 'activities_per_user') else 1
+            if options[name] < minimum:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least {minimum}")
+        if options['end_date']:
+            try:
+                end = datetime.strptime(options['end_date'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--end-date must be YYYY-MM-DD')
+        else:
+            end = datetime.combine(timezone.now().date(), datetime.min.time())
+        settings_dict = connection.settings_dict
+        return {
+            'users': options['users'],
+            'teams': options['teams'],
+            'activities_per_user': options['activities_per_user'],
+            'days': options['days'],
+            'seed': options['seed'],
+            'end': end,
+            'batch_size': options['batch_size'],
+            'database': settings_dict['NAME'],
+            'client': {key: value for key, value in settings_dict.get('CLIENT', {}).items() if key != 'name'},
+            'collections': {'users': User._meta.db_table, 'activities': Activity._meta.db_table},
+        }
+
+    def create_synthetic(self, spec, workers):
+        """Generate and bulk insert the synthetic dataset, one chunk of users per task"""
+        self.stdout.write(
+            f"Generating {spec['users']} users in {spec['teams']} teams with "
+            f"{spec['activities_per_user']} activities each (seed {spec['seed']}, "
+            f"ending {spec['end']:%Y-%m-%d})..."
+        )
+        Team.objects.mongo_insert_many(datagen.teams(spec))
+        chunks = range(datagen.chunk_count(spec))
+        insert = partial(datagen.insert_chunk, spec)
+        if workers == 1 or len(chunks) <= 1:
+            self.report_progress(map(insert, chunks), len(chunks))
+            return
+        # spawn: forked children would share the parent's MongoDB sockets
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context) as pool:
+            self.report_progress(pool.map(insert, chunks), len(chunks))
+
+    def report_progress(self, results, chunks):
+        """Consume the per-chunk (users, activities) counts, reporting every tenth chunk"""
+        users = activities = 0
+        for done, (chunk_users, chunk_activities) in enumerate(results, start=1):
+            users += chunk_users
+            activities += chunk_activities
+            if done % 10 == 0 or done == chunks:
+                self.stdout.write(f'  {done}/{chunks} chunks: {users} users, {activities} activities')
+        self.stdout.write(self.style.SUCCESS(f'Created {users} users and {activities} activities'))
+
+    def create_superheroes(self):
         # Create Teams
         self.stdout.write('Creating teams...')
         team_marvel = Team.objects.create(
@@ -84,33 +199,8 @@ class Command(BaseCommand):
                 activities_created += 1
         
         self.stdout.write(self.style.SUCCESS(f'Created {activities_created} activities'))
-        
-        # Create Leaderboard entries
-        self.stdout.write('Creating leaderboard...')
-        leaderboard_entries = []
-        
-        for user in users:
-            # Calculate total activities and calories for each user
-            user_activities = Activity.objects.filter(user_email=user.email)
-            total_activities = user_activities.count()
-            total_calories = sum(activity.calories for activity in user_activities)
-            
-            leaderboard_entries.append({
-                'user_email': user.email,
-                'user_name': user.name,
-                'team': user.team,
-                'total_calories': total_calories,
-                'total_activities': total_activities,
-            })
-        
-        # Sort by total calories and assign ranks
-        leaderboard_entries.sort(key=lambda x: x['total_calories'], reverse=True)
-        for rank, entry in enumerate(leaderboard_entries, start=1):
-            entry['rank'] = rank
-            Leaderboard.objects.create(**entry)
-        
-        self.stdout.write(self.style.SUCCESS(f'Created {len(leaderboard_entries)} leaderboard entries'))
-        
+
+    def create_workouts(self):
         # Create Workouts (suggestions)
         self.stdout.write('Creating workout suggestions...')
         workouts = [
@@ -200,11 +290,3 @@ class Command(BaseCommand):
             Workout.objects.create(**workout_data)
         
         self.stdout.write(self.style.SUCCESS(f'Created {len(workouts)} workout suggestions'))
-        
-        self.stdout.write(self.style.SUCCESS('\nDatabase population complete!'))
-        self.stdout.write(self.style.SUCCESS(f'Summary:'))
-        self.stdout.write(self.style.SUCCESS(f'  - Teams: {Team.objects.count()}'))
-        self.stdout.write(self.style.SUCCESS(f'  - Users: {User.objects.count()}'))
-        self.stdout.write(self.style.SUCCESS(f'  - Activities: {Activity.objects.count()}'))
-        self.stdout.write(self.style.SUCCESS(f'  - Leaderboard entries: {Leaderboard.objects.count()}'))
-        self.stdout.write(self.style.SUCCESS(f'  - Workouts: {Workout.objects.count()}'))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from octofit_tracker import events
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply pending activity events to the leaderboards, rollups and profiles: once, continuously '
+        '(--follow), or replay the activities collection instead (--backfill)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Events per batch')
+        parser.add_argument('--follow', action='store_true', help='Keep consuming new events until interrupted')
+        parser.add_argument(
+            '--backfill', action='store_true',
+            help='Settle every pending event and rebuild the derived collections from the activities '
+                 '(pause activity writes while it runs)'
+        )
+        parser.add_argument('--status', action='store_true', help='Only report the pending events')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if options['status']:
+            pending = events.status()
+            self.stdout.write(f"{pending['pending']} pending events, oldest {pending['lag_seconds']}s old")
+            return
+        if options['backfill']:
+            counts = events.backfill()
+            self.stdout.write(self.style.SUCCESS(
+                f"Settled {counts['settled_events']} pending events; rebuilt {counts['rollups']} rollup rows, "
+                f"{counts['profiles']} profiles and {counts['leaderboard']} leaderboard entries"
+            ))
+            return
+        if options['follow']:
+            self.stdout.write('Consuming activity events (Ctrl-C to stop)...')
+            try:
+                events.follow(batch_size=options['batch_size'])
+            except KeyboardInterrupt:
+                pass
+            return
+        applied = events.drain(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Applied {applied} activity events'))
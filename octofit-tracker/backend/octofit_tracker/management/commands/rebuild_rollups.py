@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from octofit_tracker import leaderboard, profiles, rollups, windows
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily activity rollups from activities, then the leaderboards and profiles from the rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-leaderboard', action='store_true', help='Only rebuild the rollups')
+
+    def handle(self, *args, **options):
+        rollup_count = rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rollup_count} rollup rows'))
+        if options['skip_leaderboard']:
+            return
+        profile_count = profiles.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {profile_count} activity profiles'))
+        leaderboard_count = leaderboard.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {leaderboard_count} leaderboard entries'))
+        window_count = windows.rebuild_current(timezone.now())
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {window_count} windowed leaderboard entries'))
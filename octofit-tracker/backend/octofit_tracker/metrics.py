@@ -0,0 +1,117 @@
+"""
+Per-endpoint request metrics in the Prometheus text exposition format.
+
+The middleware reports every request here; endpoints are URL names (e.g.
+``team-stats``), so the label set stays bounded however many ids are
+requested. Like the response cache counters, metrics are per process:
+scrape every worker, or sum them in Prometheus.
+"""
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds, in seconds, of the histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HISTOGRAMS = [
+    ('octofit_request_duration_seconds', 'Time to produce the response', 'duration'),
+    ('octofit_request_db_seconds', 'Time spent in MongoDB commands', 'db'),
+    ('octofit_request_serialize_seconds', 'Time spent serializing and rendering', 'serialize'),
+]
+COUNTERS = [
+    ('octofit_request_queries_total', 'MongoDB commands issued', 'queries'),
+    ('octofit_response_bytes_total', 'Response body bytes (streamed responses are not counted)', 'bytes'),
+]
+
+_lock = threading.Lock()
+_endpoints = {}
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+
+def _new_endpoint():
+    return {
+        'statuses': {},
+        **{key: Histogram() for _, _, key in HISTOGRAMS},
+        **{key: 0 for _, _, key in COUNTERS},
+    }
+
+
+def observe(endpoint, method, status, duration, stats, size=None):
+    """
+    Record one request.
+
+    ``stats`` is the request's ``instrumentation.RequestStats``; ``size``
+    is the body length, or None for streamed responses.
+    """
+    with _lock:
+        metrics = _endpoints.get((endpoint, method))
+        if metrics is None:
+            metrics = _endpoints[(endpoint, method)] = _new_endpoint()
+        metrics['statuses'][status] = metrics['statuses'].get(status, 0) + 1
+        metrics['duration'].observe(duration)
+        metrics['db'].observe(stats.db_seconds)
+        metrics['serialize'].observe(stats.spans.get('serialize', 0.0))
+        metrics['queries'] += stats.queries
+        metrics['bytes'] += size or 0
+
+
+def reset():
+    with _lock:
+        _endpoints.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Every metric of this process as Prometheus text"""
+    with _lock:
+        endpoints = sorted(_endpoints.items())
+        lines = [
+            '# HELP octofit_requests_total Requests handled',
+            '# TYPE octofit_requests_total counter',
+        ]
+        for (endpoint, method), metrics in endpoints:
+            for status, count in sorted(metrics['statuses'].items()):
+                lines.append(
+                    f'octofit_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}'
+                )
+
+        for name, description, key in HISTOGRAMS:
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+            for (endpoint, method), metrics in endpoints:
+                histogram = metrics[key]
+                cumulative = 0
+                for bound, count in zip([*map(str, BUCKETS), '+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f'{name}_bucket{_labels(endpoint=endpoint, method=method, le=bound)} {cumulative}'
+                    )
+                labels = _labels(endpoint=endpoint, method=method)
+                lines.append(f'{name}_sum{labels} {_number(histogram.sum)}')
+                lines.append(f'{name}_count{labels} {cumulative}')
+
+        for name, description, key in COUNTERS:
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+            for (endpoint, method), metrics in endpoints:
+                lines.append(f'{name}{_labels(endpoint=endpoint, method=method)} {metrics[key]}')
+    return '\n'.join(lines) + '\n'
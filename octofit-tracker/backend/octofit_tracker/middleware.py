@@ -0,0 +1,75 @@
+"""
+Per-request performance instrumentation.
+
+Every response gets a ``Server-Timing`` header with the MongoDB time and
+command count, the serialization time, the rest of the handling time and
+the body size, and every request is added to the per-endpoint metrics
+served at /api/_metrics (see ``metrics``).
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import instrumentation, metrics
+
+
+def server_timing(stats, total, size=None):
+    """Server-Timing header value; durations are in milliseconds"""
+    db = stats.db_seconds
+    serialize = stats.spans.get('serialize', 0.0)
+    entries = [
+        f'db;dur={db * 1000:.2f};desc="{stats.queries} queries"',
+        f'serialize;dur={serialize * 1000:.2f}',
+        f'app;dur={max(total - db - serialize, 0.0) * 1000:.2f}',
+        f'total;dur={total * 1000:.2f}',
+    ]
+    if size is not None:
+        entries.append(f'size;desc="{size} bytes"')
+    return ', '.join(entries)
+
+
+class PerformanceMiddleware:
+    """
+    Time requests and report them as Server-Timing headers and metrics.
+
+    Runs natively in both modes, so the async views are not pushed through
+    a thread. Keep it first in MIDDLEWARE so the total covers the rest of
+    the stack. DRF responses are rendered here, inside the ``serialize``
+    span, rather than by the handler right afterwards.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with instrumentation.record_request() as stats:
+            response = self.get_response(request)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with instrumentation.record_request() as stats:
+            response = await self.get_response(request)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    def process_template_response(self, request, response):
+        with instrumentation.span('serialize'):
+            response.render()
+        return response
+
+    def finish(self, request, response, stats, total):
+        size = None if response.streaming else len(response.content)
+        response['Server-Timing'] = server_timing(stats, total, size)
+        match = request.resolver_match
+        metrics.observe(
+            match.view_name if match else 'unmatched', request.method, response.status_code, total, stats, size
+        )
+        return response
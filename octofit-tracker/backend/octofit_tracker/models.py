@@ -7,6 +7,8 @@ class User(models.Model):
     team = models.CharField(max_length=100, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = models.DjongoManager()
+    
     class Meta:
         db_table = 'users'
     
@@ -20,6 +22,8 @@ class Team(models.Model):
     description = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = models.DjongoManager()
+    
     class Meta:
         db_table = 'teams'
     
@@ -30,17 +34,69 @@ class Team(models.Model):
 class Activity(models.Model):
     _id = models.ObjectIdField(primary_key=True)
     user_email = models.EmailField()
+    # Denormalized from the user with user_email and their team (see ``owners``)
+    user_id = models.GenericObjectIdField(null=True, blank=True)
+    team_id = models.GenericObjectIdField(null=True, blank=True)
     activity_type = models.CharField(max_length=100)
     duration = models.IntegerField()  # in minutes
     calories = models.IntegerField()
     date = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = models.DjongoManager()
+    
     class Meta:
         db_table = 'activities'
     
     def __str__(self):
         return f"{self.user_email} - {self.activity_type}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the stored values so saves can be applied as deltas"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+
+class ActivityRollup(models.Model):
+    """Per-user daily totals of one activity type, maintained from activity writes"""
+    _id = models.ObjectIdField(primary_key=True)
+    user_email = models.EmailField()
+    team_id = models.GenericObjectIdField(null=True, blank=True)  # the user's team (see ``owners``)
+    day = models.DateTimeField()  # midnight UTC
+    activity_type = models.CharField(max_length=100)
+    count = models.IntegerField()
+    duration = models.IntegerField()  # in minutes
+    calories = models.IntegerField()
+    
+    objects = models.DjongoManager()
+    
+    class Meta:
+        db_table = 'activity_rollups'
+    
+    def __str__(self):
+        return f"{self.user_email} - {self.activity_type} on {self.day:%Y-%m-%d}"
+
+
+class ActivityProfile(models.Model):
+    """Per-user activity type counts and recency-weighted intensity, for recommendations"""
+    _id = models.ObjectIdField(primary_key=True)
+    user_email = models.EmailField(unique=True)
+    type_counts = models.JSONField(default=dict)  # escaped activity type -> count
+    activity_count = models.IntegerField()
+    weighted_calories = models.FloatField()
+    weighted_duration = models.FloatField()
+    weight_day = models.DateTimeField(null=True)  # day the weighted sums are relative to
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = models.DjongoManager()
+    
+    class Meta:
+        db_table = 'activity_profiles'
+    
+    def __str__(self):
+        return f"{self.user_email} profile"
 
 
 class Leaderboard(models.Model):
@@ -51,8 +107,11 @@ class Leaderboard(models.Model):
     total_calories = models.IntegerField()
     total_activities = models.IntegerField()
     rank = models.IntegerField()
+    dense_rank = models.IntegerField(null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = models.DjongoManager()
+    
     class Meta:
         db_table = 'leaderboard'
     
@@ -60,6 +119,109 @@ class Leaderboard(models.Model):
         return f"{self.user_name} - Rank {self.rank}"
 
 
+class LeaderboardWindow(models.Model):
+    """A built period of a time-windowed leaderboard (week, month, rolling30)"""
+    _id = models.ObjectIdField(primary_key=True)
+    window = models.CharField(max_length=20)
+    period_start = models.DateTimeField()  # midnight UTC
+    built_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+    
+    objects = models.DjongoManager()
+    
+    class Meta:
+        db_table = 'leaderboard_windows'
+    
+    def __str__(self):
+        return f"{self.window} from {self.period_start:%Y-%m-%d}"
+
+
+class WindowedLeaderboard(models.Model):
+    """Leaderboard row of one user in one period of a time window"""
+    _id = models.ObjectIdField(primary_key=True)
+    window = models.CharField(max_length=20)
+    period_start = models.DateTimeField()  # midnight UTC
+    user_email = models.EmailField()
+    user_name = models.CharField(max_length=200)
+    team = models.CharField(max_length=100, null=True, blank=True)
+    total_calories = models.IntegerField()
+    total_activities = models.IntegerField()
+    rank = models.IntegerField()
+    dense_rank = models.IntegerField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = models.DjongoManager()
+    
+    class Meta:
+        db_table = 'leaderboard_windowed'
+    
+    def __str__(self):
+        return f"{self.user_name} - Rank {self.rank} ({self.window})"
+
+
+class ActivityEvent(models.Model):
+    """An activity write on its way to the derived collections (see ``events``)"""
+    _id = models.ObjectIdField(primary_key=True)
+    activity_id = models.CharField(max_length=24, null=True, blank=True)
+    old = models.JSONField(null=True, blank=True)  # activity values before the write
+    new = models.JSONField(null=True, blank=True)  # and after it
+    created_at = models.DateTimeField()
+    processed_at = models.DateTimeField(null=True, blank=True)
+    batch = models.CharField(max_length=32, null=True, blank=True)  # id of the batch it was claimed in
+    lease_until = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    
+    objects = models.DjongoManager()
+    
+    class Meta:
+        db_table = 'activity_events'
+    
+    def __str__(self):
+        return f"Event for activity {self.activity_id}"
+
+
+class RefreshJob(models.Model):
+    """A rebuild running in the background, requested through the API (see ``jobs``)"""
+    _id = models.ObjectIdField(primary_key=True)
+    kind = models.CharField(max_length=50)
+    status = models.CharField(max_length=20)  # queued, running, succeeded, failed
+    active = models.BooleanField(default=True)  # queued or running
+    requests = models.IntegerField(default=1)  # requests coalesced into this job
+    stage = models.CharField(max_length=100, null=True, blank=True)
+    stages_done = models.IntegerField(default=0)
+    stages_total = models.IntegerField(null=True, blank=True)
+    result = models.JSONField(default=dict)  # stage -> seconds (and rows written)
+    error = models.TextField(null=True, blank=True)
+    requested_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField()  # heartbeat while running
+    
+    objects = models.DjongoManager()
+    
+    class Meta:
+        db_table = 'refresh_jobs'
+    
+    def __str__(self):
+        return f"{self.kind} refresh ({self.status})"
+
+
+class Lock(models.Model):
+    """A named lock, held by one owner until released or its lease runs out (see ``locks``)"""
+    _id = models.CharField(max_length=100, primary_key=True)  # the lock's name
+    owner = models.CharField(max_length=32)
+    expires_at = models.DateTimeField()
+    
+    objects = models.DjongoManager()
+    
+    class Meta:
+        db_table = 'locks'
+    
+    def __str__(self):
+        return f"{self._id} lock"
+
+
 class Workout(models.Model):
     _id = models.ObjectIdField(primary_key=True)
     name = models.CharField(max_length=200)
@@ -70,6 +232,8 @@ class Workout(models.Model):
     calories_estimate = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = models.DjongoManager()
+    
     class Meta:
         db_table = 'workouts'
     
@@ -0,0 +1,116 @@
+"""
+Owner ids denormalized onto activities.
+
+Activities only name their user by ``user_email``, and users name their
+team by ``User.team``, free text matching a ``Team.name``. So every activity
+also carries ``user_id`` (the ``_id`` of the user with its email) and
+``team_id`` (the ``_id`` of that user's team), and daily rollups carry the
+``team_id`` too. Team queries then match one indexed field instead of
+resolving member emails first. When several teams share a name, the oldest
+one owns it.
+
+Activity writes are stamped as they are made (``stamp``). User and team
+writes re-stamp the activities and rollups of the users they affect
+(``sync_user``, ``sync_team``), so a user changing team takes their history
+along. ``backfill`` (``manage.py backfill_activity_owners``) re-stamps
+everything, for data written before the ids existed or by raw inserts.
+"""
+from itertools import islice
+
+from pymongo import UpdateMany
+
+from . import caching
+from .models import User, Team, Activity, ActivityRollup
+
+
+def team_ids(names):
+    """``{name: team _id}`` for the given team names; names without a team are left out"""
+    names = [name for name in set(names) if name]
+    if not names:
+        return {}
+    teams = Team.objects.mongo_find({'name': {'$in': names}}, {'name': 1}, sort=[('_id', -1)])
+    # Newest first, so the oldest team of a name is the one kept
+    return {team['name']: team['_id'] for team in teams}
+
+
+def owners(emails):
+    """``{email: (user_id, team_id)}`` for the given emails; unknown users map to ``(None, None)``"""
+    emails = set(emails)
+    if not emails:
+        return {}
+    users = list(User.objects.mongo_find({'email': {'$in': list(emails)}}, {'email': 1, 'team': 1}))
+    teams = team_ids(user.get('team') for user in users)
+    found = {user['email']: (user['_id'], teams.get(user.get('team'))) for user in users}
+    return {email: found.get(email, (None, None)) for email in emails}
+
+
+def stamp(activities):
+    """Set ``user_id`` and ``team_id`` on activity documents (dicts with user_email) in place"""
+    if not activities:
+        return
+    known = owners(activity['user_email'] for activity in activities)
+    for activity in activities:
+        activity['user_id'], activity['team_id'] = known[activity['user_email']]
+
+
+def restamp(known):
+    """
+    Write ``{email: (user_id, team_id)}`` onto those users' activities and rollups.
+
+    Only documents holding other ids are updated. Returns the numbers of
+    activities and rollup rows changed.
+    """
+    if not known:
+        return 0, 0
+    activity_updates = []
+    rollup_updates = []
+    for email, (user_id, team_id) in known.items():
+        activity_updates.append(UpdateMany(
+            {'user_email': email, '$or': [{'user_id': {'$ne': user_id}}, {'team_id': {'$ne': team_id}}]},
+            {'$set': {'user_id': user_id, 'team_id': team_id}},
+        ))
+        rollup_updates.append(UpdateMany(
+            {'user_email': email, 'team_id': {'$ne': team_id}}, {'$set': {'team_id': team_id}},
+        ))
+    activities = Activity.objects.mongo_bulk_write(activity_updates, ordered=False).modified_count
+    rollups = ActivityRollup.objects.mongo_bulk_write(rollup_updates, ordered=False).modified_count
+    if activities:
+        caching.bump_version(Activity)
+    if rollups:
+        caching.bump_version(ActivityRollup)
+    return activities, rollups
+
+
+def sync_user(user):
+    """Re-stamp a saved user's activities, e.g. after a team change"""
+    team_id = team_ids([user.team]).get(user.team)
+    restamp({user.email: (user.pk, team_id)})
+
+
+def sync_team(team):
+    """
+    Re-stamp the activities of a saved or deleted team's members.
+
+    That is the users naming the team now and the ones whose activities
+    still carry its id, which covers renames and deletes.
+    """
+    emails = set(Activity.objects.mongo_distinct('user_email', {'team_id': team.pk}))
+    emails.update(User.objects.mongo_distinct('email', {'team': team.name}))
+    restamp(owners(emails))
+
+
+def backfill(batch_size=1000):
+    """
+    Re-stamp the activities and rollups of every user, ``batch_size`` users at a time.
+
+    Returns the numbers of activities and rollup rows changed.
+    """
+    counts = {'activities': 0, 'rollups': 0}
+    users = iter(User.objects.mongo_find({}, {'email': 1}, sort=[('_id', 1)], batch_size=batch_size))
+    while True:
+        batch = [user['email'] for user in islice(users, batch_size)]
+        if not batch:
+            return counts
+        activities, rollups = restamp(owners(batch))
+        counts['activities'] += activities
+        counts['rollups'] += rollups
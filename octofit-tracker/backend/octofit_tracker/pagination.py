@@ -0,0 +1,215 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are fetched with a range filter on a unique ordering instead of
+skip/limit, so every page costs one indexed range query no matter how deep
+the client has paged.
+"""
+import json
+import operator
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+from datetime import datetime
+from functools import reduce
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+def _query_params(request):
+    """Query parameters of a DRF request or a plain Django one (the async views)"""
+    return getattr(request, 'query_params', request.GET)
+
+
+def _flip(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginate on ``ordering``, which must be unique (end it with a unique field).
+
+    Subclasses set ``ordering``, ``page_size`` and ``max_page_size`` per
+    viewset; clients may ask for ``?page_size=`` up to the hard maximum.
+    """
+    ordering = ('_id',)
+    page_size = api_settings.PAGE_SIZE or 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        position, ordering = self.begin_page(request, queryset.model)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(position, ordering))
+        return self.end_page(list(queryset[:self.page_size + 1]), position)
+
+    def begin_page(self, request, model):
+        """
+        Read the page size and cursor of a request.
+
+        Returns ``(position, ordering)``: fetch up to ``page_size + 1`` rows
+        after ``position`` (None on the first page) in ``ordering`` and hand
+        them to ``end_page``. Split out for callers that query MongoDB
+        directly (see ``async_views``).
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.model = model
+
+        position, self.reverse = self.decode_cursor(request)
+        ordering = tuple(_flip(field) for field in self.ordering) if self.reverse else tuple(self.ordering)
+        return position, ordering
+
+    def end_page(self, rows, position):
+        """Trim the fetched rows to one page, in ``ordering``, and set up its links"""
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.next_position = self._position(rows[-1]) if rows and self.has_next else None
+        self.previous_position = self._position(rows[0]) if rows and self.has_previous else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                _query_params(request)[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return min(self.page_size, self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def _field_name(self, field):
+        return field.lstrip('-')
+
+    def _position(self, row):
+        """Ordering values of a row (model instance or ``values()`` dict)"""
+        names = [self._field_name(field) for field in self.ordering]
+        if isinstance(row, dict):
+            return [row[name] for name in names]
+        return [getattr(row, name) for name in names]
+
+    def _after(self, position, ordering):
+        """Q matching rows strictly after ``position`` in ``ordering``"""
+        conditions = []
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = self._field_name(field)
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            conditions.append(equal & Q(**{f'{name}__{lookup}': value}))
+            equal &= Q(**{name: value})
+        return reduce(operator.or_, conditions)
+
+    def mongo_sort(self, ordering):
+        """``ordering`` as a pymongo sort specification"""
+        return [
+            (self._field_name(field), DESCENDING if field.startswith('-') else ASCENDING)
+            for field in ordering
+        ]
+
+    def mongo_after(self, position, ordering):
+        """MongoDB filter matching rows strictly after ``position`` in ``ordering``"""
+        conditions = []
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = self._field_name(field)
+            operator_name = '$lt' if field.startswith('-') else '$gt'
+            conditions.append({**equal, name: {operator_name: value}})
+            equal[name] = value
+        return {'$or': conditions}
+
+    def encode_cursor(self, position, reverse):
+        values = []
+        for value in position:
+            if isinstance(value, ObjectId):
+                value = str(value)
+            elif isinstance(value, datetime):
+                value = value.isoformat()
+            values.append(value)
+        token = json.dumps({'p': values, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = urlsafe_b64encode(token.encode('ascii')).decode('ascii')
+        url = remove_query_param(self.base_url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        """Return ``(position, reverse)``; position is None on the first page"""
+        encoded = _query_params(request).get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            token = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+            values, reverse = token['p'], bool(token['r'])
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = []
+            for field, value in zip(self.ordering, values):
+                model_field = self.model._meta.get_field(self._field_name(field))
+                if model_field.primary_key:
+                    position.append(ObjectId(value))
+                else:
+                    position.append(model_field.to_python(value))
+        except (BinasciiError, InvalidId, KeyError, TypeError, ValueError, ValidationError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+
+class ActivityPagination(KeysetPagination):
+    """Newest activities first, keyed on (date, _id)"""
+    ordering = ('-date', '-_id')
+    page_size = 50
+    max_page_size = 500
+
+
+class LeaderboardPagination(KeysetPagination):
+    """Leaderboard in rank order; user_email breaks ties"""
+    ordering = ('rank', 'user_email')
+    page_size = 50
+    max_page_size = 500
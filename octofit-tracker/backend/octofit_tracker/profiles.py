@@ -0,0 +1,218 @@
+"""
+Activity profiles for workout recommendations.
+
+``activity_profiles`` holds one document per user with the number of
+activities of each type and two recency-weighted sums, of calories and of
+duration, whose ratio is the user's recent intensity in calories per minute.
+An activity logged ``DECAY_DAYS`` before another counts 1/e as much. The
+sums are kept relative to the profile's ``weight_day``, the latest day it
+has seen: an activity on day ``d`` adds ``exp((d - weight_day) / DECAY_DAYS)``
+times its value. When a later day arrives, ``weight_day`` moves forward and
+the stored sums are scaled down in the same update. Every weight is then at
+most 1, so the sums cannot overflow however far apart the days are. Only
+the ratio is read, so the common scale does not matter. The updates stay
+additive, and deletes and edits take an activity back exactly, unlike a
+running exponential average.
+
+Profiles are updated from the same folded deltas as the daily rollups and
+can be rebuilt from the rollups.
+"""
+import math
+
+from django.utils import timezone
+from pymongo import UpdateOne
+
+from . import caching, indexes, leaderboard, locks, rollups
+from .models import ActivityRollup, ActivityProfile
+
+DECAY_DAYS = 14
+
+# Recent intensity (calories per minute) below which each difficulty is preferred
+DIFFICULTY_THRESHOLDS = [(6, 'Easy'), (9, 'Medium')]
+
+
+def escape_key(activity_type):
+    """Activity type as a document key ('.' and a leading '$' are not allowed)"""
+    return activity_type.replace('%', '%25').replace('.', '%2E').replace('$', '%24')
+
+
+def unescape_key(key):
+    return key.replace('%24', '$').replace('%2E', '.').replace('%25', '%')
+
+
+def weight(day, reference):
+    """Weight of an activity on ``day`` in sums kept relative to the later day ``reference``"""
+    return math.exp((day - reference).days / DECAY_DAYS)
+
+
+def _decay(day, reference):
+    """Aggregation expression for ``weight``"""
+    return {'$exp': {'$divide': [
+        {'$dateDiff': {'startDate': reference, 'endDate': day, 'unit': 'day'}}, DECAY_DAYS,
+    ]}}
+
+
+def _merge(counts, newest, weighted_calories, weighted_duration, now, batch=None):
+    """
+    Update pipeline adding one user's deltas to their profile.
+
+    ``counts`` maps ``type_counts.<key>`` and ``activity_count`` to
+    increments, and the weighted sums are relative to ``newest``. The
+    profile's ``weight_day`` becomes the later of its own and ``newest``,
+    and both sides are rescaled to it.
+    """
+    previous = {'$ifNull': ['$weight_day', newest]}
+    reference = {'$max': [previous, newest]}
+
+    def rescaled(field, added):
+        return {'$add': [
+            {'$multiply': [{'$ifNull': [f'${field}', 0]}, _decay(previous, reference)]},
+            {'$multiply': [added, _decay(newest, reference)]},
+        ]}
+
+    return [{'$set': {
+        **{field: {'$add': [{'$ifNull': [f'${field}', 0]}, count]} for field, count in counts.items()},
+        'weighted_calories': rescaled('weighted_calories', weighted_calories),
+        'weighted_duration': rescaled('weighted_duration', weighted_duration),
+        'weight_day': reference,
+        'updated_at': {'$literal': now},
+        **{field: {'$literal': value} for field, value in rollups.applied(batch).items()},
+    }}]
+
+
+def apply_deltas(deltas, batch=None):
+    """
+    Apply folded rollup deltas (see ``rollups.fold``) to the users' profiles.
+
+    Profiles already updated by event ``batch`` are left alone (see ``rollups.unapplied``).
+    """
+    by_user = {}
+    for (user_email, day, activity_type), totals in deltas.items():
+        if any(totals):
+            by_user.setdefault(user_email, []).append((day, activity_type, totals))
+    if not by_user:
+        return
+    now = timezone.now()
+    operations = []
+    for user_email, rows in by_user.items():
+        newest = max(day for day, _, _ in rows)
+        counts = {'activity_count': 0}
+        weighted_calories = weighted_duration = 0.0
+        for day, activity_type, (count, duration, calories) in rows:
+            key = f'type_counts.{escape_key(activity_type)}'
+            counts[key] = counts.get(key, 0) + count
+            counts['activity_count'] += count
+            weighted_calories += calories * weight(day, newest)
+            weighted_duration += duration * weight(day, newest)
+        operations.append(UpdateOne(
+            {'user_email': user_email, **rollups.unapplied(batch)},
+            _merge(counts, newest, weighted_calories, weighted_duration, now, batch),
+            upsert=True,
+        ))
+    indexes.ensure(ActivityProfile, 'octofit_profiles_email')
+    rollups.upsert_all(ActivityProfile, operations)
+    caching.bump_version(ActivityProfile)
+
+
+def favorite_type(profile):
+    """Most logged activity type of a profile document, or None without history"""
+    counts = [(count, unescape_key(key)) for key, count in (profile or {}).get('type_counts', {}).items()]
+    counts = [(count, activity_type) for count, activity_type in counts if count > 0]
+    if not counts:
+        return None
+    # Ties go to the alphabetically first type
+    return min(counts, key=lambda item: (-item[0], item[1]))[1]
+
+
+def intensity(profile):
+    """Recent calories per minute of a profile document, or None without history"""
+    if not profile or profile.get('weighted_duration', 0) <= 0:
+        return None
+    return profile['weighted_calories'] / profile['weighted_duration']
+
+
+def preferred_difficulty(value):
+    if value is None:
+        return 'Easy'
+    for threshold, difficulty in DIFFICULTY_THRESHOLDS:
+        if value < threshold:
+            return difficulty
+    return 'Hard'
+
+
+def recommend(profile, workouts, limit):
+    """
+    Pick up to ``limit`` workouts for a profile from candidate workout rows.
+
+    Workouts of the favorite type come first, those matching the preferred
+    difficulty ahead of the rest; users without history get Easy workouts.
+    Candidates are expected in ``_id`` order.
+    """
+    activity_type = favorite_type(profile)
+    if activity_type is None:
+        return [workout for workout in workouts if workout['difficulty'] == 'Easy'][:limit]
+    difficulty = preferred_difficulty(intensity(profile))
+    matching = [workout for workout in workouts if workout['activity_type'] == activity_type]
+    matching.sort(key=lambda workout: workout['difficulty'] != difficulty)
+    return matching[:limit]
+
+
+def rebuild_pipeline(batch=None):
+    """
+    Aggregation pipeline (run on ``activity_rollups``) that produces every profile.
+
+    Profiles are marked as updated by event ``batch``, when given (see ``rollups.catch_up``).
+    """
+    day_weight = _decay('$day', '$weight_day')
+    escaped_type = {'$replaceAll': {
+        'input': {'$replaceAll': {
+            'input': {'$replaceAll': {'input': '$_id.activity_type', 'find': '%', 'replacement': '%25'}},
+            'find': '.', 'replacement': '%2E',
+        }},
+        'find': {'$literal': '$'}, 'replacement': '%24',
+    }}
+    return [
+        # Each user's sums are relative to their latest day, as in apply_deltas
+        {'$setWindowFields': {
+            'partitionBy': '$user_email',
+            'output': {'weight_day': {'$max': '$day'}},
+        }},
+        {'$group': {
+            '_id': {'user_email': '$user_email', 'activity_type': '$activity_type'},
+            'count': {'$sum': '$count'},
+            'weighted_calories': {'$sum': {'$multiply': ['$calories', day_weight]}},
+            'weighted_duration': {'$sum': {'$multiply': ['$duration', day_weight]}},
+            'weight_day': {'$max': '$weight_day'},
+        }},
+        {'$group': {
+            '_id': '$_id.user_email',
+            'type_counts': {'$push': {'k': escaped_type, 'v': '$count'}},
+            'activity_count': {'$sum': '$count'},
+            'weighted_calories': {'$sum': '$weighted_calories'},
+            'weighted_duration': {'$sum': '$weighted_duration'},
+            'weight_day': {'$max': '$weight_day'},
+        }},
+        {'$project': {
+            '_id': 0,
+            'user_email': '$_id',
+            'type_counts': {'$arrayToObject': '$type_counts'},
+            'activity_count': 1,
+            'weighted_calories': 1,
+            'weighted_duration': 1,
+            'weight_day': 1,
+            'updated_at': '$$NOW',
+            **{field: {'$literal': value} for field, value in rollups.applied(batch).items()},
+        }},
+        {'$out': ActivityProfile._meta.db_table},
+    ]
+
+
+def rebuild():
+    """Recompute every profile from the daily rollups"""
+    indexes.ensure(ActivityProfile, 'octofit_profiles_email')
+    # Not between a batch's rollups and its profile deltas (see events)
+    with locks.hold(leaderboard.LOCK):
+        batch = rollups.catch_up()
+        ActivityRollup.objects.mongo_aggregate(rebuild_pipeline(batch), allowDiskUse=True)
+    caching.bump_version(ActivityProfile)
+    return ActivityProfile.objects.mongo_count_documents({})
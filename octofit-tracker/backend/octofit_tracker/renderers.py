@@ -0,0 +1,43 @@
+import csv
+import io
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+def ndjson_line(row):
+    """One compact JSON document followed by a newline"""
+    return json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def csv_line(values):
+    """One CSV record, quoted the same way as csv.writer"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline-delimited JSON, one document per line"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(ndjson_line(row) for row in rows).encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    """CSV with a header row taken from the first row's keys"""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        if not rows:
+            return b''
+        header = list(rows[0])
+        lines = [csv_line(header)] + [csv_line([row.get(key) for key in header]) for row in rows]
+        return ''.join(lines).encode(self.charset)
@@ -0,0 +1,200 @@
+"""
+Daily activity rollups.
+
+``activity_rollups`` holds one row per (user_email, day, activity_type) with
+the count, duration and calories of the matching activities and the user's
+``team_id`` (see ``owners``); days are UTC calendar days. Activity writes
+(through ``events``) apply ``$inc`` upserts to the affected rows and rows
+that drop to zero activities are removed. ``rebuild`` recomputes the
+collection from ``activities`` and is the repair tool for drift, like
+``leaderboard.rebuild``.
+"""
+from datetime import datetime, time, timezone as dt_timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from . import caching, indexes, owners
+from .models import Activity, ActivityEvent, ActivityRollup
+
+DUPLICATE_KEY = 11000
+
+
+def day_of(value):
+    """Start of the UTC day containing a datetime, as a naive UTC datetime"""
+    if value.tzinfo is not None:
+        value = value.astimezone(dt_timezone.utc)
+    return datetime.combine(value.date(), time.min)
+
+
+def is_whole_days(date_range):
+    """Whether a since/until filter can be answered from rollups exactly"""
+    if not date_range:
+        return True
+    for bound in date_range.values():
+        if bound.tzinfo is not None:
+            bound = bound.astimezone(dt_timezone.utc)
+        if bound.time() != time.min:
+            return False
+    return True
+
+
+def fold(activities, sign=1, deltas=None):
+    """
+    Add activities to a ``{(user_email, day, activity_type): [count, duration, calories]}`` map.
+
+    ``activities`` are dicts with user_email, date, activity_type, duration
+    and calories; ``sign=-1`` subtracts them.
+    """
+    deltas = {} if deltas is None else deltas
+    for activity in activities:
+        key = (activity['user_email'], day_of(activity['date']), activity['activity_type'])
+        totals = deltas.setdefault(key, [0, 0, 0])
+        totals[0] += sign
+        totals[1] += sign * activity['duration']
+        totals[2] += sign * activity['calories']
+    return deltas
+
+
+def unapplied(batch):
+    """
+    Filter clause for derived rows that event ``batch`` has not updated yet.
+
+    Writers of a batch set ``applied_batch`` (see ``applied``) on every row
+    they insert or update, so a batch retried after a failure skips the rows
+    its first attempt reached (see ``events``). Empty without a batch.
+    """
+    return {} if batch is None else {'applied_batch': {'$ne': batch}}
+
+
+def applied(batch):
+    """Fields marking a row as updated by event ``batch``"""
+    return {} if batch is None else {'applied_batch': batch}
+
+
+def unfinished_batch():
+    """Id of the event batch claimed but not yet marked processed, if any (see ``events``)"""
+    unfinished = ActivityEvent.objects.mongo_find_one(
+        {'processed_at': None, 'batch': {'$ne': None}}, {'batch': 1}, sort=[('_id', 1)]
+    )
+    return unfinished['batch'] if unfinished else None
+
+
+def catch_up():
+    """
+    Complete the rollups of an event batch that failed partway; returns its id, or None.
+
+    Rebuilds of the boards from the rollups call this holding
+    ``leaderboard.LOCK`` and mark the rows they write as updated by the
+    returned batch: the rollups then hold all of it, so its retry must
+    skip those rows (see ``events``).
+    """
+    batch = unfinished_batch()
+    if batch is None:
+        return None
+    deltas = {}
+    for event in ActivityEvent.objects.mongo_find({'batch': batch, 'processed_at': None}, {'old': 1, 'new': 1}):
+        for values, sign in ((event['old'], -1), (event['new'], 1)):
+            if values:
+                fold([values], sign=sign, deltas=deltas)
+    apply_deltas(deltas, batch)
+    return batch
+
+
+def _duplicates(error):
+    """Positions of the operations a bulk write failed, if all failed on the unique key"""
+    errors = error.details.get('writeErrors', [])
+    if any(write_error.get('code') != DUPLICATE_KEY for write_error in errors):
+        raise error
+    return [write_error['index'] for write_error in errors]
+
+
+def upsert_all(model, operations):
+    """
+    Run upserting UpdateOnes, retrying the ones that lost an insert race.
+
+    Operations guarded by ``unapplied`` whose row already holds the batch
+    fail on the unique key on both tries; they are skipped.
+    """
+    try:
+        model.objects.mongo_bulk_write(operations, ordered=False)
+    except BulkWriteError as error:
+        # Concurrent upserts of a new row race on the unique index; the
+        # loser's update applies cleanly once the row exists
+        retry = [operations[index] for index in _duplicates(error)]
+        try:
+            model.objects.mongo_bulk_write(retry, ordered=False)
+        except BulkWriteError as error:
+            _duplicates(error)
+
+
+def apply_deltas(deltas, batch=None):
+    """
+    Upsert folded deltas into the rollups and drop rows left without activities.
+
+    Rows already updated by event ``batch`` are left alone (see ``unapplied``).
+    """
+    operations = []
+    emptied = []
+    changed = {key: totals for key, totals in deltas.items() if any(totals)}
+    known = owners.owners(user_email for user_email, _, _ in changed)
+    for (user_email, day, activity_type), (count, duration, calories) in changed.items():
+        key = {'user_email': user_email, 'day': day, 'activity_type': activity_type}
+        operations.append(UpdateOne({**key, **unapplied(batch)}, {
+            '$inc': {'count': count, 'duration': duration, 'calories': calories},
+            '$set': {'team_id': known[user_email][1], **applied(batch)},
+        }, upsert=True))
+        if count < 0:
+            emptied.append(key)
+    if not operations:
+        return
+
+    # The upsert retry in upsert_all relies on the unique key
+    indexes.ensure(ActivityRollup, 'octofit_rollups_user_day_type')
+    upsert_all(ActivityRollup, operations)
+    if emptied:
+        ActivityRollup.objects.mongo_delete_many({'$or': emptied, 'count': {'$lte': 0}})
+    caching.bump_version(ActivityRollup)
+
+
+def rebuild_pipeline(batch=None):
+    """
+    Aggregation pipeline (run on ``activities``) that produces every rollup row.
+
+    Rows are marked as updated by event ``batch``, when given.
+    """
+    return [
+        {'$group': {
+            '_id': {
+                'user_email': '$user_email',
+                'day': {'$dateTrunc': {'date': '$date', 'unit': 'day'}},
+                'activity_type': '$activity_type',
+            },
+            'count': {'$sum': 1},
+            'duration': {'$sum': '$duration'},
+            'calories': {'$sum': '$calories'},
+            'team_id': {'$max': '$team_id'},
+        }},
+        {'$project': {
+            '_id': 0,
+            'user_email': '$_id.user_email',
+            'team_id': 1,
+            'day': '$_id.day',
+            'activity_type': '$_id.activity_type',
+            'count': 1,
+            'duration': 1,
+            'calories': 1,
+            **{field: {'$literal': value} for field, value in applied(batch).items()},
+        }},
+        {'$out': ActivityRollup._meta.db_table},
+    ]
+
+
+def rebuild():
+    """Recompute every rollup row in one server-side pass"""
+    # $out keeps the indexes of an existing collection
+    indexes.ensure(ActivityRollup, 'octofit_rollups_user_day_type')
+    # The activities already hold the writes of a batch that failed partway
+    Activity.objects.mongo_aggregate(rebuild_pipeline(unfinished_batch()), allowDiskUse=True)
+    caching.bump_version(ActivityRollup)
+    return ActivityRollup.objects.mongo_count_documents({})
@@ -0,0 +1,21 @@
+"""
+Test runner for the project (``TEST_RUNNER`` in settings).
+
+Tests read the derived collections right after writing activities, so they
+run with ``ACTIVITY_EVENTS_EAGER``: each write's events are applied before
+it returns. Tests of the write-behind path opt out with ``override_settings``.
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class OctofitTestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._eager_events = override_settings(ACTIVITY_EVENTS_EAGER=True)
+        self._eager_events.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._eager_events.disable()
+        super().teardown_test_environment(**kwargs)
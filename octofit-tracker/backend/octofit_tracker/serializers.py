@@ -1,5 +1,28 @@
+from functools import partial
+from django.utils import timezone
 from rest_framework import serializers
-from .models import User, Team, Activity, Leaderboard, Workout
+from . import instrumentation
+from .models import User, Team, Activity, Leaderboard, WindowedLeaderboard, RefreshJob, Workout
+
+
+def format_datetime(value, current_timezone=None):
+    """
+    Render a datetime the way DateTimeField does (ISO 8601, UTC as 'Z').
+    Looking up the current timezone is comparatively slow, so callers
+    formatting many values should pass it in.
+    """
+    if not value:
+        return None
+    if current_timezone is None:
+        current_timezone = timezone.get_current_timezone()
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=current_timezone)
+    elif value.tzinfo is not current_timezone:
+        value = value.astimezone(current_timezone)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -18,9 +41,23 @@ class UserSerializer(serializers.ModelSerializer):
         return representation
 
 
+def team_member_counts(team_names):
+    """Count the members of several teams with one grouped query"""
+    team_names = list(team_names)
+    if not team_names:
+        return {}
+    counts = User.objects.mongo_aggregate([
+        {'$match': {'team': {'$in': team_names}}},
+        {'$group': {'_id': '$team', 'count': {'$sum': 1}}},
+    ])
+    return {row['_id']: row['count'] for row in counts}
+
+
 class TeamSerializer(serializers.ModelSerializer):
     _id = serializers.CharField(read_only=True)
     member_count = serializers.SerializerMethodField()
+    # Model fields each fast_<name> method reads
+    fast_sources = {'member_count': ['name']}
     
     class Meta:
         model = Team
@@ -28,8 +65,14 @@ class TeamSerializer(serializers.ModelSerializer):
         read_only_fields = ['_id', 'created_at']
     
     def get_member_count(self, obj):
-        """Get the count of users in this team"""
-        return User.objects.filter(team=obj.name).count()
+        """Get the count of users in this team (create/update responses; reads use fast_member_count)"""
+        return team_member_counts([obj.name]).get(obj.name, 0)
+    
+    @staticmethod
+    def fast_member_count(rows):
+        """member_count for FastReadSerializer rows, from one grouped query"""
+        member_counts = team_member_counts({row['name'] for row in rows})
+        return [member_counts.get(row['name'], 0) for row in rows]
     
     def to_representation(self, instance):
         """Convert ObjectId to string for JSON serialization"""
@@ -60,8 +103,30 @@ class LeaderboardSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Leaderboard
-        fields = ['_id', 'user_email', 'user_name', 'team', 'total_calories', 'total_activities', 'rank', 'updated_at']
-        read_only_fields = ['_id', 'updated_at']
+        fields = [
+            '_id', 'user_email', 'user_name', 'team', 'total_calories', 'total_activities',
+            'rank', 'dense_rank', 'updated_at'
+        ]
+        read_only_fields = ['_id', 'dense_rank', 'updated_at']
+    
+    def to_representation(self, instance):
+        """Convert ObjectId to string for JSON serialization"""
+        representation = super().to_representation(instance)
+        if hasattr(instance, '_id') and instance._id:
+            representation['_id'] = str(instance._id)
+        return representation
+
+
+class WindowedLeaderboardSerializer(serializers.ModelSerializer):
+    _id = serializers.CharField(read_only=True)
+    
+    class Meta:
+        model = WindowedLeaderboard
+        fields = [
+            '_id', 'window', 'period_start', 'user_email', 'user_name', 'team',
+            'total_calories', 'total_activities', 'rank', 'dense_rank', 'updated_at'
+        ]
+        read_only_fields = fields
     
     def to_representation(self, instance):
         """Convert ObjectId to string for JSON serialization"""
@@ -85,3 +150,150 @@ class WorkoutSerializer(serializers.ModelSerializer):
         if hasattr(instance, '_id') and instance._id:
             representation['_id'] = str(instance._id)
         return representation
+
+
+class RefreshJobSerializer(serializers.ModelSerializer):
+    _id = serializers.CharField(read_only=True)
+    progress = serializers.SerializerMethodField()
+    result = serializers.JSONField(read_only=True)
+    # Model fields each fast_<name> method reads
+    fast_sources = {'progress': ['stages_done', 'stages_total', 'status']}
+    
+    class Meta:
+        model = RefreshJob
+        fields = [
+            '_id', 'kind', 'status', 'progress', 'stage', 'stages_done', 'stages_total', 'requests',
+            'result', 'error', 'requested_at', 'started_at', 'finished_at', 'updated_at'
+        ]
+        read_only_fields = fields
+    
+    @staticmethod
+    def progress_of(stages_done, stages_total, job_status):
+        """Fraction of the stages done; 1.0 once the job succeeded"""
+        if job_status == 'succeeded':
+            return 1.0
+        return round(stages_done / stages_total, 3) if stages_total else 0.0
+    
+    def get_progress(self, obj):
+        return self.progress_of(obj.stages_done, obj.stages_total, obj.status)
+    
+    @staticmethod
+    def fast_progress(rows):
+        """progress for FastReadSerializer rows"""
+        return [
+            RefreshJobSerializer.progress_of(row['stages_done'], row['stages_total'], row['status'])
+            for row in rows
+        ]
+    
+    def to_representation(self, instance):
+        """Convert ObjectId to string for JSON serialization"""
+        representation = super().to_representation(instance)
+        if hasattr(instance, '_id') and instance._id:
+            representation['_id'] = str(instance._id)
+        return representation
+
+
+class FastReadSerializer:
+    """
+    Read-only stand-in for a ModelSerializer on list and retrieve.
+    
+    Rows from ``QuerySet.values()`` (or model instances) are turned into output
+    dicts with one plain converter per field, skipping DRF's per-field
+    machinery. The result renders to the same JSON as the ModelSerializer.
+    A SerializerMethodField ``x`` is filled by the serializer's
+    ``fast_x(rows)`` static method, which returns one value per row and reads
+    the model fields listed in the serializer's ``fast_sources['x']``.
+    ``fields`` narrows the output to a subset of the serializer's fields.
+    """
+    _plans = {}
+    
+    def __init__(self, serializer_class, instance, many=False, fields=None):
+        self.serializer_class = serializer_class
+        self.instance = instance
+        self.many = many
+        self.fields = fields
+    
+    @classmethod
+    def plan(cls, serializer_class, fields=None):
+        """(field name, converter) pairs; the converter is None for method fields"""
+        plan = cls._plans.get(serializer_class)
+        if plan is None:
+            plan = []
+            for name, field in serializer_class().fields.items():
+                if isinstance(field, serializers.SerializerMethodField):
+                    converter = None
+                elif isinstance(field, serializers.DateTimeField):
+                    converter = format_datetime
+                elif isinstance(field, serializers.IntegerField):
+                    converter = int
+                elif isinstance(field, serializers.CharField):
+                    converter = str
+                else:
+                    converter = field.to_representation
+                plan.append((name, converter))
+            cls._plans[serializer_class] = plan
+        if fields is not None:
+            return [(name, converter) for name, converter in plan if name in fields]
+        return plan
+    
+    @classmethod
+    def field_names(cls, serializer_class):
+        """Every field the serializer outputs, in output order"""
+        return [name for name, _ in cls.plan(serializer_class)]
+    
+    @classmethod
+    def parse_fields(cls, serializer_class, param):
+        """
+        Fields named by a comma-separated ?fields= value, in output order.
+        Returns None for an empty value and raises ValueError for unknown names.
+        """
+        fields = [name.strip() for name in (param or '').split(',') if name.strip()]
+        if not fields:
+            return None
+        known = cls.field_names(serializer_class)
+        unknown = [name for name in fields if name not in known]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return [name for name in known if name in fields]
+    
+    @classmethod
+    def source_fields(cls, serializer_class, fields=None):
+        """Model fields to project for this serializer (or a subset of its fields)"""
+        sources = getattr(serializer_class, 'fast_sources', {})
+        names = []
+        for name, converter in cls.plan(serializer_class, fields):
+            for source in ([name] if converter is not None else sources.get(name, [])):
+                if source not in names:
+                    names.append(source)
+        return names
+    
+    @property
+    def data(self):
+        current_timezone = timezone.get_current_timezone()
+        plan = [
+            (name, partial(format_datetime, current_timezone=current_timezone)
+             if converter is format_datetime else converter)
+            for name, converter in self.plan(self.serializer_class, self.fields)
+        ]
+        rows = list(self.instance) if self.many else [self.instance]
+        if rows and not isinstance(rows[0], dict):
+            names = self.source_fields(self.serializer_class, self.fields)
+            rows = [{name: getattr(row, name) for name in names} for row in rows]
+        
+        computed = {
+            name: getattr(self.serializer_class, f'fast_{name}')(rows)
+            for name, converter in plan if converter is None
+        }
+        # Timed apart from the fetches above, which count as database time
+        with instrumentation.span('serialize'):
+            output = []
+            for index, row in enumerate(rows):
+                item = {}
+                for name, converter in plan:
+                    if converter is None:
+                        item[name] = computed[name][index]
+                    else:
+                        value = row[name]
+                        item[name] = None if value is None else converter(value)
+                output.append(item)
+        return output if self.many else output[0]
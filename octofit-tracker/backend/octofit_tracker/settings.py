@@ -48,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its Server-Timing total covers the rest of the stack
+    'octofit_tracker.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -95,6 +97,58 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Use a shared backend (Redis, Memcached) when running several processes so
+# the response cache version counters are shared too.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'octofit-tracker',
+    }
+}
+
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300
+
+# MongoDB queries the async views (octofit_tracker.async_views) can have in
+# flight at once per process
+ASYNC_MONGO_WORKERS = 32
+
+# Background rebuild jobs (octofit_tracker.jobs): threads per process, and
+# seconds without progress after which a job counts as dead; keep it longer
+# than the slowest stage
+JOB_WORKERS = 2
+JOB_STALE_AFTER = 600
+
+# Locks shared between processes (octofit_tracker.locks): seconds a holder
+# keeps a lock before others may take it (longer than the longest leaderboard
+# rebuild), and seconds to wait for a held lock before giving up
+LOCK_LEASE_SECONDS = 300
+LOCK_WAIT_SECONDS = 120
+
+# Activity event pipeline (octofit_tracker.events). Eager applies a write's
+# events before the request returns. Otherwise, with FOLLOW, a thread per
+# process applies them in batches, polling for leftovers every
+# ACTIVITY_EVENTS_POLL_SECONDS; without it they wait for
+# `manage.py process_activity_events --follow`.
+ACTIVITY_EVENTS_EAGER = False
+ACTIVITY_EVENTS_FOLLOW = True
+ACTIVITY_EVENTS_BATCH_SIZE = 500
+ACTIVITY_EVENTS_LEASE_SECONDS = 60
+ACTIVITY_EVENTS_POLL_SECONDS = 5
+
+# Tests apply activity events eagerly (see octofit_tracker.runner)
+TEST_RUNNER = 'octofit_tracker.runner.OctofitTestRunner'
+
+# Live leaderboard stream (octofit_tracker.live): seconds between checks for
+# changes, rows watched (the largest ?limit=) and seconds between keep-alives
+LIVE_LEADERBOARD_TICK = 0.25
+LIVE_LEADERBOARD_SIZE = 1000
+LIVE_LEADERBOARD_HEARTBEAT = 15
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -136,6 +190,14 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Django REST framework
+# List endpoints use keyset pagination; viewsets set their own ordering and limits
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'octofit_tracker.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_METHODS = [
@@ -157,6 +219,10 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
 ]
+# Let the frontend read the per-request timings
+CORS_EXPOSE_HEADERS = [
+    'server-timing',
+]
 # CSRF settings for codespace
 CSRF_TRUSTED_ORIGINS = []
 if os.environ.get('CODESPACE_NAME'):
@@ -0,0 +1,89 @@
+"""
+Signal receivers that keep derived data in step with model writes.
+"""
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import caching, events, leaderboard, owners, windows
+from .models import User, Team, Activity, Leaderboard, Workout
+
+VERSIONED_MODELS = (User, Team, Activity, Leaderboard, Workout)
+
+# Activity values the derived collections are computed from
+ACTIVITY_FIELDS = ('user_email', 'activity_type', 'duration', 'calories', 'date')
+
+
+def _activity_values(values):
+    """The ACTIVITY_FIELDS of a stored activity, or None if not all loaded"""
+    if values and all(field in values for field in ACTIVITY_FIELDS):
+        return {field: values[field] for field in ACTIVITY_FIELDS}
+    return None
+
+
+@receiver(pre_save, sender=Activity)
+def activity_saving(sender, instance, **kwargs):
+    """Load the stored values of an update whose instance did not come from the DB"""
+    if instance._state.adding or _activity_values(getattr(instance, '_loaded_values', None)):
+        return
+    instance._loaded_values = (
+        Activity.objects.filter(pk=instance.pk).values(*ACTIVITY_FIELDS).first()
+    )
+
+
+@receiver(pre_save, sender=Activity)
+def activity_stamping(sender, instance, **kwargs):
+    """Stamp the owner ids on new activities and ones moved to another user (see ``owners``)"""
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    if instance._state.adding or instance.user_id is None or loaded.get('user_email') != instance.user_email:
+        instance.user_id, instance.team_id = owners.owners([instance.user_email])[instance.user_email]
+
+
+@receiver(post_save, sender=Activity)
+def activity_saved(sender, instance, created, **kwargs):
+    """Publish the write for the leaderboards, daily rollups and profiles (see ``events``)"""
+    old = None if created else _activity_values(getattr(instance, '_loaded_values', None))
+    new = {field: getattr(instance, field) for field in ACTIVITY_FIELDS}
+    events.publish([(instance.pk, old, new)])
+    instance._loaded_values = new
+
+
+@receiver(post_delete, sender=Activity)
+def activity_deleted(sender, instance, **kwargs):
+    """Publish the delete so the activity comes off the leaderboards, daily rollups and profiles"""
+    old = _activity_values(getattr(instance, '_loaded_values', None))
+    if old is None:
+        old = {field: getattr(instance, field) for field in ACTIVITY_FIELDS}
+    events.publish([(instance.pk, old, None)])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    """Give new users a leaderboard row and keep names/teams in sync"""
+    if created:
+        leaderboard.add_user(instance)
+    else:
+        leaderboard.update_user(instance)
+        windows.update_user(instance)
+    owners.sync_user(instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    """Drop a deleted user's leaderboard rows"""
+    leaderboard.remove_user(instance.email)
+    windows.remove_user(instance.email)
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def team_changed(sender, instance, **kwargs):
+    """Re-stamp the team ids on the activities of its members (see ``owners``)"""
+    owners.sync_team(instance)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_collection_version(sender, **kwargs):
+    """Invalidate cached responses built from the written collection"""
+    if sender in VERSIONED_MODELS:
+        caching.bump_version(sender)
@@ -1,9 +1,41 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, override_settings
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from django.urls import reverse
-from .models import User, Team, Activity, Leaderboard, Workout
+from django.utils import timezone
+from .models import (
+    User, Team, Activity, ActivityEvent, ActivityRollup, ActivityProfile, Leaderboard, LeaderboardWindow,
+    WindowedLeaderboard, Lock, RefreshJob, Workout
+)
+from .serializers import (
+    UserSerializer,
+    TeamSerializer,
+    ActivitySerializer,
+    LeaderboardSerializer,
+    WorkoutSerializer,
+    FastReadSerializer
+)
+from . import (
+    caching, datagen, events, exports, indexes, jobs, leaderboard, live, locks, metrics, owners, profiles, rollups,
+    windows
+)
+from .benchmarking import endpoint_requests, load_baseline, measure
+from .instrumentation import count_mongo_commands
+from .loadgen import LatencyHistogram
+from .management.commands.bench_endpoints import Command as BenchEndpointsCommand
+from .management.commands.loadtest import parse_mix
 from datetime import datetime, timedelta
+import io
+import json
+import threading
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
 
 class UserModelTest(TestCase):
@@ -82,7 +114,7 @@ class UserAPITest(APITestCase):
         url = reverse('user-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(response.data), 1)
+        self.assertGreaterEqual(len(response.data['results']), 1)
     
     def test_create_user(self):
         """Test creating a new user"""
@@ -118,7 +150,7 @@ class TeamAPITest(APITestCase):
         url = reverse('team-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(response.data), 1)
+        self.assertGreaterEqual(len(response.data['results']), 1)
     
     def test_create_team(self):
         """Test creating a new team"""
@@ -132,6 +164,182 @@ class TeamAPITest(APITestCase):
         self.assertEqual(Team.objects.count(), 2)
 
 
+class TeamMemberCountTest(APITestCase):
+    """Test cases for team member counts in list responses"""
+    
+    def setUp(self):
+        self.client = APIClient()
+    
+    def add_teams(self, count):
+        for i in range(Team.objects.count(), count):
+            team = Team.objects.create(name=f'Team {i}', description='Counted team')
+            for j in range(i % 3):
+                User.objects.create(name=f'Member {i}-{j}', email=f'member{i}-{j}@example.com', team=team.name)
+    
+    def list_teams(self):
+        with count_mongo_commands() as commands:
+            response = self.client.get(reverse('team-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(commands)
+    
+    def test_member_counts(self):
+        """Test member counts are correct for every team"""
+        self.add_teams(4)
+        response, _ = self.list_teams()
+        counts = {team['name']: team['member_count'] for team in response.data['results']}
+        self.assertEqual(counts, {'Team 0': 0, 'Team 1': 1, 'Team 2': 2, 'Team 3': 0})
+    
+    def test_query_count_is_constant(self):
+        """Test listing teams does not issue one query per team"""
+        self.add_teams(1)
+        _, few_teams = self.list_teams()
+        self.add_teams(8)
+        _, many_teams = self.list_teams()
+        self.assertEqual(few_teams, many_teams)
+    
+    def test_write_response_counts_members(self):
+        """Test update responses count members through the grouped query too"""
+        self.add_teams(3)
+        team = Team.objects.get(name='Team 2')
+        response = self.client.patch(
+            reverse('team-detail', args=[str(team._id)]), {'description': 'Renamed'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['member_count'], 2)
+
+
+class TeamStatsAPITest(APITestCase):
+    """Test cases for the team stats endpoint"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.team = Team.objects.create(name='Team Stats', description='Stats team')
+        User.objects.create(name='Stats One', email='stats1@example.com', team=self.team.name)
+        User.objects.create(name='Stats Two', email='stats2@example.com', team=self.team.name)
+        User.objects.create(name='Outsider', email='outsider@example.com', team='Other Team')
+        for email, activity_type, calories, day in [
+            ('stats1@example.com', 'Running', 300, 1),
+            ('stats1@example.com', 'Yoga', 100, 5),
+            ('stats2@example.com', 'Running', 200, 10),
+            ('outsider@example.com', 'Running', 999, 1),
+        ]:
+            Activity.objects.create(
+                user_email=email,
+                activity_type=activity_type,
+                duration=30,
+                calories=calories,
+                date=datetime(2026, 3, day, 12, 0)
+            )
+        self.url = reverse('team-stats', args=[self.team.pk])
+    
+    def test_team_totals(self):
+        """Test totals and per-type breakdown cover only team members"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_members'], 2)
+        self.assertEqual(response.data['total_activities'], 3)
+        self.assertEqual(response.data['total_calories'], 600)
+        self.assertEqual(response.data['total_duration'], 90)
+        self.assertEqual(response.data['by_activity_type'][0], {
+            'activity_type': 'Running',
+            'total_activities': 2,
+            'total_calories': 500,
+            'total_duration': 60,
+        })
+    
+    def test_team_stats_filters(self):
+        """Test the since/until window and activity type filter"""
+        response = self.client.get(self.url, {'since': '2026-03-02', 'until': '2026-03-10'})
+        self.assertEqual(response.data['total_calories'], 300)
+        response = self.client.get(self.url, {'activity_type': 'Yoga'})
+        self.assertEqual(response.data['total_activities'], 1)
+        self.assertEqual(response.data['total_calories'], 100)
+    
+    def test_team_stats_invalid_date(self):
+        """Test a malformed date is rejected"""
+        response = self.client.get(self.url, {'since': 'last week'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ActivityOwnerTest(APITestCase):
+    """Test cases for the user and team ids stamped on activities"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.red = Team.objects.create(name='Team Red', description='Red')
+        self.blue = Team.objects.create(name='Team Blue', description='Blue')
+        self.user = User.objects.create(name='Mover', email='mover@example.com', team='Team Red')
+    
+    def log(self, calories, user_email='mover@example.com'):
+        return Activity.objects.create(
+            user_email=user_email, activity_type='Running', duration=30, calories=calories,
+            date=datetime(2026, 4, 1, 7, 0)
+        )
+    
+    def owner_ids(self):
+        activities = {(row.get('user_id'), row.get('team_id')) for row in Activity.objects.mongo_find({})}
+        rollup_teams = {row.get('team_id') for row in ActivityRollup.objects.mongo_find({})}
+        return activities, rollup_teams
+    
+    def team_calories(self, team):
+        return self.client.get(reverse('team-stats', args=[team.pk])).data['total_calories']
+    
+    def test_writes_stamp_owner_ids(self):
+        """Test created and bulk inserted activities carry the user's and team's ids"""
+        self.log(100)
+        self.client.post(reverse('activity-bulk'), [{
+            'user_email': 'mover@example.com', 'activity_type': 'Yoga', 'duration': 20, 'calories': 50,
+            'date': '2026-04-02T06:00:00Z'
+        }], format='json')
+        self.assertEqual(self.owner_ids(), ({(self.user.pk, self.red.pk)}, {self.red.pk}))
+        self.assertEqual(self.team_calories(self.red), 150)
+    
+    def test_team_change_moves_history(self):
+        """Test a user's activities and rollups follow them to another team"""
+        self.log(100)
+        self.user.team = 'Team Blue'
+        self.user.save()
+        self.assertEqual(self.owner_ids(), ({(self.user.pk, self.blue.pk)}, {self.blue.pk}))
+        self.assertEqual(self.team_calories(self.red), 0)
+        self.assertEqual(self.team_calories(self.blue), 100)
+    
+    def test_team_saved_after_its_members(self):
+        """Test creating, renaming and deleting a team re-stamps its members' activities"""
+        User.objects.create(name='Early', email='early@example.com', team='Team Green')
+        self.log(70, 'early@example.com')
+        self.assertEqual(Activity.objects.mongo_find_one({'user_email': 'early@example.com'})['team_id'], None)
+        green = Team.objects.create(name='Team Green', description='Green')
+        self.assertEqual(self.team_calories(green), 70)
+        green.name = 'Team Teal'
+        green.save()
+        self.assertEqual(self.team_calories(green), 0)
+        green.name = 'Team Green'
+        green.save()
+        green.delete()
+        self.assertEqual(Activity.objects.mongo_find_one({'user_email': 'early@example.com'})['team_id'], None)
+    
+    def test_backfill(self):
+        """Test the command stamps activities and rollups written without ids"""
+        self.log(100)
+        Activity.objects.mongo_update_many({}, {'$unset': {'user_id': '', 'team_id': ''}})
+        ActivityRollup.objects.mongo_update_many({}, {'$unset': {'team_id': ''}})
+        out = io.StringIO()
+        call_command('backfill_activity_owners', stdout=out)
+        self.assertIn('Re-stamped 1 activities and 1 rollup rows', out.getvalue())
+        self.assertEqual(self.owner_ids(), ({(self.user.pk, self.red.pk)}, {self.red.pk}))
+        self.assertEqual(owners.backfill(), {'activities': 0, 'rollups': 0})
+    
+    def test_generated_activities_carry_owner_ids(self):
+        """Test synthetic activities reference their generated user and team"""
+        spec = {'users': 3, 'teams': 2, 'activities_per_user': 2, 'days': 7, 'seed': 1, 'end': datetime(2026, 1, 1)}
+        team_ids = {team['name']: team['_id'] for team in datagen.teams(spec)}
+        users, activities = datagen.generate_chunk(spec, 0)
+        by_email = {user['email']: user for user in users}
+        for activity in activities:
+            user = by_email[activity['user_email']]
+            self.assertEqual((activity['user_id'], activity['team_id']), (user['_id'], team_ids[user['team']]))
+
+
 class ActivityAPITest(APITestCase):
     """Test cases for Activity API endpoints"""
     
@@ -155,7 +363,7 @@ class ActivityAPITest(APITestCase):
         url = reverse('activity-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(response.data), 1)
+        self.assertGreaterEqual(len(response.data['results']), 1)
     
     def test_create_activity(self):
         """Test creating a new activity"""
@@ -178,6 +386,227 @@ class ActivityAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
+class PaginationTest(APITestCase):
+    """Test cases for keyset pagination of list endpoints"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        start = datetime(2026, 1, 1, 8, 0)
+        for i in range(7):
+            # Two activities share each date so (date, _id) has to break ties
+            Activity.objects.create(
+                user_email='pager@example.com',
+                activity_type='Running',
+                duration=30,
+                calories=100 + i,
+                date=start + timedelta(days=i // 2)
+            )
+    
+    def collect(self, url, params):
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data['results'])
+            if not response.data['next']:
+                return pages, response
+            response = self.client.get(response.data['next'])
+    
+    def test_pages_cover_everything_once(self):
+        """Test paging by_user visits each activity once, newest first"""
+        url = reverse('activity-by-user')
+        pages, _ = self.collect(url, {'email': 'pager@example.com', 'page_size': 3})
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        rows = [row for page in pages for row in page]
+        self.assertEqual(len({row['_id'] for row in rows}), 7)
+        dates = [row['date'] for row in rows]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+    
+    def test_previous_link(self):
+        """Test the previous link returns the page before"""
+        url = reverse('activity-list')
+        first = self.client.get(url, {'page_size': 3})
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+    
+    def test_page_size_is_capped(self):
+        """Test page_size cannot exceed the viewset maximum"""
+        response = self.client.get(reverse('activity-list'), {'page_size': 100000})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 7)
+    
+    def test_invalid_cursor(self):
+        """Test a garbled cursor is rejected"""
+        response = self.client.get(reverse('activity-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SparseFieldsetTest(APITestCase):
+    """Test cases for the fields query parameter"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        Team.objects.create(name='Team Sparse', description='Few columns')
+        for i in range(3):
+            User.objects.create(name=f'Sparse {i}', email=f'sparse{i}@example.com', team='Team Sparse')
+            Activity.objects.create(
+                user_email=f'sparse{i}@example.com',
+                activity_type='Rowing',
+                duration=20,
+                calories=100 * (i + 1),
+                date=datetime(2026, 3, 1 + i, 7, 0)
+            )
+    
+    def test_list_is_narrowed(self):
+        """Test only the requested fields are returned, in serializer order"""
+        response = self.client.get(
+            reverse('leaderboard-top'), {'fields': 'total_calories,user_name,rank'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data[0]), ['user_name', 'total_calories', 'rank'])
+        self.assertEqual(response.data[0]['total_calories'], 300)
+    
+    def test_paging_without_ordering_fields(self):
+        """Test cursors still work when the ordering fields are not requested"""
+        url = reverse('activity-list')
+        first = self.client.get(url, {'fields': 'calories', 'page_size': 2})
+        self.assertEqual(first.data['results'], [{'calories': 300}, {'calories': 200}])
+        second = self.client.get(first.data['next'])
+        self.assertEqual(second.data['results'], [{'calories': 100}])
+    
+    def test_method_field_and_retrieve(self):
+        """Test method fields and detail views honour fields"""
+        team = Team.objects.get(name='Team Sparse')
+        response = self.client.get(
+            reverse('team-detail', args=[str(team._id)]), {'fields': 'member_count'}
+        )
+        self.assertEqual(response.data, {'member_count': 3})
+    
+    def test_export_columns(self):
+        """Test exports only carry the requested columns"""
+        response = self.client.get(
+            reverse('activity-export'), {'format': 'csv', 'fields': 'user_email,calories'}
+        )
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'user_email,calories')
+        self.assertEqual(len(lines), 4)
+    
+    def test_unknown_field(self):
+        """Test unknown field names are rejected"""
+        response = self.client.get(reverse('user-list'), {'fields': 'name,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'Unknown fields: password')
+
+
+class ActivityBulkTest(APITestCase):
+    """Test cases for bulk activity ingestion"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        User.objects.create(name='Wearer', email='wearer@example.com', team='Team Marvel')
+        self.url = reverse('activity-bulk')
+    
+    def item(self, calories):
+        return {
+            'user_email': 'wearer@example.com',
+            'activity_type': 'Running',
+            'duration': 30,
+            'calories': calories,
+            'date': datetime.now().isoformat()
+        }
+    
+    def test_bulk_create(self):
+        """Test a valid batch is inserted and totals updated"""
+        response = self.client.post(self.url, [self.item(100), self.item(250)], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(Activity.objects.count(), 2)
+        entry = Leaderboard.objects.get(user_email='wearer@example.com')
+        self.assertEqual((entry.total_calories, entry.total_activities), (350, 2))
+    
+    def test_partial_failure(self):
+        """Test invalid items are reported without failing the batch"""
+        bad = self.item(100)
+        del bad['duration']
+        response = self.client.post(self.url, [self.item(100), bad], format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertIn('_id', response.data['results'][0])
+        self.assertIn('duration', response.data['results'][1]['errors'])
+        self.assertEqual(Activity.objects.count(), 1)
+    
+    def test_requires_array(self):
+        """Test a non-array body is rejected"""
+        response = self.client.post(self.url, self.item(100), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ActivityExportTest(APITestCase):
+    """Test cases for streaming activity exports"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        User.objects.create(name='Exporter', email='export@example.com', team='Team Export')
+        for day in range(1, 4):
+            Activity.objects.create(
+                user_email='export@example.com',
+                activity_type='Cycling',
+                duration=40,
+                calories=400,
+                date=datetime(2026, 2, day, 9, 0)
+            )
+        Activity.objects.create(
+            user_email='other@example.com',
+            activity_type='Cycling',
+            duration=40,
+            calories=400,
+            date=datetime(2026, 2, 1, 9, 0)
+        )
+        self.url = reverse('activity-export')
+    
+    def read(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode('utf-8')
+    
+    def test_ndjson_matches_serializer(self):
+        """Test NDJSON rows carry the same values as the JSON API"""
+        body = self.read(self.client.get(self.url, {'email': 'export@example.com'}))
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 3)
+        api = self.client.get(reverse('activity-by-user'), {'email': 'export@example.com'})
+        self.assertEqual(
+            sorted(rows, key=lambda row: row['_id']),
+            sorted((dict(row) for row in api.data['results']), key=lambda row: row['_id'])
+        )
+    
+    def test_csv_with_team_and_date_filters(self):
+        """Test CSV export honours team and date range filters"""
+        body = self.read(self.client.get(
+            self.url, {'format': 'csv', 'team': 'Team Export', 'since': '2026-02-02'}
+        ))
+        lines = body.splitlines()
+        self.assertEqual(lines[0], '_id,user_email,activity_type,duration,calories,date,created_at')
+        self.assertEqual(len(lines), 3)
+    
+    def test_email_and_team_filters_combine(self):
+        """Test an export by email and team only has that user's activities in that team"""
+        Team.objects.create(name='Team Export', description=None)
+        User.objects.create(name='Elsewhere', email='elsewhere@example.com', team='Team Other')
+        Activity.objects.create(
+            user_email='elsewhere@example.com', activity_type='Cycling', duration=40, calories=400,
+            date=datetime(2026, 2, 1, 9, 0)
+        )
+        for email, expected in [('export@example.com', 3), ('elsewhere@example.com', 0)]:
+            body = self.read(self.client.get(self.url, {'email': email, 'team': 'Team Export'}))
+            self.assertEqual(len(body.splitlines()), expected, email)
+    
+    def test_filtered_export_in_date_order(self):
+        """Test filtered exports come out oldest first"""
+        body = self.read(self.client.get(self.url, {'email': 'export@example.com'}))
+        dates = [json.loads(line)['date'] for line in body.splitlines()]
+        self.assertEqual(dates, sorted(dates))
+
+
 class LeaderboardAPITest(APITestCase):
     """Test cases for Leaderboard API endpoints"""
     
@@ -197,13 +626,27 @@ class LeaderboardAPITest(APITestCase):
         url = reverse('leaderboard-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(response.data), 1)
+        self.assertGreaterEqual(len(response.data['results']), 1)
     
     def test_get_top_leaderboard(self):
         """Test getting top N from leaderboard"""
         url = reverse('leaderboard-top')
         response = self.client.get(url, {'limit': 5})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_top_rejects_bad_limits(self):
+        """Test that top answers 400 for limits that are not positive integers"""
+        url = reverse('leaderboard-top')
+        for limit in ['abc', '0', '-3', '2.5']:
+            response = self.client.get(url, {'limit': limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data['error'], 'limit must be a positive integer')
+    
+    def test_top_clamps_limit(self):
+        """Test that large limits are clamped to the largest page size"""
+        response = self.client.get(reverse('leaderboard-top'), {'limit': 10 ** 9})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
 
 
 class WorkoutAPITest(APITestCase):
@@ -225,7 +668,7 @@ class WorkoutAPITest(APITestCase):
         url = reverse('workout-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(response.data), 1)
+        self.assertGreaterEqual(len(response.data['results']), 1)
     
     def test_create_workout(self):
         """Test creating a new workout"""
@@ -247,3 +690,1266 @@ class WorkoutAPITest(APITestCase):
         url = reverse('workout-by-difficulty')
         response = self.client.get(url, {'difficulty': 'Medium'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class LeaderboardMaintenanceTest(APITestCase):
+    """Test cases for incremental leaderboard updates on activity writes"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.alice = User.objects.create(name='Alice', email='alice@example.com', team='Team Marvel')
+        self.bob = User.objects.create(name='Bob', email='bob@example.com', team='Team DC')
+    
+    def log(self, user, calories):
+        return Activity.objects.create(
+            user_email=user.email,
+            activity_type='Running',
+            duration=30,
+            calories=calories,
+            date=datetime.now()
+        )
+    
+    def board(self):
+        return [
+            (entry.user_email, entry.total_calories, entry.total_activities, entry.rank)
+            for entry in Leaderboard.objects.all().order_by('rank')
+        ]
+    
+    def test_new_users_join_board(self):
+        """Test users get a zero row ordered by email on ties"""
+        self.assertEqual(self.board(), [
+            ('alice@example.com', 0, 0, 1),
+            ('bob@example.com', 0, 0, 2),
+        ])
+    
+    def test_activity_create_update_delete(self):
+        """Test activity writes apply deltas and re-rank"""
+        self.log(self.alice, 100)
+        bob_activity = self.log(self.bob, 300)
+        self.assertEqual(self.board(), [
+            ('bob@example.com', 300, 1, 1),
+            ('alice@example.com', 100, 1, 2),
+        ])
+        
+        bob_activity = Activity.objects.get(pk=bob_activity.pk)
+        bob_activity.calories = 50
+        bob_activity.save()
+        self.assertEqual(self.board(), [
+            ('alice@example.com', 100, 1, 1),
+            ('bob@example.com', 50, 1, 2),
+        ])
+        
+        bob_activity.delete()
+        self.assertEqual(self.board(), [
+            ('alice@example.com', 100, 1, 1),
+            ('bob@example.com', 0, 0, 2),
+        ])
+    
+    def test_api_create_updates_board(self):
+        """Test activities posted through the API reach the board"""
+        url = reverse('activity-list')
+        data = {
+            'user_email': self.bob.email,
+            'activity_type': 'Cycling',
+            'duration': 60,
+            'calories': 600,
+            'date': datetime.now().isoformat()
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.board()[0], ('bob@example.com', 600, 1, 1))
+    
+    def test_rebuild_matches_incremental(self):
+        """Test a full rebuild reproduces the incrementally maintained board"""
+        self.log(self.alice, 200)
+        self.log(self.bob, 200)
+        self.log(self.bob, 10)
+        incremental = self.board()
+        
+        response = self.client.post(reverse('leaderboard-refresh'))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        jobs.drain()
+        self.assertEqual(self.board(), incremental)
+    
+    def test_rebuild_skips_unknown_emails(self):
+        """Test the rebuild keeps idle users and drops activities of unknown emails"""
+        self.log(self.alice, 150)
+        Activity.objects.create(
+            user_email='ghost@example.com',
+            activity_type='Yoga',
+            duration=20,
+            calories=999,
+            date=datetime.now()
+        )
+        
+        self.client.post(reverse('leaderboard-refresh'))
+        jobs.drain()
+        self.assertEqual(self.board(), [
+            ('alice@example.com', 150, 1, 1),
+            ('bob@example.com', 0, 0, 2),
+        ])
+
+
+
+class LockTest(TestCase):
+    """Test cases for the locks shared between processes"""
+    
+    def in_thread(self, function):
+        """Result of running a function on another thread, as another process would"""
+        result = {}
+        
+        def target():
+            try:
+                result['value'] = function()
+            except Exception as error:
+                result['error'] = error
+            finally:
+                connections.close_all()
+        
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+        if 'error' in result:
+            raise result['error']
+        return result['value']
+    
+    def try_lock(self):
+        try:
+            with locks.hold('test', wait=0):
+                return True
+        except locks.LockTimeout:
+            return False
+    
+    def test_exclusive_and_reentrant(self):
+        """Test a held lock can be taken again by its thread only"""
+        with locks.hold('test'):
+            with locks.hold('test'):
+                self.assertFalse(self.in_thread(self.try_lock))
+            self.assertFalse(self.in_thread(self.try_lock))
+        self.assertTrue(self.in_thread(self.try_lock))
+        self.assertEqual(Lock.objects.mongo_count_documents({}), 0)
+    
+    def test_expired_lease_is_taken_over(self):
+        """Test a lock whose holder died is free once its lease runs out"""
+        Lock.objects.mongo_insert_one({
+            '_id': 'test', 'owner': 'dead', 'expires_at': timezone.now() + timedelta(minutes=5),
+        })
+        self.assertFalse(self.try_lock())
+        Lock.objects.mongo_update_one({'_id': 'test'}, {'$set': {'expires_at': timezone.now() - timedelta(seconds=1)}})
+        self.assertTrue(self.try_lock())
+    
+    def test_concurrent_writers_keep_ranks(self):
+        """Test deltas applied from two threads at once leave the ranks a rebuild would give"""
+        emails = [f'racer{index}@example.com' for index in range(6)]
+        for email in emails:
+            User.objects.create(name=email, email=email, team='Team Race')
+        
+        def writer(sign):
+            try:
+                for step in range(15):
+                    leaderboard.apply_deltas({emails[(step * sign) % len(emails)]: (10 + step * 7, 1)})
+            finally:
+                connections.close_all()
+        
+        threads = [threading.Thread(target=writer, args=(sign,)) for sign in (1, -1)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        incremental = list(Leaderboard.objects.mongo_find(
+            {}, {'_id': 0, 'user_email': 1, 'total_calories': 1, 'rank': 1, 'dense_rank': 1}, sort=[('rank', 1)]
+        ))
+        User.objects.mongo_aggregate(leaderboard.rebuild_pipeline())
+        rebuilt = list(Leaderboard.objects.mongo_find(
+            {}, {'_id': 0, 'user_email': 1, 'total_calories': 1, 'rank': 1, 'dense_rank': 1}, sort=[('rank', 1)]
+        ))
+        self.assertEqual(incremental, rebuilt)
+
+
+class RefreshJobTest(APITestCase):
+    """Test cases for background leaderboard refresh jobs"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        User.objects.create(name='Alice', email='alice@example.com', team='Blue')
+        Activity.objects.create(
+            user_email='alice@example.com', activity_type='Running', duration=30, calories=300,
+            date=timezone.now()
+        )
+    
+    def test_refresh_runs_in_background(self):
+        """Test refresh answers 202 and the job reports its stages once done"""
+        response = self.client.post(reverse('leaderboard-refresh'))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(response.data['coalesced'])
+        self.assertEqual(response['Location'], response.data['status_url'])
+        jobs.drain()
+        
+        response = self.client.get(response.data['status_url'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'succeeded')
+        self.assertEqual(response.data['progress'], 1.0)
+        self.assertEqual(response.data['stages_done'], 1 + len(windows.WINDOWS))
+        self.assertEqual(response.data['result']['leaderboard']['rows'], 1)
+        self.assertFalse(RefreshJob.objects.mongo_count_documents({'active': True}))
+    
+    def test_concurrent_refreshes_coalesce(self):
+        """Test a refresh requested while one is active joins it"""
+        indexes.ensure(RefreshJob, 'octofit_refresh_jobs_active')
+        now = timezone.now()
+        active = RefreshJob.objects.mongo_insert_one({
+            'kind': 'leaderboard', 'status': 'running', 'active': True, 'requests': 1, 'stage': 'leaderboard',
+            'stages_done': 0, 'stages_total': 4, 'result': {}, 'error': None,
+            'requested_at': now, 'started_at': now, 'finished_at': None, 'updated_at': now,
+        }).inserted_id
+        
+        response = self.client.post(reverse('leaderboard-refresh'))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertTrue(response.data['coalesced'])
+        self.assertEqual(response.data['_id'], str(active))
+        self.assertEqual(response.data['requests'], 2)
+        self.assertEqual(RefreshJob.objects.mongo_count_documents({}), 1)
+    
+    def test_stale_job_is_abandoned(self):
+        """Test a job without progress for too long no longer blocks new ones"""
+        indexes.ensure(RefreshJob, 'octofit_refresh_jobs_active')
+        long_ago = timezone.now() - timedelta(hours=1)
+        stale = RefreshJob.objects.mongo_insert_one({
+            'kind': 'leaderboard', 'status': 'running', 'active': True, 'requests': 1, 'stage': 'leaderboard',
+            'stages_done': 0, 'stages_total': 4, 'result': {}, 'error': None,
+            'requested_at': long_ago, 'started_at': long_ago, 'finished_at': None, 'updated_at': long_ago,
+        }).inserted_id
+        
+        response = self.client.post(reverse('leaderboard-refresh'))
+        self.assertFalse(response.data['coalesced'])
+        jobs.drain()
+        self.assertEqual(RefreshJob.objects.mongo_find_one({'_id': stale})['status'], 'failed')
+    
+    def test_unknown_job(self):
+        """Test unknown and malformed job ids get a 404"""
+        for job_id in ('0123456789abcdef01234567', 'nope'):
+            response = self.client.get(reverse('leaderboard-refresh-status', args=[job_id]))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ActivityEventTest(APITestCase):
+    """Test cases for the activity event pipeline"""
+    
+    def setUp(self):
+        User.objects.create(name='Alice', email='alice@example.com', team='Blue')
+        User.objects.create(name='Bob', email='bob@example.com', team='Blue')
+    
+    def pending_event(self, user_email, calories, **fields):
+        """Store an unprocessed event for a new activity, as a non-eager write would"""
+        values = {
+            'user_email': user_email, 'activity_type': 'Running', 'duration': 30, 'calories': calories,
+            'date': datetime(2026, 1, 5, 12),
+        }
+        event = {
+            'activity_id': None, 'old': None, 'new': values, 'created_at': timezone.now(), 'processed_at': None,
+            'batch': None, 'lease_until': None, 'attempts': 0, **fields,
+        }
+        Activity.objects.mongo_insert_one(dict(values, created_at=timezone.now()))
+        ActivityEvent.objects.mongo_insert_one(event)
+        return event['_id']
+    
+    def totals(self):
+        return {entry.user_email: entry.total_calories for entry in Leaderboard.objects.all()}
+    
+    def test_eager_writes_are_processed(self):
+        """Test each write leaves one processed event and the derived data current"""
+        activity = Activity.objects.create(
+            user_email='alice@example.com', activity_type='Yoga', duration=20, calories=100, date=timezone.now()
+        )
+        activity.user_email = 'bob@example.com'
+        activity.save()
+        self.assertEqual(ActivityEvent.objects.mongo_count_documents({'processed_at': None}), 0)
+        self.assertEqual(ActivityEvent.objects.mongo_count_documents({}), 2)
+        self.assertEqual(self.totals(), {'alice@example.com': 0, 'bob@example.com': 100})
+    
+    @override_settings(ACTIVITY_EVENTS_EAGER=False, ACTIVITY_EVENTS_FOLLOW=False)
+    def test_writes_wait_for_drain(self):
+        """Test writes only queue events, and the derived data catches up once they are drained"""
+        activity = Activity.objects.create(
+            user_email='alice@example.com', activity_type='Yoga', duration=20, calories=100, date=timezone.now()
+        )
+        Activity.objects.create(
+            user_email='bob@example.com', activity_type='Yoga', duration=20, calories=50, date=timezone.now()
+        )
+        activity.calories = 150
+        activity.save()
+        self.assertEqual(events.status()['pending'], 3)
+        self.assertEqual(self.totals(), {'alice@example.com': 0, 'bob@example.com': 0})
+        self.assertEqual(ActivityRollup.objects.mongo_count_documents({}), 0)
+        
+        self.assertEqual(events.drain(), 3)
+        self.assertEqual(events.status()['pending'], 0)
+        self.assertEqual(self.totals(), {'alice@example.com': 150, 'bob@example.com': 50})
+        self.assertEqual(ActivityRollup.objects.get(user_email='alice@example.com').calories, 150)
+    
+    @override_settings(ACTIVITY_EVENTS_EAGER=False, ACTIVITY_EVENTS_FOLLOW=False)
+    def test_inline_applies_writes(self):
+        """Test writes inside events.inline() are applied before they return"""
+        with events.inline():
+            Activity.objects.create(
+                user_email='alice@example.com', activity_type='Yoga', duration=20, calories=100,
+                date=timezone.now()
+            )
+        self.assertEqual(events.status()['pending'], 0)
+        self.assertEqual(self.totals(), {'alice@example.com': 100, 'bob@example.com': 0})
+    
+    def test_drain_applies_batches(self):
+        """Test draining applies every pending event once, in batches"""
+        for calories in (100, 200, 300):
+            self.pending_event('alice@example.com', calories)
+        self.pending_event('bob@example.com', 50)
+        
+        self.assertEqual(events.status()['pending'], 4)
+        self.assertEqual(events.drain(batch_size=3), 4)
+        self.assertEqual(events.drain(), 0)
+        self.assertEqual(self.totals(), {'alice@example.com': 600, 'bob@example.com': 50})
+        self.assertEqual(ActivityRollup.objects.get(user_email='alice@example.com').count, 3)
+        self.assertEqual(ActivityProfile.objects.get(user_email='alice@example.com').activity_count, 3)
+    
+    def test_expired_leases_are_redelivered(self):
+        """Test a batch leased by a dead consumer is delivered again whole, before any new batch"""
+        now = timezone.now()
+        expired = self.pending_event(
+            'alice@example.com', 100, batch='dead', lease_until=now - timedelta(minutes=1), attempts=1
+        )
+        self.pending_event('bob@example.com', 50)
+        
+        batch, claimed = events.claim(10)
+        self.assertEqual(batch, 'dead')
+        self.assertEqual([event['_id'] for event in claimed], [expired])
+        self.assertEqual(claimed[0]['attempts'], 2)
+        # Its lease is live again, and nothing is handed out until the batch is done
+        self.assertEqual(events.claim(10), (None, []))
+    
+    def test_failed_batch_is_not_applied_twice(self):
+        """Test a batch that failed partway is retried without counting what it applied twice"""
+        windows.rebuild_period('week', datetime(2026, 1, 5))
+        self.pending_event('alice@example.com', 100)
+        self.pending_event('alice@example.com', 20)
+        self.pending_event('bob@example.com', 50)
+        expected = {'alice@example.com': 120, 'bob@example.com': 50}
+        apply_delta = leaderboard.apply_delta
+        
+        def fail_for_bob(user_email, *args, **kwargs):
+            if user_email == 'bob@example.com':
+                raise RuntimeError('consumer died')
+            return apply_delta(user_email, *args, **kwargs)
+        
+        # Fails after the rollups and alice's board row, then before the profiles
+        with mock.patch.object(leaderboard, 'apply_delta', fail_for_bob):
+            with self.assertRaises(RuntimeError):
+                events.drain()
+        self.assertEqual(self.totals(), {'alice@example.com': 120, 'bob@example.com': 0})
+        with mock.patch.object(profiles, 'apply_deltas', side_effect=RuntimeError('consumer died')):
+            with self.assertRaises(RuntimeError):
+                events.drain()
+        self.assertEqual(events.status()['pending'], 3)
+        
+        self.assertEqual(events.drain(), 3)
+        self.assertEqual(events.status()['pending'], 0)
+        self.assertEqual(self.totals(), expected)
+        self.assertEqual(
+            {row.user_email: row.total_calories for row in WindowedLeaderboard.objects.all()}, expected
+        )
+        self.assertEqual(
+            {row.user_email: row.calories for row in ActivityRollup.objects.all()}, expected
+        )
+        profile = ActivityProfile.objects.get(user_email='alice@example.com')
+        self.assertEqual(profile.activity_count, 2)
+        self.assertAlmostEqual(profile.weighted_calories, 120)
+        self.assertEqual([entry.rank for entry in Leaderboard.objects.order_by('rank')], [1, 2])
+    
+    def test_rebuild_completes_failed_batch(self):
+        """Test rebuilds between a failed batch and its retry do not lose or double it"""
+        windows.rebuild_period('week', datetime(2026, 1, 5))
+        self.pending_event('alice@example.com', 100)
+        self.pending_event('bob@example.com', 50)
+        expected = {'alice@example.com': 100, 'bob@example.com': 50}
+        apply_delta = leaderboard.apply_delta
+        
+        def fail_for_bob(user_email, *args, **kwargs):
+            if user_email == 'bob@example.com':
+                raise RuntimeError('consumer died')
+            return apply_delta(user_email, *args, **kwargs)
+        
+        with mock.patch.object(leaderboard, 'apply_delta', fail_for_bob):
+            with self.assertRaises(RuntimeError):
+                events.drain()
+        leaderboard.rebuild()
+        windows.rebuild_period('week', datetime(2026, 1, 5))
+        profiles.rebuild()
+        self.assertEqual(self.totals(), expected)
+        
+        self.assertEqual(events.drain(), 2)
+        self.assertEqual(self.totals(), expected)
+        self.assertEqual(
+            {row.user_email: row.total_calories for row in WindowedLeaderboard.objects.all()}, expected
+        )
+        self.assertEqual(
+            {row.user_email: row.calories for row in ActivityRollup.objects.all()}, expected
+        )
+        profile = ActivityProfile.objects.get(user_email='alice@example.com')
+        self.assertEqual(profile.activity_count, 1)
+    
+    def test_backfill_settles_and_rebuilds(self):
+        """Test a backfill marks pending events processed and rebuilds from the activities"""
+        self.pending_event('alice@example.com', 100)
+        self.pending_event('bob@example.com', 50)
+        
+        counts = events.backfill()
+        self.assertEqual(counts['settled_events'], 2)
+        self.assertEqual(events.status(), {'pending': 0, 'lag_seconds': 0.0})
+        self.assertEqual(self.totals(), {'alice@example.com': 100, 'bob@example.com': 50})
+        self.assertEqual(events.drain(), 0)
+
+class ActivityRollupTest(APITestCase):
+    """Test cases for the daily activity rollups"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.team = Team.objects.create(name='Team Rollup', description='Daily totals')
+        User.objects.create(name='Roller', email='roller@example.com', team='Team Rollup')
+    
+    def log(self, activity_type, calories, date):
+        return Activity.objects.create(
+            user_email='roller@example.com',
+            activity_type=activity_type,
+            duration=30,
+            calories=calories,
+            date=date
+        )
+    
+    def rows(self):
+        return sorted(
+            (row.day.date().isoformat(), row.activity_type, row.count, row.duration, row.calories)
+            for row in ActivityRollup.objects.all()
+        )
+    
+    def test_activity_writes_maintain_rollups(self):
+        """Test create, update and delete adjust the matching day and type"""
+        morning = self.log('Running', 100, datetime(2026, 5, 1, 7, 0))
+        self.log('Running', 50, datetime(2026, 5, 1, 19, 0))
+        self.assertEqual(self.rows(), [('2026-05-01', 'Running', 2, 60, 150)])
+        
+        morning = Activity.objects.get(pk=morning.pk)
+        morning.activity_type = 'Yoga'
+        morning.date = datetime(2026, 5, 2, 7, 0)
+        morning.save()
+        self.assertEqual(self.rows(), [
+            ('2026-05-01', 'Running', 1, 30, 50),
+            ('2026-05-02', 'Yoga', 1, 30, 100),
+        ])
+        
+        morning.delete()
+        self.assertEqual(self.rows(), [('2026-05-01', 'Running', 1, 30, 50)])
+    
+    def test_rebuild_matches_incremental(self):
+        """Test a rebuild reproduces the incrementally maintained rows"""
+        self.log('Running', 100, datetime(2026, 5, 1, 7, 0))
+        self.log('Cycling', 200, datetime(2026, 5, 1, 8, 0))
+        self.client.post(reverse('activity-bulk'), [{
+            'user_email': 'roller@example.com',
+            'activity_type': 'Running',
+            'duration': 30,
+            'calories': 70,
+            'date': '2026-05-03T06:00:00Z'
+        }], format='json')
+        incremental = self.rows()
+        self.assertEqual(len(incremental), 3)
+        
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(self.rows(), incremental)
+    
+    def test_team_stats_whole_and_partial_days(self):
+        """Test stats agree whether answered from rollups or raw activities"""
+        self.log('Running', 100, datetime(2026, 5, 1, 7, 0))
+        self.log('Running', 40, datetime(2026, 5, 1, 20, 0))
+        self.log('Rowing', 60, datetime(2026, 5, 2, 9, 0))
+        self.assertFalse(rollups.is_whole_days({'$gte': datetime(2026, 5, 1, 12, 0)}))
+        url = reverse('team-stats', args=[str(self.team._id)])
+        
+        whole = self.client.get(url, {'since': '2026-05-01', 'until': '2026-05-01'})
+        self.assertEqual(whole.data['total_activities'], 2)
+        self.assertEqual(whole.data['total_calories'], 140)
+        
+        partial = self.client.get(url, {'since': '2026-05-01T12:00:00Z'})
+        self.assertEqual(partial.data['total_activities'], 2)
+        self.assertEqual(partial.data['total_calories'], 100)
+    
+    def test_recommended_uses_favorite_type(self):
+        """Test recommendations follow the most logged type"""
+        Workout.objects.create(
+            name='Row Hard', description='Rowing', activity_type='Rowing',
+            duration=30, difficulty='Hard', calories_estimate=300
+        )
+        self.log('Rowing', 60, datetime(2026, 5, 2, 9, 0))
+        self.log('Rowing', 60, datetime(2026, 5, 3, 9, 0))
+        self.log('Running', 100, datetime(2026, 5, 1, 7, 0))
+        response = self.client.get(reverse('workout-recommended'), {'email': 'roller@example.com'})
+        self.assertEqual([row['name'] for row in response.data['results']], ['Row Hard'])
+
+
+class LeaderboardStandingTest(APITestCase):
+    """Test cases for rank lookups, neighbourhoods and tie ranking"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        for name, calories in [('a', 300), ('b', 200), ('c', 200), ('d', 100), ('e', 0)]:
+            User.objects.create(name=name.upper(), email=f'{name}@example.com', team='Team Marvel')
+            if calories:
+                Activity.objects.create(
+                    user_email=f'{name}@example.com',
+                    activity_type='Running',
+                    duration=30,
+                    calories=calories,
+                    date=datetime.now()
+                )
+    
+    def test_rank_of_tied_user(self):
+        """Test ties share competition and dense ranks"""
+        response = self.client.get(reverse('leaderboard-rank'), {'email': 'c@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            (response.data['rank'], response.data['competition_rank'], response.data['dense_rank']),
+            (3, 2, 2)
+        )
+        self.assertEqual(response.data['board_size'], 5)
+    
+    def test_around(self):
+        """Test the neighbourhood holds k rows on either side"""
+        response = self.client.get(reverse('leaderboard-around'), {'email': 'c@example.com', 'k': 1})
+        rows = [
+            (row['user_email'], row['competition_rank'], row['dense_rank'])
+            for row in response.data['results']
+        ]
+        self.assertEqual(rows, [
+            ('b@example.com', 2, 2),
+            ('c@example.com', 2, 2),
+            ('d@example.com', 4, 3),
+        ])
+    
+    def test_dense_ranks_follow_writes(self):
+        """Test dense ranks stay exact as totals change and match a rebuild"""
+        activity = Activity.objects.get(user_email='d@example.com')
+        activity.calories = 200
+        activity.save()
+        incremental = [
+            (entry.user_email, entry.rank, entry.dense_rank)
+            for entry in Leaderboard.objects.all().order_by('rank')
+        ]
+        self.assertEqual([row[2] for row in incremental], [1, 2, 2, 2, 3])
+        self.client.post(reverse('leaderboard-refresh'))
+        jobs.drain()
+        self.assertEqual([
+            (entry.user_email, entry.rank, entry.dense_rank)
+            for entry in Leaderboard.objects.all().order_by('rank')
+        ], incremental)
+    
+    def test_unknown_user(self):
+        """Test users without a row get a 404"""
+        response = self.client.get(reverse('leaderboard-rank'), {'email': 'nobody@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class WindowedLeaderboardTest(APITestCase):
+    """Test cases for time-windowed leaderboards"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.now = timezone.now()
+        User.objects.create(name='Early', email='early@example.com', team='Team Marvel')
+        User.objects.create(name='Recent', email='recent@example.com', team='Team DC')
+        self.log('early@example.com', 500, self.now - timedelta(days=45))
+        self.log('early@example.com', 100, self.now)
+        self.recent = self.log('recent@example.com', 200, self.now)
+    
+    def log(self, email, calories, date):
+        return Activity.objects.create(
+            user_email=email,
+            activity_type='Running',
+            duration=30,
+            calories=calories,
+            date=date
+        )
+    
+    def top(self, window):
+        response = self.client.get(reverse('leaderboard-top'), {'window': window})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(row['user_email'], row['total_calories'], row['rank']) for row in response.data]
+    
+    def test_windows_only_count_their_days(self):
+        """Test windowed boards ignore activities outside the window"""
+        self.assertEqual(self.top('all'), [
+            ('early@example.com', 600, 1),
+            ('recent@example.com', 200, 2),
+        ])
+        self.assertEqual(self.top('rolling30'), [
+            ('recent@example.com', 200, 1),
+            ('early@example.com', 100, 2),
+        ])
+    
+    def test_writes_update_built_boards(self):
+        """Test activity writes after the first read re-rank the board"""
+        self.top('week')
+        self.log('early@example.com', 150, self.now)
+        self.assertEqual(self.top('week'), [
+            ('early@example.com', 250, 1),
+            ('recent@example.com', 200, 2),
+        ])
+        self.recent.delete()
+        self.assertEqual(self.top('week'), [('early@example.com', 250, 1)])
+    
+    def test_rows_expire_after_period(self):
+        """Test rows carry an expiry after the end of their period"""
+        self.top('month')
+        start = windows.period_start('month', self.now)
+        end = windows.period_days('month', start)[1]
+        for entry in WindowedLeaderboard.objects.filter(window='month'):
+            self.assertGreater(entry.expires_at.replace(tzinfo=None), end)
+    
+    def test_by_team_and_invalid_window(self):
+        """Test by_team honours the window and unknown windows are rejected"""
+        response = self.client.get(reverse('leaderboard-by-team'), {'team': 'Team DC', 'window': 'rolling30'})
+        self.assertEqual([row['user_email'] for row in response.data['results']], ['recent@example.com'])
+        response = self.client.get(reverse('leaderboard-top'), {'window': 'decade'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ActivityProfileTest(APITestCase):
+    """Test cases for activity profiles and team recommendations"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        User.objects.create(name='Sprinter', email='sprinter@example.com', team='Team Profile')
+        User.objects.create(name='Newcomer', email='newcomer@example.com', team='Team Profile')
+        for name, activity_type, difficulty in [
+            ('Easy Run', 'Running', 'Easy'),
+            ('Hard Run', 'Running', 'Hard'),
+            ('Easy Flow', 'Yoga', 'Easy'),
+        ]:
+            Workout.objects.create(
+                name=name, description=name, activity_type=activity_type,
+                duration=30, difficulty=difficulty, calories_estimate=300
+            )
+    
+    def log(self, activity_type, calories, days_ago=0):
+        return Activity.objects.create(
+            user_email='sprinter@example.com',
+            activity_type=activity_type,
+            duration=30,
+            calories=calories,
+            date=datetime.now() - timedelta(days=days_ago)
+        )
+    
+    def profile(self):
+        return ActivityProfile.objects.mongo_find_one({'user_email': 'sprinter@example.com'})
+    
+    def test_profile_follows_writes(self):
+        """Test type counts (with escaped keys) track creates, edits and deletes"""
+        self.log('Running', 400)
+        chi = self.log('Tai.Chi', 100)
+        self.log('Tai.Chi', 100, days_ago=3)
+        self.assertEqual(profiles.favorite_type(self.profile()), 'Tai.Chi')
+        
+        chi.activity_type = 'Running'
+        chi.save()
+        self.assertEqual(profiles.favorite_type(self.profile()), 'Running')
+        self.assertEqual(self.profile()['activity_count'], 3)
+        
+        Activity.objects.filter(activity_type='Running').delete()
+        self.assertEqual(profiles.favorite_type(self.profile()), 'Tai.Chi')
+        self.assertAlmostEqual(profiles.intensity(self.profile()), 100 / 30)
+    
+    def test_rebuild_matches_incremental(self):
+        """Test rebuilding from the rollups reproduces the incremental profile"""
+        self.log('Running', 400)
+        self.log('Yoga', 90, days_ago=20)
+        incremental = self.profile()
+        profiles.rebuild()
+        rebuilt = self.profile()
+        self.assertEqual(rebuilt['type_counts'], {'Running': 1, 'Yoga': 1})
+        self.assertEqual(rebuilt['activity_count'], incremental['activity_count'])
+        self.assertAlmostEqual(profiles.intensity(rebuilt), profiles.intensity(incremental))
+    
+    def test_recent_activities_weigh_more(self):
+        """Test intensity leans towards recent activities"""
+        self.log('Running', 600)
+        self.log('Yoga', 60, days_ago=60)
+        self.assertGreater(profiles.intensity(self.profile()), (600 + 60) / 60)
+    
+    def test_weights_do_not_overflow(self):
+        """Test activities centuries apart, in any order, keep finite recency-weighted sums"""
+        for year, calories in [(2000, 60), (2150, 600), (2001, 90)]:
+            Activity.objects.create(
+                user_email='sprinter@example.com', activity_type='Running',
+                duration=30, calories=calories, date=datetime(year, 1, 1)
+            )
+        self.assertAlmostEqual(profiles.intensity(self.profile()), 600 / 30)
+        self.assertEqual(self.profile()['weight_day'], datetime(2150, 1, 1))
+        profiles.rebuild()
+        self.assertAlmostEqual(profiles.intensity(self.profile()), 600 / 30)
+    
+    def test_team_recommendations(self):
+        """Test one call recommends for every member"""
+        self.log('Running', 400)
+        with count_mongo_commands() as commands:
+            response = self.client.get(reverse('workout-recommended-for-team'), {'team': 'Team Profile'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(commands), 3)
+        results = {row['user_email']: row for row in response.data['results']}
+        sprinter = results['sprinter@example.com']
+        self.assertEqual(sprinter['preferred_difficulty'], 'Hard')
+        self.assertEqual([workout['name'] for workout in sprinter['workouts']], ['Hard Run', 'Easy Run'])
+        newcomer = results['newcomer@example.com']
+        self.assertIsNone(newcomer['favorite_type'])
+        self.assertEqual([workout['name'] for workout in newcomer['workouts']], ['Easy Run', 'Easy Flow'])
+
+
+class FastReadSerializerTest(TestCase):
+    """Test cases for the read-only serialization fast path"""
+    
+    def setUp(self):
+        Team.objects.create(name='Team Fast', description=None)
+        User.objects.create(name='Fast User', email='fast@example.com', team='Team Fast')
+        User.objects.create(name='Teamless User', email='teamless@example.com', team=None)
+        Activity.objects.create(
+            user_email='fast@example.com',
+            activity_type='Boxing',
+            duration=35,
+            calories=380,
+            date=datetime(2026, 4, 1, 6, 30, 15, 250000)
+        )
+        Workout.objects.create(
+            name='Fast Workout',
+            description='Quick',
+            activity_type='Boxing',
+            duration=35,
+            difficulty='Hard',
+            calories_estimate=380
+        )
+    
+    def test_output_is_byte_identical(self):
+        """Test the fast path renders exactly like the ModelSerializers"""
+        renderer = JSONRenderer()
+        for model, serializer_class in [
+            (User, UserSerializer),
+            (Team, TeamSerializer),
+            (Activity, ActivitySerializer),
+            (Leaderboard, LeaderboardSerializer),
+            (Workout, WorkoutSerializer),
+        ]:
+            queryset = model.objects.order_by('_id')
+            expected = renderer.render(serializer_class(queryset, many=True).data)
+            rows = queryset.values(*FastReadSerializer.source_fields(serializer_class))
+            actual = renderer.render(FastReadSerializer(serializer_class, rows, many=True).data)
+            self.assertEqual(actual, expected, serializer_class.__name__)
+            
+            instance = queryset.first()
+            self.assertEqual(
+                renderer.render(FastReadSerializer(serializer_class, instance).data),
+                renderer.render(serializer_class(instance).data),
+                serializer_class.__name__
+            )
+
+
+class ResponseCacheTest(APITestCase):
+    """Test cases for the versioned response cache"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        caching.reset_stats()
+        Workout.objects.create(
+            name='Cached Workout',
+            description='Read often',
+            activity_type='Yoga',
+            duration=30,
+            difficulty='Easy',
+            calories_estimate=150
+        )
+    
+    def counts(self, label):
+        return caching.stats()['endpoints'][label]
+    
+    def test_repeat_read_is_a_hit(self):
+        """Test the second identical read is served from the cache"""
+        url = reverse('workout-by-difficulty')
+        first = self.client.get(url, {'difficulty': 'Easy'})
+        second = self.client.get(url, {'difficulty': 'Easy'})
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(self.counts('workout-by_difficulty'), {'hits': 1, 'misses': 1})
+    
+    def test_write_invalidates(self):
+        """Test a write to the collection makes the next read a miss"""
+        url = reverse('workout-by-difficulty')
+        self.client.get(url, {'difficulty': 'Easy'})
+        Workout.objects.create(
+            name='Another Workout',
+            description='Fresh',
+            activity_type='Yoga',
+            duration=20,
+            difficulty='Easy',
+            calories_estimate=100
+        )
+        response = self.client.get(url, {'difficulty': 'Easy'})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(self.counts('workout-by_difficulty'), {'hits': 0, 'misses': 2})
+    
+    def test_leaderboard_delta_invalidates(self):
+        """Test raw leaderboard updates from activity writes invalidate top"""
+        User.objects.create(name='Climber', email='climber@example.com', team='Team DC')
+        url = reverse('leaderboard-top')
+        self.client.get(url)
+        Activity.objects.create(
+            user_email='climber@example.com',
+            activity_type='Running',
+            duration=30,
+            calories=321,
+            date=datetime.now()
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.data[0]['total_calories'], 321)
+    
+    def test_stats_endpoint(self):
+        """Test the counters are exposed over the API"""
+        self.client.get(reverse('workout-list'))
+        response = self.client.get(reverse('cache-stats'))
+        self.assertEqual(response.data['misses'], 1)
+
+
+class ConditionalGetTest(APITestCase):
+    """Test cases for ETag / If-None-Match handling"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        Leaderboard.objects.create(
+            user_email='etag@example.com',
+            user_name='ETag User',
+            team='Team Marvel',
+            total_calories=100,
+            total_activities=1,
+            rank=1
+        )
+        self.url = reverse('leaderboard-list')
+    
+    def test_matching_etag_returns_304_without_queries(self):
+        """Test a revalidation with a current ETag skips the database"""
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        with count_mongo_commands() as commands:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(commands, [])
+    
+    def test_write_changes_etag(self):
+        """Test a write to the collection produces a fresh 200"""
+        etag = self.client.get(self.url)['ETag']
+        Leaderboard.objects.create(
+            user_email='etag2@example.com',
+            user_name='Second ETag User',
+            team='Team DC',
+            total_calories=50,
+            total_activities=1,
+            rank=2
+        )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_etag_depends_on_query(self):
+        """Test different query parameters get different ETags"""
+        first = self.client.get(reverse('leaderboard-top'), {'limit': 1})['ETag']
+        second = self.client.get(reverse('leaderboard-top'), {'limit': 2})['ETag']
+        self.assertNotEqual(first, second)
+
+
+class EnsureIndexesTest(TestCase):
+    """Test cases for the ensure_indexes management command"""
+    
+    def test_indexes_cover_query_shapes(self):
+        """Test the command succeeds, leaving no collection scans behind"""
+        call_command('ensure_indexes', stdout=io.StringIO())
+        for label, model, mongo_filter, sort in indexes.QUERY_SHAPES:
+            self.assertNotIn('COLLSCAN', indexes.explain(model, mongo_filter, sort), label)
+    
+    def test_exports_sort_on_indexes(self):
+        """Test filtered exports are ordered by an index rather than an in-memory SORT"""
+        call_command('ensure_indexes', '--skip-explain', stdout=io.StringIO())
+        shapes = [shape for shape in indexes.QUERY_SHAPES if shape[0].startswith('activities.export')]
+        self.assertTrue(shapes)
+        for label, model, mongo_filter, sort in shapes:
+            self.assertEqual(sort, exports.export_sort(mongo_filter), label)
+            self.assertNotIn('SORT', indexes.explain(model, mongo_filter, sort), label)
+    
+    def test_reconcile_is_idempotent(self):
+        """Test a second run has nothing left to do"""
+        call_command('ensure_indexes', '--skip-explain', stdout=io.StringIO())
+        for model in indexes.INDEXES:
+            self.assertEqual(indexes.reconcile(model, dry_run=True), [])
+
+
+class RequiredIndexTest(TestCase):
+    """Test cases for the indexes writers create on first use"""
+    
+    def assert_created(self, model, names, write):
+        """Drop the model's indexes, run ``write`` and check it recreated ``names``"""
+        model.objects.mongo_insert_one({'placeholder': True})
+        model.objects.mongo_drop_indexes()
+        model.objects.mongo_delete_many({'placeholder': True})
+        indexes.forget()
+        write()
+        self.assertTrue(set(names) <= set(model.objects.mongo_index_information()))
+    
+    def test_rollup_unique_key(self):
+        """Test rollup upserts create the unique key their retry depends on"""
+        deltas = {('rollup@example.com', datetime(2026, 1, 5), 'Running'): (1, 30, 300)}
+        self.assert_created(
+            ActivityRollup, ['octofit_rollups_user_day_type'], lambda: rollups.apply_deltas(deltas)
+        )
+        self.assertEqual(ActivityRollup.objects.mongo_count_documents({}), 1)
+    
+    def test_profile_unique_key(self):
+        """Test profile upserts create the unique key their retry depends on"""
+        deltas = {('profile@example.com', datetime(2026, 1, 5), 'Running'): (1, 30, 300)}
+        self.assert_created(ActivityProfile, ['octofit_profiles_email'], lambda: profiles.apply_deltas(deltas))
+        self.assertEqual(ActivityProfile.objects.mongo_count_documents({}), 1)
+    
+    def test_refresh_job_ttl(self):
+        """Test submitting a job creates the index coalescing relies on and the TTL that expires it"""
+        self.assert_created(
+            RefreshJob, ['octofit_refresh_jobs_active', 'octofit_refresh_jobs_expiry'],
+            lambda: jobs.submit('leaderboard'),
+        )
+        jobs.drain()
+    
+    def test_activity_event_ttl(self):
+        """Test publishing events creates the TTL that expires processed ones"""
+        self.assert_created(ActivityEvent, ['octofit_events_expiry'], lambda: Activity.objects.create(
+            user_email='ttl@example.com', activity_type='Running', duration=30, calories=300,
+            date=datetime(2026, 1, 5)
+        ))
+    
+    def test_window_ttls(self):
+        """Test building a windowed board creates the TTLs that expire it"""
+        def build():
+            windows.rebuild_period('week', datetime(2026, 1, 5))
+        
+        self.assert_created(WindowedLeaderboard, ['octofit_windowed_email', 'octofit_windowed_expiry'], build)
+        self.assert_created(LeaderboardWindow, ['octofit_windows_period', 'octofit_windows_expiry'], build)
+
+
+class AsyncEndpointTest(APITestCase):
+    """Test cases for the async read endpoints under /api/async/"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        for i in range(3):
+            User.objects.create(name=f'Async User {i}', email=f'async{i}@example.com', team='Team Marvel')
+        start = datetime(2026, 1, 1, 8, 0)
+        for i in range(7):
+            Activity.objects.create(
+                user_email=f'async{i % 2}@example.com',
+                activity_type='Running' if i % 3 else 'Cycling',
+                duration=30,
+                calories=100 + i,
+                date=start + timedelta(days=i // 2)
+            )
+        for name, activity_type, difficulty in [
+            ('Tempo Run', 'Running', 'Medium'), ('Easy Spin', 'Cycling', 'Easy'), ('Hill Sprints', 'Running', 'Hard')
+        ]:
+            Workout.objects.create(
+                name=name,
+                description='Test workout',
+                activity_type=activity_type,
+                duration=30,
+                difficulty=difficulty,
+                calories_estimate=300
+            )
+    
+    def both(self, name, params):
+        """Responses of the sync endpoint and its async counterpart"""
+        return self.client.get(reverse(name), params), self.client.get(reverse(f'async-{name}'), params)
+    
+    def test_leaderboard_top_matches_sync(self):
+        """Test top renders the same rows on both paths, windowed boards included"""
+        for params in [{'limit': 2}, {'fields': 'user_email,rank'}, {'window': 'week'}]:
+            sync, async_ = self.both('leaderboard-top', params)
+            self.assertEqual(async_.status_code, status.HTTP_200_OK, params)
+            self.assertEqual(async_.json(), sync.json(), params)
+    
+    def test_activities_by_user_pages_match_sync(self):
+        """Test async pages are the sync pages and cursors carry over to the sync path"""
+        params = {'email': 'async0@example.com', 'page_size': 2}
+        sync, async_ = self.both('activity-by-user', params)
+        self.assertEqual(async_.json()['results'], sync.json()['results'])
+        cursor = parse_qs(urlparse(async_.json()['next']).query)['cursor'][0]
+        sync, async_ = self.both('activity-by-user', {**params, 'cursor': cursor})
+        self.assertEqual(async_.json()['results'], sync.json()['results'])
+        self.assertEqual(len(sync.json()['results']), 2)
+    
+    def test_workouts_recommended_matches_sync(self):
+        """Test recommendations with and without activity history"""
+        for email in ['async0@example.com', 'async2@example.com']:
+            sync, async_ = self.both('workout-recommended', {'email': email})
+            self.assertEqual(async_.json()['results'], sync.json()['results'], email)
+    
+    def test_errors(self):
+        """Test missing parameters, unknown fields, bad cursors and writes are rejected"""
+        response = self.client.get(reverse('async-activity-by-user'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.json())
+        response = self.client.get(reverse('async-leaderboard-top'), {'fields': 'bogus'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(
+            reverse('async-activity-by-user'), {'email': 'async0@example.com', 'cursor': 'not-a-cursor'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(reverse('async-workout-recommended'), {'email': 'async0@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class RequestMetricsTest(APITestCase):
+    """Test cases for the Server-Timing header and the metrics endpoint"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        metrics.reset()
+        User.objects.create(name='Timed User', email='timed@example.com', team='Team Marvel')
+    
+    def test_server_timing_header(self):
+        """Test responses report their MongoDB commands, phases and size"""
+        response = self.client.get(reverse('user-list'))
+        timing = dict(
+            entry.strip().split(';', 1) for entry in response['Server-Timing'].split(',')
+        )
+        self.assertEqual(set(timing), {'db', 'serialize', 'app', 'total', 'size'})
+        queries = int(timing['db'].split('desc="')[1].split(' ')[0])
+        self.assertGreaterEqual(queries, 1)
+        self.assertEqual(timing['size'], f'desc="{len(response.content)} bytes"')
+    
+    def test_metrics_endpoint(self):
+        """Test requests are aggregated per endpoint in Prometheus format"""
+        self.client.get(reverse('user-list'))
+        self.client.get(reverse('user-list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertIn('octofit_requests_total{endpoint="user-list",method="GET",status="200"} 2', text)
+        self.assertIn('octofit_request_duration_seconds_bucket{endpoint="user-list",method="GET",le="+Inf"} 2', text)
+        self.assertIn('octofit_request_duration_seconds_count{endpoint="user-list",method="GET"} 2', text)
+
+
+class PopulateDbTest(TestCase):
+    """Test cases for the synthetic dataset generator of populate_db"""
+    
+    spec = {
+        'users': 2500, 'teams': 4, 'activities_per_user': 3, 'days': 7, 'seed': 7,
+        'end': datetime(2026, 1, 1),
+    }
+    
+    def test_generation_is_deterministic(self):
+        """Test the same spec gives the same documents and another seed does not"""
+        self.assertEqual(datagen.chunk_count(self.spec), 3)
+        self.assertEqual(datagen.generate_chunk(self.spec, 1), datagen.generate_chunk(self.spec, 1))
+        self.assertNotEqual(
+            datagen.generate_chunk(self.spec, 1), datagen.generate_chunk({**self.spec, 'seed': 8}, 1)
+        )
+        users, activities = datagen.generate_chunk(self.spec, 2)
+        self.assertEqual((len(users), len(activities)), (500, 1500))
+        for activity in activities:
+            self.assertTrue(datetime(2025, 12, 25) <= activity['date'] < datetime(2026, 1, 1))
+    
+    def test_synthetic_dataset(self):
+        """Test the command inserts the dataset and builds the derived collections"""
+        call_command(
+            'populate_db', '--users', '25', '--teams', '3', '--activities-per-user', '4',
+            '--workers', '1', '--end-date', '2026-01-01', stdout=io.StringIO()
+        )
+        self.assertEqual(Team.objects.count(), 3)
+        self.assertEqual(User.objects.count(), 25)
+        self.assertEqual(Activity.objects.count(), 100)
+        self.assertEqual(Leaderboard.objects.count(), 25)
+        self.assertEqual(ActivityProfile.objects.count(), 25)
+        self.assertEqual(sum(ActivityRollup.objects.values_list('count', flat=True)), 100)
+
+
+class QueryBudgetTest(APITestCase):
+    """Test every benchmarked endpoint stays within its query budget (see bench_endpoints)"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        # More teams than fit the budget, so a per-team query shows up
+        call_command(
+            'populate_db', '--users', '40', '--teams', '12', '--activities-per-user', '3',
+            '--workers', '1', '--end-date', '2026-01-01', stdout=io.StringIO()
+        )
+    
+    def test_endpoints_within_budget(self):
+        """Test query counts against the budgets in bench_baseline.json"""
+        budgets = load_baseline()['budgets']
+        user = User.objects.mongo_find_one({}, sort=[('_id', 1)])
+        team = Team.objects.mongo_find_one({'name': user['team']})
+        for endpoint, method, path in endpoint_requests(user['email'], str(team['_id']), team['name']):
+            cache.clear()
+            _, queries = measure(self.client, method, path)
+            self.assertLessEqual(queries, budgets[endpoint], endpoint)
+        # leaderboard.refresh left a job running
+        jobs.drain()
+
+
+class BenchEndpointsTest(TestCase):
+    """Test cases for the bench_endpoints baseline comparison"""
+    
+    def test_missing_baseline_warns(self):
+        """Test bench_endpoints warns when there are no timings to compare with, and fails only if told to"""
+        command = BenchEndpointsCommand(stdout=io.StringIO())
+        baseline = {'budgets': {'users.list': 2}, 'results': {}}
+        results = {'small': {'users.list': {'p50_ms': 1.0, 'p95_ms': 2.0, 'queries': 2}}}
+        options = {'tolerance': 0.5, 'fail_on_latency': False, 'update_baseline': False}
+        self.assertEqual(command.compare(baseline, results, {**options, 'require_baseline': False}), [])
+        self.assertIn('WARNING', command.stdout.getvalue())
+        failures = command.compare(baseline, results, {**options, 'require_baseline': True})
+        self.assertEqual(len(failures), 1)
+        self.assertIn('no baseline timings for users.list', failures[0])
+        baseline['results'] = results
+        self.assertEqual(command.compare(baseline, results, {**options, 'require_baseline': True}), [])
+
+
+class LoadGeneratorTest(TestCase):
+    """Test cases for the loadtest histogram and operation mix"""
+    
+    def test_histogram_percentiles(self):
+        """Test percentiles stay within the histogram's relative precision"""
+        histogram = LatencyHistogram()
+        for microseconds in range(1, 100001):
+            histogram.record(microseconds / 1000000)
+        self.assertEqual(histogram.total, 100000)
+        for fraction in (0.5, 0.99, 0.999):
+            exact = fraction * 100000
+            self.assertGreaterEqual(histogram.percentile(fraction), exact)
+            self.assertLessEqual(histogram.percentile(fraction), exact * 1.01)
+        self.assertEqual(histogram.percentile(1.0), 100000)
+        self.assertEqual(histogram.summary()['min'], 0.001)
+    
+    def test_histogram_merge(self):
+        """Test merged histograms match one histogram of all values"""
+        combined, first, second = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+        for microseconds in range(1, 5001):
+            combined.record(microseconds / 1000000)
+            (first if microseconds % 2 else second).record(microseconds / 1000000)
+        first.merge(second)
+        self.assertEqual(first.summary(), combined.summary())
+    
+    def test_parse_mix(self):
+        """Test operation weights are parsed and validated"""
+        self.assertEqual(parse_mix('post_activity=1,by_user=3'), {'post_activity': 1.0, 'by_user': 3.0})
+        self.assertEqual(parse_mix('team_stats'), {'team_stats': 1.0})
+        for mix in ('unknown=1', 'by_user=-1', 'by_user=0', 'by_user=x'):
+            with self.assertRaises(ValueError):
+                parse_mix(mix)
+
+
+class LiveLeaderboardTest(APITestCase):
+    """Test cases for the live leaderboard stream"""
+    
+    def setUp(self):
+        for name, calories in (('alice', 300), ('bob', 200), ('carol', 100)):
+            User.objects.create(name=name.title(), email=f'{name}@example.com', team='Blue')
+            self.log(f'{name}@example.com', calories)
+    
+    def log(self, user_email, calories):
+        Activity.objects.create(
+            user_email=user_email, activity_type='Running', duration=30, calories=calories, date=timezone.now()
+        )
+    
+    @staticmethod
+    def row(user_email, rank, calories):
+        return {
+            'user_email': user_email, 'user_name': 'x', 'team': 'Blue', 'total_calories': calories,
+            'total_activities': 1, 'rank': rank, 'dense_rank': rank,
+        }
+    
+    @staticmethod
+    def parse(message):
+        """Name and data of one server-sent event"""
+        fields = dict(line.split(': ', 1) for line in message['body'].decode().strip().split('\n'))
+        return fields['event'], json.loads(fields['data'])
+    
+    def test_diff(self):
+        """Test diffs carry only changed fields, new rows in full and rows that left the top"""
+        previous = {row['user_email']: row for row in [
+            self.row('a@x', 1, 300), self.row('b@x', 2, 200), self.row('c@x', 3, 100),
+        ]}
+        current = {row['user_email']: row for row in [
+            self.row('c@x', 1, 400), self.row('a@x', 2, 300), self.row('b@x', 3, 200),
+        ]}
+        changed, removed = live.diff(previous, current, 2)
+        self.assertEqual(changed, [
+            self.row('c@x', 1, 400),
+            {'user_email': 'a@x', 'rank': 2, 'dense_rank': 2},
+        ])
+        self.assertEqual(removed, ['b@x'])
+    
+    def test_slow_subscriber_gets_merged_diffs(self):
+        """Test diffs pushed between two sends are merged into one"""
+        subscriber = live.Subscriber(10)
+        subscriber.push(1, [{'user_email': 'a@x', 'rank': 2}, self.row('b@x', 3, 50)], ['c@x'])
+        subscriber.push(2, [{'user_email': 'a@x', 'total_calories': 500, 'rank': 1}], ['b@x'])
+        self.assertEqual(subscriber.take(), {
+            'version': 2,
+            'changed': [{'user_email': 'a@x', 'rank': 1, 'total_calories': 500}],
+            'removed': ['b@x', 'c@x'],
+        })
+        self.assertFalse(subscriber.ready.is_set())
+    
+    @override_settings(LIVE_LEADERBOARD_TICK=0.05)
+    def test_stream_sends_snapshot_then_diffs(self):
+        """Test a client gets the top rows, then only the changes from a write"""
+        async def scenario():
+            communicator = ApplicationCommunicator(live.leaderboard_stream, {
+                'type': 'http', 'method': 'GET', 'path': live.PATH, 'query_string': b'limit=2', 'headers': [],
+            })
+            await communicator.send_input({'type': 'http.request'})
+            start = await communicator.receive_output(5)
+            snapshot = self.parse(await communicator.receive_output(5))
+            await sync_to_async(self.log)('carol@example.com', 500)
+            diff = self.parse(await communicator.receive_output(5))
+            await communicator.send_input({'type': 'http.disconnect'})
+            await communicator.wait(5)
+            return start, snapshot, diff
+        
+        start, (snapshot_event, snapshot), (diff_event, diff) = async_to_sync(scenario)()
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream; charset=utf-8'), start['headers'])
+        self.assertEqual(snapshot_event, 'snapshot')
+        self.assertEqual([row['user_email'] for row in snapshot['results']], ['alice@example.com', 'bob@example.com'])
+        self.assertEqual(diff_event, 'diff')
+        self.assertEqual(diff['changed'][0], {
+            'user_email': 'carol@example.com', 'user_name': 'Carol', 'team': 'Blue', 'total_calories': 600,
+            'total_activities': 2, 'rank': 1, 'dense_rank': 1,
+        })
+        self.assertIn({'user_email': 'alice@example.com', 'rank': 2, 'dense_rank': 2}, diff['changed'])
+        self.assertEqual(diff['removed'], ['bob@example.com'])
+    
+    def test_invalid_limit(self):
+        """Test an out of range limit gets a 400"""
+        async def scenario():
+            communicator = ApplicationCommunicator(live.leaderboard_stream, {
+                'type': 'http', 'method': 'GET', 'path': live.PATH, 'query_string': b'limit=0', 'headers': [],
+            })
+            await communicator.send_input({'type': 'http.request'})
+            return await communicator.receive_output(5), await communicator.receive_output(5)
+        
+        start, body = async_to_sync(scenario)()
+        self.assertEqual(start['status'], 400)
+        self.assertIn(b'limit must be', body['body'])
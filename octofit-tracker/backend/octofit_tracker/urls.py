@@ -20,12 +20,15 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 import os
+from . import async_views
 from .views import (
     UserViewSet,
     TeamViewSet,
     ActivityViewSet,
     LeaderboardViewSet,
-    WorkoutViewSet
+    WorkoutViewSet,
+    cache_stats,
+    request_metrics
 )
 
 # Create router and register viewsets
@@ -55,20 +58,36 @@ def api_root(request, format=None):
             'activities': f"{base_url}/api/activities/",
             'leaderboard': f"{base_url}/api/leaderboard/",
             'workouts': f"{base_url}/api/workouts/",
+            'cache_stats': f"{base_url}/api/_cache/",
+            'metrics': f"{base_url}/api/_metrics",
             'admin': f"{base_url}/admin/",
         },
         'custom_endpoints': {
             'users_by_team': f"{base_url}/api/users/by_team/?team=<team_name>",
             'team_members': f"{base_url}/api/teams/<id>/members/",
-            'team_stats': f"{base_url}/api/teams/<id>/stats/",
+            'team_stats': f"{base_url}/api/teams/<id>/stats/?since=<date>&until=<date>&activity_type=<type>",
             'activities_by_user': f"{base_url}/api/activities/by_user/?email=<email>",
             'activities_by_type': f"{base_url}/api/activities/by_type/?type=<type>",
-            'leaderboard_top': f"{base_url}/api/leaderboard/top/?limit=<n>",
-            'leaderboard_by_team': f"{base_url}/api/leaderboard/by_team/?team=<team_name>",
+            'activities_bulk': f"{base_url}/api/activities/bulk/",
+            'activities_export': f"{base_url}/api/activities/export/?format=<ndjson|csv>&email=<email>&team=<team_name>&since=<date>&until=<date>",
+            'leaderboard_top': f"{base_url}/api/leaderboard/top/?limit=<n>&window=<all|week|month|rolling30>",
+            'leaderboard_by_team': f"{base_url}/api/leaderboard/by_team/?team=<team_name>&window=<all|week|month|rolling30>",
+            'leaderboard_rank': f"{base_url}/api/leaderboard/rank/?email=<email>&window=<all|week|month|rolling30>",
+            'leaderboard_around': f"{base_url}/api/leaderboard/around/?email=<email>&k=<n>&window=<all|week|month|rolling30>",
             'leaderboard_refresh': f"{base_url}/api/leaderboard/refresh/",
+            'leaderboard_refresh_status': f"{base_url}/api/leaderboard/refresh/<job_id>/",
             'workouts_by_type': f"{base_url}/api/workouts/by_type/?type=<type>",
             'workouts_by_difficulty': f"{base_url}/api/workouts/by_difficulty/?difficulty=<difficulty>",
             'workouts_recommended': f"{base_url}/api/workouts/recommended/?email=<email>",
+            'workouts_recommended_for_team': f"{base_url}/api/workouts/recommended_for_team/?team=<team_name>&limit=<n>",
+        },
+        'live': {
+            'leaderboard': f"{base_url}/api/live/leaderboard/?limit=<n> (Server-Sent Events, ASGI only)",
+        },
+        'async_endpoints': {
+            'leaderboard_top': f"{base_url}/api/async/leaderboard/top/?limit=<n>&window=<all|week|month|rolling30>",
+            'activities_by_user': f"{base_url}/api/async/activities/by_user/?email=<email>",
+            'workouts_recommended': f"{base_url}/api/async/workouts/recommended/?email=<email>",
         }
     })
 
@@ -76,5 +95,10 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', api_root, name='api-root'),
     path('api/', api_root, name='api-root-alternate'),
+    path('api/_cache/', cache_stats, name='cache-stats'),
+    path('api/_metrics', request_metrics, name='metrics'),
+    path('api/async/leaderboard/top/', async_views.leaderboard_top, name='async-leaderboard-top'),
+    path('api/async/activities/by_user/', async_views.activities_by_user, name='async-activity-by-user'),
+    path('api/async/workouts/recommended/', async_views.workouts_recommended, name='async-workout-recommended'),
     path('api/', include(router.urls)),
 ]
@@ -1,18 +1,180 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import APIException
+from rest_framework.reverse import reverse
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
+from django.http import HttpResponse, StreamingHttpResponse
 from django.db.models import Sum, Count
-from .models import User, Team, Activity, Leaderboard, Workout
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import parse_etags
+from datetime import datetime, time, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import BulkWriteError
+from . import caching, events, exports, jobs, leaderboard, metrics, owners, profiles, rollups, windows
+from .caching import cached_response
+from .pagination import ActivityPagination, LeaderboardPagination
+from .renderers import CSVRenderer, NDJSONRenderer
+from .signals import ACTIVITY_FIELDS
+from .models import (
+    User, Team, Activity, ActivityRollup, ActivityProfile, Leaderboard, WindowedLeaderboard, RefreshJob, Workout
+)
 from .serializers import (
     UserSerializer, 
     TeamSerializer, 
     ActivitySerializer, 
     LeaderboardSerializer, 
-    WorkoutSerializer
+    WindowedLeaderboardSerializer,
+    RefreshJobSerializer,
+    WorkoutSerializer,
+    FastReadSerializer
 )
 
 
-class UserViewSet(viewsets.ModelViewSet):
+def _parse_datetime_param(name, value):
+    """Parse an ISO date or datetime query parameter into an aware datetime"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"{name} must be an ISO date or datetime")
+        parsed = datetime.combine(day, time.min)
+        if name == 'until':
+            # A bare date includes the whole day
+            parsed += timedelta(days=1)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_date_range(params):
+    """
+    Build a Mongo date filter from the since/until query parameters.
+    since is inclusive and until is exclusive; returns None if neither is given.
+    """
+    date_range = {}
+    if params.get('since'):
+        date_range['$gte'] = _parse_datetime_param('since', params['since'])
+    if params.get('until'):
+        date_range['$lt'] = _parse_datetime_param('until', params['until'])
+    return date_range or None
+
+
+class InvalidFields(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Unknown fields.'
+
+
+class PaginatedModelViewSet(viewsets.ModelViewSet):
+    """
+    ModelViewSet whose list endpoints are keyset-paginated.
+    Reads (list, retrieve and the custom list actions) are serialized with
+    FastReadSerializer from projected values instead of full model instances.
+    ?fields=a,b narrows both the output and the MongoDB projection.
+    """
+    fields_query_param = 'fields'
+    
+    def list(self, request, *args, **kwargs):
+        return self.paginated_response(self.filter_queryset(self.get_queryset()))
+    
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(
+            self.read_values(self.filter_queryset(self.get_queryset())),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        self.check_object_permissions(request, row)
+        return Response(FastReadSerializer(
+            self.get_serializer_class(), row, fields=self.requested_fields()
+        ).data)
+    
+    def handle_exception(self, exc):
+        if isinstance(exc, InvalidFields):
+            return Response({"error": exc.detail}, status=status.HTTP_400_BAD_REQUEST)
+        return super().handle_exception(exc)
+    
+    def requested_fields(self, serializer_class=None):
+        """Fields named by ?fields= in output order, or None when the parameter is absent"""
+        serializer_class = serializer_class or self.get_serializer_class()
+        param = self.request.query_params.get(self.fields_query_param, '')
+        try:
+            return FastReadSerializer.parse_fields(serializer_class, param)
+        except ValueError as error:
+            raise InvalidFields(str(error))
+    
+    def read_values(self, queryset, serializer_class=None, extra=()):
+        """Project queryset onto the (requested) fields the serializer outputs, plus extra"""
+        serializer_class = serializer_class or self.get_serializer_class()
+        names = FastReadSerializer.source_fields(serializer_class, self.requested_fields(serializer_class))
+        names += [name for name in extra if name not in names]
+        return queryset.values(*names)
+    
+    def paginated_response(self, queryset, serializer_class=None):
+        """Serialize one keyset page of queryset"""
+        serializer_class = serializer_class or self.get_serializer_class()
+        fields = self.requested_fields(serializer_class)
+        # The cursor is built from the ordering fields, requested or not
+        ordering = [field.lstrip('-') for field in getattr(self.paginator, 'ordering', ())]
+        rows = self.read_values(queryset, serializer_class, extra=ordering)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(FastReadSerializer(serializer_class, rows, many=True, fields=fields).data)
+        return self.get_paginated_response(
+            FastReadSerializer(serializer_class, page, many=True, fields=fields).data
+        )
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+    default_detail = 'Not modified.'
+
+
+class ConditionalGetMixin:
+    """
+    Strong ETags on GET requests, derived from collection versions.
+
+    A matching If-None-Match is answered with 304 before the handler runs,
+    so neither the query nor the serializer is executed. ``etag_collections``
+    lists the models a viewset's responses are built from and
+    ``etag_action_collections`` overrides it per action.
+    """
+    etag_collections = ()
+    etag_action_collections = {}
+    
+    def cache_variant(self, request):
+        """Extra ETag and response cache key input; see caching.response_key"""
+        return ''
+    
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        if request.method not in ('GET', 'HEAD'):
+            return
+        collections = self.etag_action_collections.get(self.action, self.etag_collections)
+        self.etag = caching.etag_for(
+            request, f'{self.basename}-{self.action}', collections, self.cache_variant(request)
+        )
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            tags = [tag.removeprefix('W/') for tag in parse_etags(if_none_match)]
+            if '*' in tags or self.etag in tags:
+                raise NotModified()
+    
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': self.etag})
+        return super().handle_exception(exc)
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'etag', None) and response.status_code == status.HTTP_200_OK:
+            response['ETag'] = self.etag
+        return response
+
+
+class UserViewSet(PaginatedModelViewSet):
     """
     API endpoint for users.
     Provides CRUD operations for user management.
@@ -26,50 +188,94 @@ class UserViewSet(viewsets.ModelViewSet):
         team = request.query_params.get('team', None)
         if team:
             users = User.objects.filter(team=team)
-            serializer = self.get_serializer(users, many=True)
-            return Response(serializer.data)
+            return self.paginated_response(users)
         return Response({"error": "Team parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TeamViewSet(viewsets.ModelViewSet):
+class TeamViewSet(ConditionalGetMixin, PaginatedModelViewSet):
     """
     API endpoint for teams.
     Provides CRUD operations for team management.
     """
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
+    etag_collections = (Team, User)
+    etag_action_collections = {'stats': (Team, User, Activity, ActivityRollup)}
     
     @action(detail=True, methods=['get'])
+    @cached_response(Team, User)
     def members(self, request, pk=None):
         """Get all members of a specific team"""
         team = self.get_object()
         users = User.objects.filter(team=team.name)
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(users, UserSerializer)
     
     @action(detail=True, methods=['get'])
     def stats(self, request, pk=None):
-        """Get team statistics"""
+        """
+        Get team statistics, optionally limited by since/until/activity_type.
+        Totals and the per-type breakdown are computed by MongoDB, from the
+        daily rollups unless since/until fall inside a day, matching the
+        team id stamped on them (see ``owners``).
+        """
         team = self.get_object()
-        members = User.objects.filter(team=team.name)
-        activities = Activity.objects.filter(user_email__in=[m.email for m in members])
+        try:
+            date_range = parse_date_range(request.query_params)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if rollups.is_whole_days(date_range):
+            source, date_field, count = ActivityRollup, 'day', '$count'
+        else:
+            source, date_field, count = Activity, 'date', 1
+        
+        match = {'team_id': team.pk}
+        if date_range:
+            match[date_field] = date_range
+        activity_type = request.query_params.get('activity_type', None)
+        if activity_type:
+            match['activity_type'] = activity_type
+        
+        by_type = list(source.objects.mongo_aggregate([
+            {'$match': match},
+            {'$group': {
+                '_id': '$activity_type',
+                'total_activities': {'$sum': count},
+                'total_calories': {'$sum': '$calories'},
+                'total_duration': {'$sum': '$duration'},
+            }},
+            {'$sort': {'total_calories': -1, '_id': 1}},
+        ]))
         
         stats = {
             'team_name': team.name,
-            'total_members': members.count(),
-            'total_activities': activities.count(),
-            'total_calories': sum(a.calories for a in activities),
+            'total_members': User.objects.mongo_count_documents({'team': team.name}),
+            'total_activities': sum(row['total_activities'] for row in by_type),
+            'total_calories': sum(row['total_calories'] for row in by_type),
+            'total_duration': sum(row['total_duration'] for row in by_type),
+            'by_activity_type': [
+                {
+                    'activity_type': row['_id'],
+                    'total_activities': row['total_activities'],
+                    'total_calories': row['total_calories'],
+                    'total_duration': row['total_duration'],
+                }
+                for row in by_type
+            ],
         }
         return Response(stats)
 
 
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(PaginatedModelViewSet):
     """
     API endpoint for activities.
     Provides CRUD operations for activity logging.
     """
     queryset = Activity.objects.all()
     serializer_class = ActivitySerializer
+    pagination_class = ActivityPagination
+    bulk_max_items = 5000
+    bulk_chunk_size = 500
     
     @action(detail=False, methods=['get'])
     def by_user(self, request):
@@ -77,8 +283,7 @@ class ActivityViewSet(viewsets.ModelViewSet):
         email = request.query_params.get('email', None)
         if email:
             activities = Activity.objects.filter(user_email=email).order_by('-date')
-            serializer = self.get_serializer(activities, many=True)
-            return Response(serializer.data)
+            return self.paginated_response(activities)
         return Response({"error": "Email parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=['get'])
@@ -87,98 +292,300 @@ class ActivityViewSet(viewsets.ModelViewSet):
         activity_type = request.query_params.get('type', None)
         if activity_type:
             activities = Activity.objects.filter(activity_type=activity_type).order_by('-date')
-            serializer = self.get_serializer(activities, many=True)
-            return Response(serializer.data)
+            return self.paginated_response(activities)
         return Response({"error": "Type parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
 
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create many activities from a JSON array.
+        Valid items are inserted one chunk at a time and invalid ones are reported
+        per index without failing the batch; the inserts are published as one batch of activity events.
+        """
+        items = request.data
+        if not isinstance(items, list):
+            return Response({"error": "Expected a JSON array of activities"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.bulk_max_items:
+            return Response(
+                {"error": f"At most {self.bulk_max_items} activities per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        results = [None] * len(items)
+        pending = []
+        now = timezone.now()
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                pending.append((index, {**serializer.validated_data, 'created_at': now}))
+            else:
+                results[index] = {'index': index, 'errors': serializer.errors}
+        owners.stamp([doc for _, doc in pending])
+        
+        inserted = []
+        for start in range(0, len(pending), self.bulk_chunk_size):
+            chunk = pending[start:start + self.bulk_chunk_size]
+            failed = {}
+            try:
+                Activity.objects.mongo_insert_many([doc for _, doc in chunk], ordered=False)
+            except BulkWriteError as error:
+                for write_error in error.details.get('writeErrors', []):
+                    failed[write_error['index']] = write_error.get('errmsg', 'Write failed')
+            for position, (index, doc) in enumerate(chunk):
+                if position in failed:
+                    results[index] = {'index': index, 'errors': {'non_field_errors': [failed[position]]}}
+                    continue
+                results[index] = {'index': index, '_id': str(doc['_id'])}
+                inserted.append(doc)
+        if inserted:
+            caching.bump_version(Activity)
+        events.publish([
+            (doc['_id'], None, {field: doc[field] for field in ACTIVITY_FIELDS}) for doc in inserted
+        ])
+        
+        created = sum(1 for result in results if '_id' in result)
+        if created == len(items):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(
+            {'created': created, 'failed': len(items) - created, 'results': results},
+            status=response_status
+        )
+    
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """
+        Stream activities as NDJSON (default) or CSV (?format=csv).
+        Accepts the email/type filters of by_user/by_type plus team, since, until and fields;
+        every filter given applies, so email and team together export that user's activities
+        logged while in the team.
+        """
+        try:
+            date_range = parse_date_range(request.query_params)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        mongo_filter = {}
+        email = request.query_params.get('email', None)
+        team = request.query_params.get('team', None)
+        if email:
+            mongo_filter['user_email'] = email
+        if team:
+            team_id = owners.team_ids([team]).get(team)
+            if team_id is not None:
+                mongo_filter['team_id'] = team_id
+            else:
+                # A team name no Team is saved under yet
+                members = {'team': team, **({'email': email} if email else {})}
+                mongo_filter['user_email'] = {'$in': User.objects.mongo_distinct('email', members)}
+        activity_type = request.query_params.get('type', None)
+        if activity_type:
+            mongo_filter['activity_type'] = activity_type
+        if date_range:
+            mongo_filter['date'] = date_range
+        
+        renderer = request.accepted_renderer
+        fields = self.requested_fields() or exports.EXPORT_FIELDS
+        rows = exports.export_rows(mongo_filter, fields)
+        if renderer.format == 'csv':
+            content = exports.stream_csv(rows, fields)
+        else:
+            content = exports.stream_ndjson(rows)
+        response = StreamingHttpResponse(content, content_type=f'{renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="activities.{renderer.format}"'
+        return response
 
-class LeaderboardViewSet(viewsets.ModelViewSet):
+class LeaderboardViewSet(ConditionalGetMixin, PaginatedModelViewSet):
     """
     API endpoint for leaderboard.
     Provides access to competitive rankings.
+    top and by_team accept ?window=week|month|rolling30 for time-windowed boards.
     """
     queryset = Leaderboard.objects.all().order_by('rank')
     serializer_class = LeaderboardSerializer
+    pagination_class = LeaderboardPagination
+    etag_collections = (Leaderboard, WindowedLeaderboard)
+    etag_action_collections = {'refresh_status': (RefreshJob,)}
+    around_max_k = 50
+    
+    def cache_variant(self, request):
+        """Current period of ?window=, so cached boards roll over with it"""
+        window = request.query_params.get('window', None)
+        if window in windows.WINDOWS:
+            return windows.period_start(window, timezone.now()).isoformat()
+        return ''
+    
+    def board(self, request):
+        """
+        (model, filter, serializer) of the board named by ?window= (all-time by default).
+        Raises ValueError for an unknown window.
+        """
+        window = request.query_params.get('window', 'all')
+        if window == 'all':
+            return Leaderboard, {}, LeaderboardSerializer
+        if window not in windows.WINDOWS:
+            raise ValueError(f"window must be one of: all, {', '.join(windows.WINDOWS)}")
+        start = windows.ensure_built(window, timezone.now())
+        return WindowedLeaderboard, {'window': window, 'period_start': start}, WindowedLeaderboardSerializer
     
     @action(detail=False, methods=['get'])
+    @cached_response(Leaderboard, WindowedLeaderboard)
     def top(self, request):
         """Get top N users from leaderboard"""
-        limit = int(request.query_params.get('limit', 10))
-        top_users = Leaderboard.objects.all().order_by('rank')[:limit]
-        serializer = self.get_serializer(top_users, many=True)
-        return Response(serializer.data)
+        try:
+            model, scope, serializer_class = self.board(request)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', 10))
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return Response({"error": "limit must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(limit, LeaderboardPagination.max_page_size)
+        board = model.objects.filter(**scope).order_by('rank', 'user_email')
+        top_users = self.read_values(board, serializer_class)[:limit]
+        return Response(FastReadSerializer(
+            serializer_class, top_users, many=True, fields=self.requested_fields(serializer_class)
+        ).data)
     
     @action(detail=False, methods=['get'])
+    @cached_response(Leaderboard, WindowedLeaderboard)
     def by_team(self, request):
         """Get leaderboard filtered by team"""
         team = request.query_params.get('team', None)
         if team:
-            team_leaderboard = Leaderboard.objects.filter(team=team).order_by('rank')
-            serializer = self.get_serializer(team_leaderboard, many=True)
-            return Response(serializer.data)
+            try:
+                model, scope, serializer_class = self.board(request)
+            except ValueError as error:
+                return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+            team_leaderboard = model.objects.filter(**scope, team=team).order_by('rank')
+            return self.paginated_response(team_leaderboard, serializer_class)
         return Response({"error": "Team parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
     
+    def ranked_rows(self, serializer_class, rows):
+        """Serialize board rows and keep their competition ranks"""
+        data = FastReadSerializer(
+            serializer_class, rows, many=True, fields=self.requested_fields(serializer_class)
+        ).data
+        for item, row in zip(data, rows):
+            item['competition_rank'] = row['competition_rank']
+        return data
+    
+    @action(detail=False, methods=['get'])
+    @cached_response(Leaderboard, WindowedLeaderboard)
+    def rank(self, request):
+        """
+        Get one user's standing by email.
+        rank is the position on the board, competition_rank and dense_rank rank ties equally.
+        """
+        email = request.query_params.get('email', None)
+        if not email:
+            return Response({"error": "Email parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            model, scope, serializer_class = self.board(request)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        rows = leaderboard.neighbourhood(model, email, 0, scope)
+        if rows is None:
+            return Response({"error": "User is not on the leaderboard"}, status=status.HTTP_404_NOT_FOUND)
+        data = self.ranked_rows(serializer_class, rows)[0]
+        data['board_size'] = leaderboard.board_size(model, scope)
+        return Response(data)
+    
+    @action(detail=False, methods=['get'])
+    @cached_response(Leaderboard, WindowedLeaderboard)
+    def around(self, request):
+        """Get the k entries above and below a user (default 5, at most around_max_k)"""
+        email = request.query_params.get('email', None)
+        if not email:
+            return Response({"error": "Email parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            k = int(request.query_params.get('k', 5))
+            if k < 0:
+                raise ValueError
+        except ValueError:
+            return Response({"error": "k must be a non-negative integer"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            model, scope, serializer_class = self.board(request)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        rows = leaderboard.neighbourhood(model, email, min(k, self.around_max_k), scope)
+        if rows is None:
+            return Response({"error": "User is not on the leaderboard"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'user_email': email, 'results': self.ranked_rows(serializer_class, rows)})
+    
     @action(detail=False, methods=['post'])
     def refresh(self, request):
-        """Refresh leaderboard based on current activities"""
-        # Delete existing leaderboard entries
-        Leaderboard.objects.all().delete()
-        
-        # Get all users
-        users = User.objects.all()
-        leaderboard_entries = []
-        
-        for user in users:
-            user_activities = Activity.objects.filter(user_email=user.email)
-            total_activities = user_activities.count()
-            total_calories = sum(activity.calories for activity in user_activities)
-            
-            leaderboard_entries.append({
-                'user_email': user.email,
-                'user_name': user.name,
-                'team': user.team,
-                'total_calories': total_calories,
-                'total_activities': total_activities,
-            })
-        
-        # Sort by total calories and assign ranks
-        leaderboard_entries.sort(key=lambda x: x['total_calories'], reverse=True)
-        for rank, entry in enumerate(leaderboard_entries, start=1):
-            entry['rank'] = rank
-            Leaderboard.objects.create(**entry)
-        
-        # Return refreshed leaderboard
-        refreshed_leaderboard = Leaderboard.objects.all().order_by('rank')
-        serializer = self.get_serializer(refreshed_leaderboard, many=True)
-        return Response(serializer.data)
+        """
+        Queue a rebuild of the all-time and current windowed boards from scratch.
+        Activity writes keep the boards current, so this is only needed to repair drift.
+        Returns 202 with the job to poll; a refresh requested while one is queued
+        or running joins it.
+        """
+        job, created = jobs.submit('leaderboard')
+        status_url = reverse('leaderboard-refresh-status', args=[str(job['_id'])], request=request)
+        data = FastReadSerializer(RefreshJobSerializer, job).data
+        data['coalesced'] = not created
+        data['status_url'] = status_url
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
+    
+    @action(detail=False, methods=['get'], url_path=r'refresh/(?P<job_id>[^/.]+)', url_name='refresh-status')
+    def refresh_status(self, request, job_id=None):
+        """Get the status and progress of a refresh job"""
+        try:
+            job = jobs.get(ObjectId(job_id))
+        except InvalidId:
+            job = None
+        if job is None or job['kind'] != 'leaderboard':
+            return Response({"error": "Refresh job not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(FastReadSerializer(RefreshJobSerializer, job).data)
 
 
-class WorkoutViewSet(viewsets.ModelViewSet):
+class WorkoutViewSet(ConditionalGetMixin, PaginatedModelViewSet):
     """
     API endpoint for workout suggestions.
     Provides CRUD operations for personalized workout recommendations.
     """
     queryset = Workout.objects.all()
     serializer_class = WorkoutSerializer
+    etag_collections = (Workout,)
+    etag_action_collections = {
+        'recommended': (Workout, ActivityProfile),
+        'recommended_for_team': (Workout, User, ActivityProfile),
+    }
+    team_recommendation_limit = 3
+    
+    @cached_response(Workout)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @cached_response(Workout)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     @action(detail=False, methods=['get'])
+    @cached_response(Workout)
     def by_type(self, request):
         """Get workouts filtered by activity type"""
         activity_type = request.query_params.get('type', None)
         if activity_type:
             workouts = Workout.objects.filter(activity_type=activity_type)
-            serializer = self.get_serializer(workouts, many=True)
-            return Response(serializer.data)
+            return self.paginated_response(workouts)
         return Response({"error": "Type parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=['get'])
+    @cached_response(Workout)
     def by_difficulty(self, request):
         """Get workouts filtered by difficulty level"""
         difficulty = request.query_params.get('difficulty', None)
         if difficulty:
             workouts = Workout.objects.filter(difficulty=difficulty)
-            serializer = self.get_serializer(workouts, many=True)
-            return Response(serializer.data)
+            return self.paginated_response(workouts)
         return Response({"error": "Difficulty parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=['get'])
@@ -186,19 +593,75 @@ class WorkoutViewSet(viewsets.ModelViewSet):
         """Get workout recommendations based on user's activity history"""
         email = request.query_params.get('email', None)
         if email:
-            # Get user's most frequent activity type
-            activities = Activity.objects.filter(user_email=email)
-            if activities.exists():
+            # Get user's most frequent activity type from their profile
+            profile = ActivityProfile.objects.mongo_find_one({'user_email': email}, {'type_counts': 1})
+            favorite_type = profiles.favorite_type(profile)
+            if favorite_type is not None:
                 # Simple recommendation: suggest workouts of the user's favorite activity type
-                activity_types = {}
-                for activity in activities:
-                    activity_types[activity.activity_type] = activity_types.get(activity.activity_type, 0) + 1
-                favorite_type = max(activity_types, key=activity_types.get)
                 workouts = Workout.objects.filter(activity_type=favorite_type)
             else:
                 # No activity history, return easy workouts
                 workouts = Workout.objects.filter(difficulty='Easy')
             
-            serializer = self.get_serializer(workouts, many=True)
-            return Response(serializer.data)
+            return self.paginated_response(workouts)
         return Response({"error": "Email parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['get'])
+    def recommended_for_team(self, request):
+        """
+        Get workout recommendations for every member of a team (for digests).
+        Members are paginated and each page costs three queries whatever its size;
+        workouts of the favorite type matching the member's recent intensity come first.
+        """
+        team = request.query_params.get('team', None)
+        if not team:
+            return Response({"error": "Team parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', self.team_recommendation_limit))
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return Response({"error": "limit must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        members = self.paginate_queryset(User.objects.filter(team=team).values('_id', 'email', 'name'))
+        member_profiles = {
+            profile['user_email']: profile
+            for profile in ActivityProfile.objects.mongo_find(
+                {'user_email': {'$in': [member['email'] for member in members]}}
+            )
+        }
+        favorite_types = {profiles.favorite_type(profile) for profile in member_profiles.values()} - {None}
+        candidates = list(Workout.objects.mongo_find(
+            {'$or': [{'activity_type': {'$in': sorted(favorite_types)}}, {'difficulty': 'Easy'}]},
+            sort=[('_id', 1)],
+        ))
+        serialized = FastReadSerializer(
+            WorkoutSerializer, candidates, many=True, fields=self.requested_fields()
+        ).data
+        by_id = {workout['_id']: item for workout, item in zip(candidates, serialized)}
+        
+        results = []
+        for member in members:
+            profile = member_profiles.get(member['email'])
+            intensity = profiles.intensity(profile)
+            results.append({
+                'user_email': member['email'],
+                'user_name': member['name'],
+                'favorite_type': profiles.favorite_type(profile),
+                'intensity': None if intensity is None else round(intensity, 2),
+                'preferred_difficulty': profiles.preferred_difficulty(intensity),
+                'workouts': [by_id[workout['_id']] for workout in profiles.recommend(profile, candidates, limit)],
+            })
+        return self.get_paginated_response(results)
+
+
+
+@api_view(['GET'])
+def cache_stats(request):
+    """Response cache hit/miss counters for this process"""
+    return Response(caching.stats())
+
+
+def request_metrics(request):
+    """Per-endpoint request metrics of this process, in Prometheus text format"""
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,266 @@
+"""
+Time-windowed leaderboards.
+
+Each window (calendar ``week`` starting Monday, calendar ``month`` and
+``rolling30``, the last 30 days including today) has one board per period,
+keyed by the period's first day (for ``rolling30``, the day the board is
+for). A period's board is built from the daily activity rollups the first
+time it is asked for, and activity writes then apply deltas to every built
+board whose days include the activity. Boards carry an ``expires_at`` after
+the period ends and are dropped by TTL indexes, so old windows roll off
+without a cleanup job.
+
+Days are UTC calendar days, as in ``rollups``. Rows are ordered and ranked
+like the all-time board; only users with activities in the period appear.
+Writes to the boards hold ``leaderboard.LOCK``, like the all-time board's.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+from . import caching, indexes, leaderboard, locks, rollups
+from .models import User, ActivityRollup, LeaderboardWindow, WindowedLeaderboard
+
+ROLLING_DAYS = 30
+
+# How long a period's board is kept once the period is over
+RETENTION = {
+    'week': timedelta(weeks=8),
+    'month': timedelta(days=366),
+    'rolling30': timedelta(days=2),
+}
+WINDOWS = tuple(RETENTION)
+
+
+def period_start(window, when):
+    """First day of the window's period containing ``when`` (naive UTC)"""
+    day = rollups.day_of(when)
+    if window == 'week':
+        return day - timedelta(days=day.weekday())
+    if window == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def period_days(window, start):
+    """First day counted by a period and the day after the last one"""
+    if window == 'week':
+        return start, start + timedelta(days=7)
+    if window == 'month':
+        return start, (start + timedelta(days=32)).replace(day=1)
+    return start - timedelta(days=ROLLING_DAYS - 1), start + timedelta(days=1)
+
+
+def expires_at(window, start):
+    return period_days(window, start)[1] + RETENTION[window]
+
+
+def _scope(window, start):
+    return {'window': window, 'period_start': start}
+
+
+def _ensure_indexes():
+    indexes.ensure(WindowedLeaderboard, 'octofit_windowed_email', 'octofit_windowed_expiry')
+    indexes.ensure(LeaderboardWindow, 'octofit_windows_period', 'octofit_windows_expiry')
+
+
+def rebuild_period(window, start):
+    """
+    Recompute one period's board from the rollups and mark it as built.
+
+    Rows are merged into place (readers never see a half-empty board) and
+    rows of users no longer in the period are removed afterwards.
+    """
+    first, end = period_days(window, start)
+    expires = expires_at(window, start)
+    with locks.hold(leaderboard.LOCK):
+        now = timezone.now()
+        # $merge needs a unique index on its 'on' fields; the TTLs drop old periods
+        _ensure_indexes()
+        # A batch that failed partway is completed in the rollups and marked on the rows
+        batch = rollups.catch_up()
+        ActivityRollup.objects.mongo_aggregate([
+            {'$match': {'day': {'$gte': first, '$lt': end}}},
+            {'$group': {
+                '_id': '$user_email',
+                'total_calories': {'$sum': '$calories'},
+                'total_activities': {'$sum': '$count'},
+            }},
+            {'$lookup': {
+                'from': User._meta.db_table,
+                'localField': '_id',
+                'foreignField': 'email',
+                'as': 'user',
+            }},
+            # Activities of unknown emails are dropped, as in leaderboard.rebuild
+            {'$unwind': '$user'},
+            {'$setWindowFields': {
+                'sortBy': {'total_calories': -1, '_id': 1},
+                'output': {'rank': {'$documentNumber': {}}},
+            }},
+            {'$setWindowFields': {
+                'sortBy': {'total_calories': -1},
+                'output': {'dense_rank': {'$denseRank': {}}},
+            }},
+            {'$project': {
+                '_id': 0,
+                'window': {'$literal': window},
+                'period_start': {'$literal': start},
+                'user_email': '$_id',
+                'user_name': '$user.name',
+                'team': '$user.team',
+                'total_calories': 1,
+                'total_activities': 1,
+                'rank': 1,
+                'dense_rank': 1,
+                'expires_at': {'$literal': expires},
+                'updated_at': {'$literal': now},
+                **{field: {'$literal': value} for field, value in rollups.applied(batch).items()},
+            }},
+            {'$merge': {
+                'into': WindowedLeaderboard._meta.db_table,
+                'on': ['window', 'period_start', 'user_email'],
+                'whenMatched': 'replace',
+                'whenNotMatched': 'insert',
+            }},
+        ], allowDiskUse=True)
+        WindowedLeaderboard.objects.mongo_delete_many({**_scope(window, start), 'updated_at': {'$lt': now}})
+        LeaderboardWindow.objects.mongo_update_one(
+            _scope(window, start),
+            {'$set': {'built_at': now, 'expires_at': expires}},
+            upsert=True,
+        )
+    caching.bump_version(WindowedLeaderboard)
+
+
+def ensure_built(window, when):
+    """
+    Build the current period's board if it has not been built yet.
+
+    Returns the period start as an aware datetime, for filtering the board.
+    """
+    start = period_start(window, when)
+    if LeaderboardWindow.objects.mongo_find_one(_scope(window, start)) is None:
+        rebuild_period(window, start)
+    return start.replace(tzinfo=dt_timezone.utc)
+
+
+def rebuild_current(when):
+    """Rebuild the current period of every window; returns the rows written"""
+    rows = 0
+    for window in WINDOWS:
+        start = period_start(window, when)
+        rebuild_period(window, start)
+        rows += WindowedLeaderboard.objects.mongo_count_documents(_scope(window, start))
+    return rows
+
+
+def _built_periods(days):
+    """(window, start) of every built board counting any of the given days"""
+    clauses = {}
+    for day in days:
+        for window in ('week', 'month'):
+            start = period_start(window, day)
+            clauses[(window, start)] = _scope(window, start)
+        clauses[('rolling30', day)] = {
+            'window': 'rolling30',
+            'period_start': {'$gte': day, '$lt': day + timedelta(days=ROLLING_DAYS)},
+        }
+    if not clauses:
+        return []
+    built = LeaderboardWindow.objects.mongo_find(
+        {'$or': list(clauses.values())}, {'window': 1, 'period_start': 1}
+    )
+    return [(doc['window'], rollups.day_of(doc['period_start'])) for doc in built]
+
+
+def _apply_delta(window, start, user_email, calories, activities, batch=None):
+    scope = _scope(window, start)
+    entry = WindowedLeaderboard.objects.mongo_find_one_and_update(
+        {**scope, 'user_email': user_email, **rollups.unapplied(batch)},
+        {
+            '$inc': {'total_calories': calories, 'total_activities': activities},
+            '$set': {'updated_at': timezone.now(), **rollups.applied(batch)},
+        },
+    )
+    if entry is None:
+        if batch is not None and WindowedLeaderboard.objects.mongo_count_documents(
+            {**scope, 'user_email': user_email}, limit=1
+        ):
+            # Updated by an earlier attempt at this batch
+            return
+        user = User.objects.filter(email=user_email).values('name', 'team').first()
+        if user is not None and activities > 0:
+            leaderboard.insert_ranked(WindowedLeaderboard, {
+                'user_email': user_email,
+                'user_name': user['name'],
+                'team': user['team'],
+                'total_calories': calories,
+                'total_activities': activities,
+                'expires_at': expires_at(window, start),
+                'updated_at': timezone.now(),
+                **rollups.applied(batch),
+            }, scope)
+        return
+    if entry['total_activities'] + activities <= 0:
+        WindowedLeaderboard.objects.mongo_delete_one({'_id': entry['_id']})
+        leaderboard.close_gap(WindowedLeaderboard, entry, scope)
+        return
+    leaderboard.rerank(WindowedLeaderboard, entry, entry['total_calories'] + calories, scope)
+
+
+def update_user(user):
+    """Copy a user's display fields onto their rows of every board"""
+    updated = WindowedLeaderboard.objects.mongo_update_many(
+        {'user_email': user.email},
+        {'$set': {'user_name': user.name, 'team': user.team, 'updated_at': timezone.now()}},
+    )
+    if updated.matched_count:
+        caching.bump_version(WindowedLeaderboard)
+
+
+def remove_user(user_email):
+    """Delete a user's rows from every board, closing the gaps they leave"""
+    removed = False
+    with locks.hold(leaderboard.LOCK):
+        while True:
+            entry = WindowedLeaderboard.objects.mongo_find_one_and_delete({'user_email': user_email})
+            if entry is None:
+                break
+            leaderboard.close_gap(WindowedLeaderboard, entry, _scope(entry['window'], entry['period_start']))
+            removed = True
+    if removed:
+        caching.bump_version(WindowedLeaderboard)
+
+
+def apply_deltas(deltas, batch=None):
+    """
+    Apply folded rollup deltas (see ``rollups.fold``) to every built board.
+
+    Boards that have not been built are skipped; they pick the activities up
+    from the rollups when they are built. Rows already updated by event
+    ``batch`` are left alone (see ``rollups.unapplied``).
+    """
+    by_day = {}
+    for (user_email, day, _), (count, _, calories) in deltas.items():
+        totals = by_day.setdefault((user_email, day), [0, 0])
+        totals[0] += calories
+        totals[1] += count
+
+    with locks.hold(leaderboard.LOCK):
+        periods = _built_periods({day for _, day in by_day})
+        if periods:
+            _ensure_indexes()
+        for window, start in periods:
+            first, end = period_days(window, start)
+            per_user = {}
+            for (user_email, day), (calories, count) in by_day.items():
+                if first <= day < end:
+                    totals = per_user.setdefault(user_email, [0, 0])
+                    totals[0] += calories
+                    totals[1] += count
+            for user_email, (calories, count) in per_user.items():
+                if calories or count:
+                    _apply_delta(window, start, user_email, calories, count, batch)
+    if periods:
+        caching.bump_version(WindowedLeaderboard)
@@ -6,28 +6,67 @@ function Leaderboard() {
   const [error, setError] = useState(null);
 
   useEffect(() => {
-    const apiUrl = `https://${process.env.REACT_APP_CODESPACE_NAME}-8000.app.github.dev/api/leaderboard/`;
-    console.log('Leaderboard API endpoint:', apiUrl);
+    const baseUrl = `https://${process.env.REACT_APP_CODESPACE_NAME}-8000.app.github.dev/api`;
+    const apiUrl = `${baseUrl}/leaderboard/`;
+    const liveUrl = `${baseUrl}/live/leaderboard/?limit=100`;
+    console.log('Leaderboard live endpoint:', liveUrl);
 
-    fetch(apiUrl)
-      .then(response => {
-        if (!response.ok) {
-          throw new Error('Network response was not ok');
-        }
-        return response.json();
-      })
-      .then(data => {
-        console.log('Leaderboard fetched data:', data);
-        // Handle both paginated (.results) and plain array responses
-        const leaderboardList = data.results || data;
-        setLeaderboard(leaderboardList);
-        setLoading(false);
-      })
-      .catch(error => {
-        console.error('Error fetching leaderboard:', error);
-        setError(error.message);
-        setLoading(false);
-      });
+    const fetchOnce = () => {
+      console.log('Leaderboard API endpoint:', apiUrl);
+      fetch(apiUrl)
+        .then(response => {
+          if (!response.ok) {
+            throw new Error('Network response was not ok');
+          }
+          return response.json();
+        })
+        .then(data => {
+          console.log('Leaderboard fetched data:', data);
+          // Handle both paginated (.results) and plain array responses
+          const leaderboardList = data.results || data;
+          setLeaderboard(leaderboardList);
+          setLoading(false);
+        })
+        .catch(error => {
+          console.error('Error fetching leaderboard:', error);
+          setError(error.message);
+          setLoading(false);
+        });
+    };
+
+    if (!window.EventSource) {
+      fetchOnce();
+      return undefined;
+    }
+
+    // Rows keyed by user_email; diffs only carry what changed
+    let rows = new Map();
+    let live = false;
+    const render = () => {
+      setLeaderboard([...rows.values()].sort((a, b) => a.rank - b.rank));
+      setLoading(false);
+    };
+    const source = new EventSource(liveUrl);
+    source.addEventListener('snapshot', event => {
+      live = true;
+      rows = new Map(JSON.parse(event.data).results.map(entry => [entry.user_email, entry]));
+      render();
+    });
+    source.addEventListener('diff', event => {
+      const { changed, removed } = JSON.parse(event.data);
+      removed.forEach(email => rows.delete(email));
+      changed.forEach(entry => rows.set(entry.user_email, { ...rows.get(entry.user_email), ...entry }));
+      render();
+    });
+    source.onerror = () => {
+      // The stream is only served under ASGI; load the board once instead
+      if (!live) {
+        console.warn('Live leaderboard unavailable, falling back to a single fetch');
+        source.close();
+        fetchOnce();
+      }
+    };
+    return () => source.close();
   }, []);
 
   if (loading) {
@@ -79,11 +118,12 @@ function Leaderboard() {
                   </tr>
                 ) : (
                   leaderboard.map((entry, index) => {
-                    const rankClass = index === 0 ? 'text-warning' : index === 1 ? 'text-secondary' : index === 2 ? 'text-bronze' : '';
+                    const rank = entry.rank || index + 1;
+                    const rankClass = rank === 1 ? 'text-warning' : rank === 2 ? 'text-secondary' : rank === 3 ? 'text-bronze' : '';
                     return (
-                      <tr key={entry._id}>
+                      <tr key={entry.user_email}>
                         <td>
-                          <strong className={rankClass}>#{index + 1}</strong>
+                          <strong className={rankClass}>#{rank}</strong>
                         </td>
                         <td><strong>{entry.user_name}</strong></td>
                         <td><span className="badge bg-info">{entry.team}</span></td>